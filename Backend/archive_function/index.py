@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import uuid
+import itertools
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from securestore import archive, aws, keys, layout, metrics, storage, uploads
+from securestore.responses import json_response
+
+# Archives are written under layout.ARCHIVE_PREFIX, outside the users'
+# folders, and expire through the bucket's lifecycle rule
+ARCHIVE_ID_PATTERN = re.compile(r"[0-9a-f]{32}\.(zip|tar)")
+DOWNLOAD_URL_TTL = int(os.environ.get("ARCHIVE_DOWNLOAD_URL_TTL", "3600"))
+
+MAX_ARCHIVE_FILES = int(os.environ.get("MAX_ARCHIVE_FILES", "10000"))
+# Archives of up to this many stored bytes are built during the request, larger
+# ones by an asynchronous invocation of this function while the client polls
+SYNC_ARCHIVE_BYTES = int(os.environ.get("SYNC_ARCHIVE_BYTES", str(64 * 1024 * 1024)))
+
+# Read-ahead: the next objects are requested in parallel while the current
+# one is written, each holding at most READ_AHEAD_BYTES until its turn
+READ_CHUNK_SIZE = int(os.environ.get("ARCHIVE_READ_CHUNK_SIZE", str(256 * 1024)))
+READ_AHEAD_OBJECTS = int(os.environ.get("ARCHIVE_READ_AHEAD_OBJECTS", "4"))
+READ_AHEAD_BYTES = int(os.environ.get("ARCHIVE_READ_AHEAD_BYTES", str(1024 * 1024)))
+
+
+def archive_key(username, archive_id):
+    return f"{layout.ARCHIVE_PREFIX}/{username}/{archive_id}"
+
+
+def list_objects(s3_client, bucket_name, folder_path, file_names=None, prefix=None):
+    # The objects to pack in file name order, and the requested names that do not exist
+    paginator = s3_client.get_paginator("list_objects_v2")
+    wanted = set(file_names) if file_names is not None else None
+    objects = []
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{folder_path}{prefix or ''}"):
+        for obj in page.get("Contents", []):
+            file_name = obj["Key"][len(folder_path):]
+            if wanted is None or file_name in wanted:
+                objects.append({"file_name": file_name, "Key": obj["Key"], "Size": obj["Size"],
+                                "modified": obj["LastModified"].timestamp()})
+    found = {obj["file_name"] for obj in objects}
+    missing = [name for name in file_names if name not in found] if file_names is not None else []
+    return objects, missing
+
+
+def open_object(s3_client, bucket_name, obj):
+    # Starts the GET and buffers the first READ_AHEAD_BYTES, the rest is read
+    # from the same body when the archive writer reaches this object
+    response = s3_client.get_object(Bucket=bucket_name, Key=obj["Key"])
+    chunks = response["Body"].iter_chunks(READ_CHUNK_SIZE)
+    prefetched = []
+    buffered = 0
+    for chunk in chunks:
+        prefetched.append(chunk)
+        buffered += len(chunk)
+        if buffered >= READ_AHEAD_BYTES:
+            break
+    return response, prefetched, chunks
+
+
+def read_entries(s3_client, bucket_name, objects, skipped):
+    # Archive entries in order, their content decrypted chunk by chunk as the
+    # writer pulls it; objects deleted since the listing are skipped
+    secret_key = keys.get_storage_key()
+    remaining = iter(objects)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=READ_AHEAD_OBJECTS) as executor:
+
+        def fill():
+            for obj in itertools.islice(remaining, READ_AHEAD_OBJECTS - len(pending)):
+                pending.append((obj, executor.submit(metrics.bind(open_object), s3_client, bucket_name, obj)))
+
+        fill()
+        while pending:
+            obj, future = pending.popleft()
+            fill()
+            try:
+                response, prefetched, chunks = future.result()
+            except s3_client.exceptions.NoSuchKey:
+                skipped.append(obj["file_name"])
+                continue
+            metadata = response.get("Metadata")
+            head = prefetched[0] if prefetched else b""
+            yield archive.Entry(
+                obj["file_name"],
+                obj["modified"],
+                storage.content_size(head, response["ContentLength"], metadata),
+                metrics.iterate(
+                    "decrypt", storage.read_stream(secret_key, itertools.chain(prefetched, chunks), metadata)
+                ),
+            )
+
+
+def build_archive(s3_client, bucket_name, username, archive_id, objects):
+    # Packs the objects into one archive written to S3 as it is produced:
+    # parts of uploads.PART_SIZE, a few in flight, whatever the archive size
+    archive_format = archive_id.rsplit(".", 1)[1]
+    skipped = []
+    pieces = archive.write_stream(archive_format, read_entries(s3_client, bucket_name, objects, skipped))
+    result = uploads.upload_stream(
+        s3_client,
+        bucket_name,
+        archive_key(username, archive_id),
+        pieces,
+        ContentType=archive.CONTENT_TYPES[archive_format],
+    )
+    return result["Size"], skipped
+
+
+def download_reference(s3_client, bucket_name, username, archive_id, size, download_name=None):
+    url = s3_client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": bucket_name,
+            "Key": archive_key(username, archive_id),
+            "ResponseContentDisposition": f'attachment; filename="{download_name or archive_id}"',
+        },
+        ExpiresIn=DOWNLOAD_URL_TTL,
+    )
+    return {"archiveId": archive_id, "status": "ready", "url": url, "expiresIn": DOWNLOAD_URL_TTL, "size": size}
+
+
+def archive_status(s3_client, bucket_name, username, archive_id):
+    # Ready once the archive object exists; a failed build leaves an .error object
+    key = archive_key(username, archive_id)
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+        return json_response(
+            200, download_reference(s3_client, bucket_name, username, archive_id, head["ContentLength"])
+        )
+    except s3_client.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+            raise
+    try:
+        error = s3_client.get_object(Bucket=bucket_name, Key=f"{key}.error")["Body"].read().decode("utf-8")
+        return json_response(500, {"archiveId": archive_id, "status": "failed", "message": error})
+    except s3_client.exceptions.NoSuchKey:
+        return json_response(202, {"archiveId": archive_id, "status": "pending"})
+
+
+def build_in_background(event, context):
+    # Asynchronous invocation queued by a request whose archive was too large
+    # to build within the API's time limit
+    s3_client = aws.client("s3")
+    bucket_name = os.environ.get("S3_BUCKET_NAME")
+    username, archive_id = event["username"], event["archive_id"]
+    try:
+        objects, _ = list_objects(
+            s3_client, bucket_name, f"{username}/", event.get("filenames"), event.get("prefix")
+        )
+        size, skipped = build_archive(s3_client, bucket_name, username, archive_id, objects)
+        print(json.dumps({"archive": archive_id, "files": len(objects) - len(skipped), "size": size}))
+    except Exception as e:
+        traceback.print_exc()
+        s3_client.put_object(
+            Bucket=bucket_name, Key=f"{archive_key(username, archive_id)}.error", Body=str(e).encode("utf-8")
+        )
+
+
+@metrics.instrument
+def handler(event, context):
+    if event.get("action") == "build_archive":
+        return build_in_background(event, context)
+
+    try:
+        body = json.loads(event["body"])
+
+        # Archives are only ever built from and for the authorized user's own folder
+        authorizer_context = event.get("requestContext", {}).get("authorizer", {}).get("lambda", {})
+        username = authorizer_context.get("userId") or body["username"]
+        if body.get("username", username) != username:
+            return json_response(403, {"message": "Archives are limited to your own files."})
+        if not layout.is_valid_username(username):
+            return json_response(400, {"message": "Invalid username."})
+
+        bucket_name = os.environ.get("S3_BUCKET_NAME")
+        if not bucket_name:
+            return json_response(500, {"message": "S3_BUCKET_NAME environment variable not set."})
+        s3_client = aws.client("s3")
+
+        if "archiveId" in body:
+            # Polling for an archive built in the background
+            if not ARCHIVE_ID_PATTERN.fullmatch(str(body["archiveId"])):
+                return json_response(400, {"message": "Invalid archiveId."})
+            return archive_status(s3_client, bucket_name, username, body["archiveId"])
+
+        file_names = body.get("filenames")
+        prefix = body.get("prefix")
+        archive_format = body.get("format", archive.FORMAT_ZIP)
+        if (file_names is None) == (prefix is None):
+            return json_response(400, {"message": "Specify either filenames or prefix."})
+        if file_names is not None and (
+            not isinstance(file_names, list) or not all(isinstance(name, str) and name for name in file_names)
+        ):
+            return json_response(400, {"message": "filenames must be a list of file names."})
+        if prefix is not None and not isinstance(prefix, str):
+            return json_response(400, {"message": "prefix must be a string."})
+        if archive_format not in archive.CONTENT_TYPES:
+            return json_response(400, {"message": f"format must be one of {', '.join(archive.CONTENT_TYPES)}."})
+
+        objects, missing = list_objects(s3_client, bucket_name, f"{username}/", file_names, prefix)
+        if missing:
+            return json_response(404, {"message": "Some files were not found.", "missing": missing})
+        if not objects:
+            return json_response(404, {"message": "No files match the request."})
+        if len(objects) > MAX_ARCHIVE_FILES:
+            return json_response(400, {"message": f"At most {MAX_ARCHIVE_FILES} files per archive."})
+
+        archive_id = f"{uuid.uuid4().hex}.{archive_format}"
+        if sum(obj["Size"] for obj in objects) > SYNC_ARCHIVE_BYTES:
+            aws.client("lambda").invoke(
+                FunctionName=context.function_name,
+                InvocationType="Event",
+                Payload=json.dumps(
+                    {"action": "build_archive", "username": username, "archive_id": archive_id,
+                     "filenames": file_names, "prefix": prefix}
+                ),
+            )
+            return json_response(202, {"archiveId": archive_id, "status": "pending", "files": len(objects)})
+
+        size, skipped = build_archive(s3_client, bucket_name, username, archive_id, objects)
+        download_name = f"{(prefix or '').rstrip('/').rsplit('/', 1)[-1] or 'files'}.{archive_format}"
+        reference = download_reference(s3_client, bucket_name, username, archive_id, size, download_name)
+        reference.update({"files": len(objects) - len(skipped), "skipped": skipped})
+        return json_response(200, reference)
+    except KeyError as e:
+        return json_response(400, {"message": f"Missing required field: {str(e)}"})
+    except Exception as e:
+        traceback.print_exc()
+        return json_response(500, {"message": f"Error building archive: {str(e)}"})
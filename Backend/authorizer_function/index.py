@@ -1,22 +1,138 @@
-import boto3
 import jwt
 from botocore.exceptions import ClientError
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from securestore import aws, metrics
+
+# Authorization cache tuning, all overridable from the function environment
+JWT_SECRET_TTL = int(os.getenv("JWT_SECRET_TTL", "300"))
+JWT_SECRET_REFRESH_MARGIN = int(os.getenv("JWT_SECRET_REFRESH_MARGIN", "60"))
+# A token failing signature checks forces a secret reload at most this often,
+# so forged tokens cannot turn into one Secrets Manager call each
+JWT_SECRET_MIN_RELOAD_INTERVAL = int(os.getenv("JWT_SECRET_MIN_RELOAD_INTERVAL", "30"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+AUTH_CACHE_MAX_TTL = int(os.getenv("AUTH_CACHE_MAX_TTL", "300"))
+
+
+class SecretCache:
+    # Holds the JWT secret for the lifetime of the container. Once the value is
+    # close to expiry it is refreshed on a background thread while the current
+    # value keeps being served, so only the very first call waits on the network.
+    def __init__(self, loader, ttl, refresh_margin):
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl)
+        self.value = None
+        self.expires_at = 0.0
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def get(self):
+        now = time.monotonic()
+        if self.value is None or now >= self.expires_at:
+            # Nothing usable cached, load synchronously
+            return self.refresh()
+        if now >= self.expires_at - self.refresh_margin:
+            self.refresh_in_background()
+        return self.value
+
+    def refresh(self):
+        with self.lock:
+            value = self.loader()
+            self.value = value
+            self.loaded_at = time.monotonic()
+            self.expires_at = self.loaded_at + self.ttl
+            return value
+
+    def reload(self, min_interval):
+        # Forced refresh, skipped (None) when the value was loaded less than
+        # min_interval seconds ago
+        if self.value is not None and time.monotonic() - self.loaded_at < min_interval:
+            return None
+        return self.refresh()
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the current value, the next call will retry
+                print("JWT secret refresh failed:", e)
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+class TokenCache:
+    # Bounded LRU of tokens that were already verified, keyed by a hash of the
+    # token so raw bearer tokens are never kept in memory.
+    def __init__(self, max_entries, max_ttl):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, auth_context = entry
+            if time.time() >= expires_at:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return auth_context
+
+    def put(self, token, token_exp, auth_context):
+        # Cache until the token expires or the configured cap, whichever is first
+        expires_at = time.time() + self.max_ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+        if expires_at <= time.time() or self.max_entries <= 0:
+            return
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (expires_at, auth_context)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
 
 
 def get_jwt_secret():
     secret_name = os.getenv("JWT_SECRET_NAME")
     if not secret_name:
         raise Exception("JWT_SECRET_NAME environment variable not set.")
-    region_name = "us-east-1"
-
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
-
     try:
-        response = client.get_secret_value(SecretId=secret_name)
-        secret = response["SecretString"]
-        return secret
+        return aws.get_secret_string(secret_name)
     except ClientError as e:
         error_code = e.response.get("Error", {}).get("Code")
         if error_code == "ResourceNotFoundException":
@@ -29,8 +145,7 @@ def fetch_user_details(username):
     table_name = os.getenv("USER_TABLE_NAME")
     if not table_name:
         raise Exception("USER_TABLE_NAME environment variable not set.")
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table(table_name)
+    table = aws.resource("dynamodb").Table(table_name)
 
     try:
         # Fetch the user details based on the provided username (email)
@@ -42,6 +157,29 @@ def fetch_user_details(username):
         raise Exception("Error fetching user details")
 
 
+secret_cache = SecretCache(get_jwt_secret, JWT_SECRET_TTL, JWT_SECRET_REFRESH_MARGIN)
+token_cache = TokenCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_MAX_TTL)
+
+
+def cache_stats():
+    # Hit/miss counters of the verified-token cache for this container
+    return token_cache.stats()
+
+
+def decode_token(token):
+    secret = secret_cache.get()
+    try:
+        return jwt.decode(token, secret, algorithms=["HS256"])
+    except jwt.InvalidSignatureError:
+        # The secret may have been rotated since it was cached, retry once with
+        # a fresh copy unless one was loaded recently or it did not change
+        fresh_secret = secret_cache.reload(JWT_SECRET_MIN_RELOAD_INTERVAL)
+        if fresh_secret is None or fresh_secret == secret:
+            raise
+        return jwt.decode(token, fresh_secret, algorithms=["HS256"])
+
+
+@metrics.instrument
 def handler(event, context):
     response = {"isAuthorized": False, "context": None}
 
@@ -51,10 +189,19 @@ def handler(event, context):
             token = authorization_header.split("Bearer ")[-1].strip()
 
             try:
-                jwt_secret = get_jwt_secret()
-
-                # Verify and decode the JWT token
-                payload = jwt.decode(token, jwt_secret, algorithms=["HS256"])
+                # Tokens verified earlier in this container are authorized without any network call
+                cached_context = token_cache.get(token)
+                if cached_context is not None:
+                    response["isAuthorized"] = True
+                    response["context"] = dict(cached_context)
+                    return response
+
+                # Verify and decode the JWT token. Short-lived tokens from /login and
+                # /refresh carry the same claims as the older 2-hour tokens, so both
+                # are accepted until the old ones expire; refresh tokens are opaque
+                # and never decode here
+                with metrics.stage("decode_token"):
+                    payload = decode_token(token)
                 username = payload["username"]
 
                 # Fetch user details from the database
@@ -65,10 +212,15 @@ def handler(event, context):
 
                     # Return true indicating the request is authorized
                     response["isAuthorized"] = True
+                    key_status = user_details.get("KeyStatus", "ready")
                     response["context"] = {
                         "userId": username,
+                        "keyStatus": key_status,
                         # Add additional context if needed
                     }
+                    if key_status != "pending":
+                        # Users still being provisioned are re-checked on their next request
+                        token_cache.put(token, payload.get("exp"), response["context"])
                 else:
                     # Handle case when the user does not exist or is not valid
                     response["message"] = "Invalid user"
@@ -0,0 +1,17 @@
+# Picks the bcrypt cost for a target verify latency on the current machine.
+# For the deployed memory size, invoke LoginFunction directly instead:
+#   aws lambda invoke --function-name LoginFunction \
+#       --payload '{"action": "calibrate_password_cost", "target_ms": 250}' out.json
+# Run from the repository root: python Backend/benchmarks/bench_bcrypt.py [target_ms]
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "common_layer", "python"))
+
+from securestore import passwords  # noqa: E402
+
+
+if __name__ == "__main__":
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    print(json.dumps(passwords.calibrate(target_ms), indent=2))
@@ -0,0 +1,88 @@
+# Latency and peak allocation of FileDownFunction's handler, run in process
+# against the local_runtime stand-ins. Objects are stored the way FileUpFunction
+# stores a client upload (base64 text kept as binary, in the container format).
+#
+# A whole-file download is one buffered Lambda response, so it is refused with
+# 413 once the file exceeds MAX_RESPONSE_BYTES (~6 MB); larger files can only be
+# read with ranged requests of up to MAX_RANGE_BYTES (the base64-encoded range
+# still fits), which fetch and decrypt the chunks covering the range whatever
+# the file size.
+# Run from the repository root: python Backend/benchmarks/bench_download.py [size_mb ...]
+import os
+import sys
+import io
+import json
+import time
+import base64
+import contextlib
+import statistics
+import tracemalloc
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(BACKEND_DIR, "common_layer", "python"))
+sys.path.insert(0, BACKEND_DIR)
+
+USERNAME = "bench@example.com"
+RANGE_SIZE = 1024 * 1024
+ITERATIONS = int(os.environ.get("BENCH_DOWNLOAD_ITERATIONS", "5"))
+
+
+def store_upload(s3_client, bucket_name, file_name, size):
+    # base64 text of `size` characters, as the browser sends it
+    from securestore import container, keys, storage
+
+    text = base64.b64encode(os.urandom(size * 3 // 4 + 3))[:size // 4 * 4]
+    payload, metadata = storage.prepare_payload(text, "text/plain")
+    body = b"".join(container.encrypt_stream(keys.get_storage_key(), payload))
+    s3_client.put_object(Bucket=bucket_name, Key=f"{USERNAME}/{file_name}", Body=body, Metadata=metadata)
+    return len(text)
+
+
+def measure(runtime, body):
+    event = {"body": json.dumps(body)}
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = runtime.invoke_by_name("FileDownFunction", event)
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            runtime.invoke_by_name("FileDownFunction", event)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result["statusCode"], statistics.median(samples), peak
+
+
+def main(sizes_mb):
+    from local_runtime.app import LocalRuntime
+    from securestore import aws
+
+    runtime = LocalRuntime(start_workers=False)
+    s3_client = aws.client("s3")
+    bucket_name = os.environ["S3_BUCKET_NAME"]
+    limit = runtime.handlers["FileDownFunction"].__wrapped__.__globals__["MAX_RESPONSE_BYTES"]
+    print(f"MAX_RESPONSE_BYTES: {limit / 1024 / 1024:.2f} MB, larger files are only served in ranges")
+    print(f"{'size':>9} {'request':>14} {'status':>7} {'p50 ms':>9} {'peak MB':>9}")
+    try:
+        for size_mb in sizes_mb:
+            file_name = f"bench-{size_mb}MB.txt"
+            size = store_upload(s3_client, bucket_name, file_name, int(size_mb * 1024 * 1024))
+            middle = size // 2
+            cases = (
+                ("full", {}),
+                ("range first", {"range": f"bytes=0-{RANGE_SIZE - 1}"}),
+                ("range middle", {"range": f"bytes={middle}-{middle + RANGE_SIZE - 1}"}),
+            )
+            for label, extra in cases:
+                status, p50, peak = measure(runtime, {"username": USERNAME, "file_name": file_name, **extra})
+                print(f"{size_mb:>7}MB {label:>14} {status:>7} {p50:>9.1f} {peak / 1024 / 1024:>9.1f}")
+            s3_client.delete_object(Bucket=bucket_name, Key=f"{USERNAME}/{file_name}")
+    finally:
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [1, 4, 16, 100])
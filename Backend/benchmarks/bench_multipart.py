@@ -0,0 +1,70 @@
+# Compares the streaming multipart parser against the old cgi.FieldStorage path.
+# Run from the repository root: python Backend/benchmarks/bench_multipart.py [size_mb ...]
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "common_layer", "python"))
+
+from securestore import multipart  # noqa: E402
+
+BOUNDARY = "----SecureStoreBenchBoundary"
+
+
+def build_body(size):
+    file_content = (b"0123456789abcdef" * (size // 16 + 1))[:size]
+    parts = []
+    for name, value in (("username", b"bench@example.com"), ("filename", b"bench.txt"), ("file", file_content)):
+        parts.append(
+            b"--" + BOUNDARY.encode() + b"\r\n"
+            + f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode()
+            + value + b"\r\n"
+        )
+    return b"".join(parts) + b"--" + BOUNDARY.encode() + b"--\r\n"
+
+
+def legacy_path(body, content_type):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import cgi
+
+    form = cgi.FieldStorage(
+        fp=BytesIO(body), environ={"REQUEST_METHOD": "POST", "CONTENT_TYPE": content_type}
+    )
+    file_content = form["file"].file.read()
+    return file_content.encode("utf-8")
+
+
+def streaming_path(body, content_type):
+    form = multipart.parse_form(body, content_type)
+    return sum(len(chunk) for chunk in form["file"].iter_chunks())
+
+
+def measure(function, body, content_type, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(body, content_type)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(body, content_type)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(sizes_mb):
+    content_type = f"multipart/form-data; boundary={BOUNDARY}"
+    print(f"{'size':>8} {'path':>10} {'MB/s':>10} {'peak MB':>10}")
+    for size_mb in sizes_mb:
+        body = build_body(int(size_mb * 1024 * 1024))
+        for label, function in (("cgi", legacy_path), ("streaming", streaming_path)):
+            seconds, peak = measure(function, body, content_type)
+            print(f"{size_mb:>6}MB {label:>10} {size_mb / seconds:>10.1f} {peak / 1024 / 1024:>10.2f}")
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [1, 5])
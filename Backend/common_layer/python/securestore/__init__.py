@@ -0,0 +1 @@
+# Shared runtime code for the SecureStore Lambda functions, shipped as CommonLayer
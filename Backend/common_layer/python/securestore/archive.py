@@ -0,0 +1,115 @@
+import io
+import os
+import time
+import tarfile
+import zipfile
+import tempfile
+import posixpath
+from collections import namedtuple
+
+# Archives written as a stream of byte pieces, one entry after the other, so
+# a whole folder can be packed without holding any file in memory. Entries
+# carry their content as an iterable of pieces; `size` is the exact content
+# length when known up front, or None.
+Entry = namedtuple("Entry", ["name", "modified", "size", "pieces"])
+
+FORMAT_ZIP = "zip"
+FORMAT_TAR = "tar"
+CONTENT_TYPES = {FORMAT_ZIP: "application/zip", FORMAT_TAR: "application/x-tar"}
+
+# Stored content is already encrypted or base64 text, a fast deflate level
+# still removes the base64 overhead; "0" stores entries as they are
+ZIP_COMPRESS_LEVEL = int(os.environ.get("ARCHIVE_ZIP_COMPRESS_LEVEL", "1"))
+# Tar headers need the size first: entries of unknown size are spooled,
+# in memory up to this size and to /tmp beyond it
+TAR_SPOOL_MEMORY = int(os.environ.get("ARCHIVE_TAR_SPOOL_MEMORY", str(8 * 1024 * 1024)))
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+SPOOL_READ_SIZE = 256 * 1024
+
+
+def safe_name(name):
+    # Entry names never climb out of the directory the archive is extracted to
+    parts = [part for part in posixpath.normpath("/" + name).split("/") if part not in ("", ".", "..")]
+    return "/".join(parts) or "file"
+
+
+class _Sink(io.RawIOBase):
+    # Unseekable output: zipfile then writes data descriptors instead of
+    # seeking back, and every write lands here until the caller takes it
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def zip_stream(entries):
+    sink = _Sink()
+    compression = zipfile.ZIP_DEFLATED if ZIP_COMPRESS_LEVEL > 0 else zipfile.ZIP_STORED
+    with zipfile.ZipFile(sink, "w", compression=compression, compresslevel=ZIP_COMPRESS_LEVEL or None) as output:
+        for entry in entries:
+            info = zipfile.ZipInfo(safe_name(entry.name), date_time=zip_timestamp(entry.modified))
+            info.compress_type = compression
+            info.external_attr = 0o644 << 16
+            with output.open(info, "w", force_zip64=True) as member:
+                for piece in entry.pieces:
+                    member.write(piece)
+                    if sink.buffer:
+                        yield sink.take()
+            yield sink.take()
+    yield sink.take()
+
+
+def zip_timestamp(modified):
+    # ZIP dates start in 1980
+    timestamp = time.gmtime(max(modified or 0, 315532800))
+    return timestamp[:6]
+
+
+def tar_stream(entries):
+    # POSIX (pax) tar: header block, content, padding to the block size; the
+    # archive ends with two zero blocks
+    for entry in entries:
+        size, pieces, spool = entry.size, entry.pieces, None
+        if size is None:
+            spool = tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_MEMORY)
+            for piece in pieces:
+                spool.write(piece)
+            size = spool.tell()
+            spool.seek(0)
+            pieces = iter(lambda: spool.read(SPOOL_READ_SIZE), b"")
+        try:
+            info = tarfile.TarInfo(safe_name(entry.name))
+            info.size = size
+            info.mtime = int(entry.modified or 0)
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            written = 0
+            for piece in pieces:
+                written += len(piece)
+                if written > size:
+                    raise ValueError(f"{entry.name} is longer than its {size} byte header")
+                yield bytes(piece)
+            if written != size:
+                raise ValueError(f"{entry.name} ended after {written} of {size} bytes")
+            if size % TAR_BLOCK_SIZE:
+                yield b"\0" * (TAR_BLOCK_SIZE - size % TAR_BLOCK_SIZE)
+        finally:
+            if spool is not None:
+                spool.close()
+    yield b"\0" * (2 * TAR_BLOCK_SIZE)
+
+
+def write_stream(archive_format, entries):
+    if archive_format == FORMAT_TAR:
+        return tar_stream(entries)
+    return zip_stream(entries)
@@ -0,0 +1,128 @@
+import os
+import threading
+from securestore import metrics
+
+try:
+    from snapshot_restore_py import register_after_restore
+except ImportError:
+    register_after_restore = None
+
+# Single region for every client instead of per-function hardcoded copies
+REGION = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION") or "us-east-1"
+
+# boto3 is most of a handler's import time, so it is imported when the first
+# client is built rather than when a handler module loads. Functions that pay
+# for init ahead of traffic (SnapStart, provisioned concurrency) list the
+# services to build during init instead, e.g. AWS_PRELOAD_CLIENTS=s3,dynamodb.
+# Building a client makes no network calls, so this is safe to snapshot.
+PRELOAD_CLIENTS = [name for name in os.environ.get("AWS_PRELOAD_CLIENTS", "").split(",") if name]
+
+_config = None
+
+
+def client_config():
+    # Tuned client configuration: keep connections alive between invocations,
+    # allow enough pooled connections for the threaded fan-out paths and fail
+    # fast instead of holding a Lambda open on a stuck socket.
+    global _config
+    if _config is None:
+        from botocore.config import Config
+
+        _config = Config(
+            region_name=REGION,
+            tcp_keepalive=True,
+            max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "50")),
+            connect_timeout=float(os.environ.get("AWS_CONNECT_TIMEOUT", "2")),
+            read_timeout=float(os.environ.get("AWS_READ_TIMEOUT", "10")),
+            retries={
+                "mode": "standard",
+                "max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", "3")),
+            },
+        )
+    return _config
+
+
+_session = None
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        import boto3
+
+        _session = boto3.session.Session(region_name=REGION)
+    return _session
+
+
+def client(service_name):
+    # Lazily build one client per service and reuse it for the life of the container
+    existing = _clients.get(service_name)
+    if existing is not None:
+        return existing
+    with _lock:
+        if service_name not in _clients:
+            # Every API call is timed for the invocation being sampled, if any
+            _clients[service_name] = metrics.attach(get_session().client(service_name, config=client_config()))
+        return _clients[service_name]
+
+
+def resource(service_name):
+    # Same as client() for the boto3 resource API (used for DynamoDB tables)
+    existing = _resources.get(service_name)
+    if existing is not None:
+        return existing
+    with _lock:
+        if service_name not in _resources:
+            created = get_session().resource(service_name, config=client_config())
+            metrics.attach(created.meta.client)
+            _resources[service_name] = created
+        return _resources[service_name]
+
+
+def set_client(service_name, stand_in):
+    # Swap in a local stand-in (tests, local runs) for a service client
+    with _lock:
+        _clients[service_name] = stand_in
+
+
+def set_resource(service_name, stand_in):
+    with _lock:
+        _resources[service_name] = stand_in
+
+
+def reset():
+    # Drop every cached client and resource, the next call builds fresh ones
+    global _session
+    with _lock:
+        _clients.clear()
+        _resources.clear()
+        _session = None
+
+
+def preload(service_names=PRELOAD_CLIENTS):
+    # Build clients during init; nothing is sent until the first request
+    for service_name in service_names:
+        if service_name == "dynamodb":
+            resource(service_name)
+        else:
+            client(service_name)
+
+
+def after_restore():
+    # A restored snapshot must not reuse the credentials and connection pools
+    # of the instance it was taken from; modules stay imported, clients are rebuilt
+    reset()
+    preload()
+
+
+def get_secret_string(secret_name):
+    response = client("secretsmanager").get_secret_value(SecretId=secret_name)
+    return response["SecretString"]
+
+
+preload()
+if register_after_restore is not None:
+    register_after_restore(after_restore)
@@ -0,0 +1,175 @@
+import struct
+from collections import namedtuple
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+# Chunked authenticated encryption container
+#
+#   header: magic (4) | version (1) | algorithm (1) | chunk size (4) | nonce prefix (8)
+#   chunks: ciphertext (chunk size, last one shorter) | GCM tag (16)
+#
+# Chunk i is sealed with nonce = prefix | i and associated data
+# header | i | final flag, so chunks cannot be reordered, swapped between
+# files or dropped from the end without the tag check failing.
+MAGIC = b"SSTC"
+VERSION = 1
+ALGORITHM_AES_256_GCM = 1
+HEADER_FORMAT = "!4sBBI8s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 8
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+Header = namedtuple("Header", ["version", "algorithm", "chunk_size", "nonce_prefix", "raw"])
+
+
+class ContainerError(Exception):
+    pass
+
+
+def is_container(data):
+    return bytes(data[: len(MAGIC)]) == MAGIC
+
+
+def make_header(chunk_size=DEFAULT_CHUNK_SIZE, nonce_prefix=None):
+    nonce_prefix = nonce_prefix or get_random_bytes(NONCE_PREFIX_SIZE)
+    raw = struct.pack(HEADER_FORMAT, MAGIC, VERSION, ALGORITHM_AES_256_GCM, chunk_size, nonce_prefix)
+    return Header(VERSION, ALGORITHM_AES_256_GCM, chunk_size, nonce_prefix, raw)
+
+
+def parse_header(data):
+    if len(data) < HEADER_SIZE or not is_container(data):
+        raise ContainerError("Not an encrypted container.")
+    raw = bytes(data[:HEADER_SIZE])
+    _, version, algorithm, chunk_size, nonce_prefix = struct.unpack(HEADER_FORMAT, raw)
+    if version != VERSION or algorithm != ALGORITHM_AES_256_GCM:
+        raise ContainerError(f"Unsupported container version {version} / algorithm {algorithm}.")
+    return Header(version, algorithm, chunk_size, nonce_prefix, raw)
+
+
+def record_size(header):
+    return header.chunk_size + TAG_SIZE
+
+
+def plaintext_size(total_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    body = total_size - HEADER_SIZE
+    chunks = max(1, -(-body // (chunk_size + TAG_SIZE)))
+    return body - chunks * TAG_SIZE
+
+
+def chunk_cipher(key, header, index, final):
+    cipher = AES.new(key, AES.MODE_GCM, nonce=header.nonce_prefix + struct.pack("!I", index))
+    cipher.update(header.raw + struct.pack("!QB", index, 1 if final else 0))
+    return cipher
+
+
+def encrypt_chunk(key, header, index, plaintext, final):
+    ciphertext, tag = chunk_cipher(key, header, index, final).encrypt_and_digest(plaintext)
+    return ciphertext + tag
+
+
+def decrypt_chunk(key, header, index, record, final):
+    if len(record) < TAG_SIZE:
+        raise ContainerError("Truncated chunk.")
+    try:
+        return chunk_cipher(key, header, index, final).decrypt_and_verify(record[:-TAG_SIZE], record[-TAG_SIZE:])
+    except ValueError:
+        raise ContainerError(f"Chunk {index} failed authentication.")
+
+
+def rechunk(pieces, size):
+    # Regroup an iterable of byte-likes into pieces of exactly `size` bytes
+    # (the last one shorter), copying only when a piece straddles a boundary
+    buffer = bytearray()
+    for piece in pieces:
+        piece = memoryview(piece)
+        if buffer:
+            take = min(size - len(buffer), len(piece))
+            buffer += piece[:take]
+            piece = piece[take:]
+            if len(buffer) < size:
+                continue
+            yield bytes(buffer)
+            buffer = bytearray()
+        while len(piece) >= size:
+            yield piece[:size]
+            piece = piece[size:]
+        buffer += piece
+    if buffer:
+        yield bytes(buffer)
+
+
+def lookahead(iterable):
+    # Yields (item, is_last) pairs
+    iterator = iter(iterable)
+    try:
+        current = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield current, False
+        current = item
+    yield current, True
+
+
+def encrypt_stream(key, pieces, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Generator over the container bytes for a plaintext stream: the header
+    # first, then one sealed record per chunk
+    header = make_header(chunk_size)
+    yield header.raw
+    index = 0
+    for chunk, final in lookahead(rechunk(pieces, chunk_size)):
+        yield encrypt_chunk(key, header, index, chunk, final)
+        index += 1
+    if index == 0:
+        yield encrypt_chunk(key, header, 0, b"", True)
+
+
+def decrypt_stream(key, pieces):
+    # Generator over the plaintext of a container delivered as arbitrary
+    # byte pieces (e.g. an S3 StreamingBody read in chunks)
+    pieces = iter(pieces)
+    head = bytearray()
+    for piece in pieces:
+        head += piece
+        if len(head) >= HEADER_SIZE:
+            break
+    header = parse_header(head)
+
+    def body():
+        if len(head) > HEADER_SIZE:
+            yield head[HEADER_SIZE:]
+        yield from pieces
+
+    index = -1
+    for index, (record, final) in enumerate(lookahead(rechunk(body(), record_size(header)))):
+        yield decrypt_chunk(key, header, index, record, final)
+    if index < 0:
+        raise ContainerError("Container has no chunks.")
+
+
+def chunk_span(header, total_size, start, end):
+    # Maps the plaintext byte range [start, end] (inclusive) of a container of
+    # total_size stored bytes to the chunks that hold it and to the stored
+    # byte range (inclusive) covering exactly those chunks
+    size = record_size(header)
+    chunk_count = max(1, -(-(total_size - HEADER_SIZE) // size))
+    first = start // header.chunk_size
+    last = end // header.chunk_size
+    stored_start = HEADER_SIZE + first * size
+    stored_end = min(HEADER_SIZE + (last + 1) * size, total_size) - 1
+    return first, last, chunk_count, stored_start, stored_end
+
+
+def decrypt_range(key, header, total_size, start, end, pieces):
+    # Decrypts only the chunks fetched for [start, end] and trims the first and
+    # last of them to the requested bytes
+    first, last, chunk_count, _, _ = chunk_span(header, total_size, start, end)
+    index = first
+    for record in rechunk(pieces, record_size(header)):
+        plaintext = decrypt_chunk(key, header, index, record, index == chunk_count - 1)
+        chunk_start = index * header.chunk_size
+        yield plaintext[max(start - chunk_start, 0) : end - chunk_start + 1]
+        index += 1
+    if index != last + 1:
+        raise ContainerError("Ranged read ended before the requested chunks.")
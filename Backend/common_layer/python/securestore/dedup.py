@@ -0,0 +1,362 @@
+import os
+import hmac
+import json
+import uuid
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from securestore import aws, container, layout
+
+# Deduplicating storage: a file is stored as a small encrypted chunk manifest
+# under {username}/{file_name}, pointing at content-defined chunks stored once
+# per user under _chunks/{username}/{chunk_id}. Chunk ids are keyed hashes
+# scoped to the user, so equal content in different accounts never shares (or
+# reveals) a chunk.
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "false").lower() == "true"
+CHUNK_REF_TABLE_NAME = os.environ.get("CHUNK_REF_TABLE_NAME")
+
+# Object metadata marking a chunk manifest
+LAYOUT_KEY = "payload-layout"
+LAYOUT_DEDUP = "dedup"
+
+# Content-defined chunking bounds (bytes)
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+# Every byte maps to one bit through a fixed table (half the byte values to
+# each), and a chunk ends after a run of CUT_RUN zero bits: ~64 KiB past the
+# minimum on random data. The run only depends on the last CUT_RUN bytes and
+# bytes.translate/bytes.find scan it at C speed, no per-byte Python loop.
+CUT_RUN = 15
+_CUT_PATTERN = b"\0" * CUT_RUN
+_BIT_TABLE = bytearray(b"\1" * 256)
+for _value in sorted(range(256), key=lambda i: hashlib.sha256(b"securestore-cdc-%d" % i).digest())[:128]:
+    _BIT_TABLE[_value] = 0
+_BIT_TABLE = bytes(_BIT_TABLE)
+
+CHUNK_CONCURRENCY = int(os.environ.get("DEDUP_CHUNK_CONCURRENCY", "8"))
+
+# Chunk reference rows (username, chunk_id) carry a refs counter, the
+# generation naming the chunk's current object and its state: pending until
+# the object is written, stored, then deleting once the last reference is
+# gone. Rows from before generations existed point at the unsuffixed key.
+STATE_PENDING = "pending"
+STATE_STORED = "stored"
+STATE_DELETING = "deleting"
+LEGACY_GENERATION = "-"
+MAX_REF_ATTEMPTS = 5
+
+# Every stored manifest also owns one row in the same table, under chunk_id
+# "file#{manifest_id}". A release first deletes that row conditionally and
+# only the request whose delete succeeds gives the chunk references back, so
+# concurrent or retried deletes of one file release it exactly once. Manifests
+# from before manifest ids claim a "released#{digest}" marker row instead.
+FILE_REF_PREFIX = "file#"
+RELEASED_PREFIX = "released#"
+
+
+def chunk_boundaries(data):
+    # The first MIN_CHUNK_SIZE bytes of each chunk are skipped, then the chunk
+    # ends where a cut run completes, or at MAX_CHUNK_SIZE. Boundaries depend
+    # only on nearby content, so an edit only changes nearby chunks.
+    boundaries = []
+    start = 0
+    length = len(data)
+    while start < length:
+        end = min(start + MAX_CHUNK_SIZE, length)
+        cut = end
+        if start + MIN_CHUNK_SIZE < end:
+            # The run has to end past the minimum size, it may start just before it
+            window_start = max(start, start + MIN_CHUNK_SIZE - CUT_RUN + 1)
+            found = bytes(data[window_start:end]).translate(_BIT_TABLE).find(_CUT_PATTERN)
+            if found >= 0:
+                cut = window_start + found + CUT_RUN
+        boundaries.append(cut)
+        start = cut
+    return boundaries
+
+
+def iter_chunks(data):
+    data = memoryview(data)
+    start = 0
+    for end in chunk_boundaries(data):
+        yield data[start:end]
+        start = end
+
+
+def user_chunk_key(master_key, username):
+    return hmac.new(master_key, b"dedup-chunk-id:" + username.encode("utf-8"), hashlib.sha256).digest()
+
+
+def chunk_id(user_key, chunk):
+    return hmac.new(user_key, chunk, hashlib.sha256).hexdigest()
+
+
+def chunk_key(username, identifier, generation=None):
+    if generation in (None, LEGACY_GENERATION):
+        return f"{layout.CHUNK_PREFIX}/{username}/{identifier}"
+    return f"{layout.CHUNK_PREFIX}/{username}/{identifier}.{generation}"
+
+
+def entry_key(username, entry):
+    # Manifest entries are [chunk_id, length, generation], version 1 ones have no generation
+    return chunk_key(username, entry[0], entry[2] if len(entry) > 2 else None)
+
+
+def get_ref_table():
+    if not CHUNK_REF_TABLE_NAME:
+        raise Exception("CHUNK_REF_TABLE_NAME environment variable not set.")
+    return aws.resource("dynamodb").Table(CHUNK_REF_TABLE_NAME)
+
+
+def add_refs(username, identifier, count):
+    # Takes count references on a chunk and returns (generation, needs_write).
+    # References are only added to a row that is not being deleted; a deleting
+    # row is taken over with a new generation, whose object has its own key,
+    # so the delete in flight can never remove what this upload writes.
+    table = get_ref_table()
+    key = {"username": username, "chunk_id": identifier}
+    conditional_check_failed = table.meta.client.exceptions.ConditionalCheckFailedException
+    for _ in range(MAX_REF_ATTEMPTS):
+        generation = uuid.uuid4().hex
+        try:
+            item = table.update_item(
+                Key=key,
+                UpdateExpression="ADD refs :count SET generation = if_not_exists(generation, :generation), "
+                "chunk_state = if_not_exists(chunk_state, :pending)",
+                ConditionExpression="attribute_not_exists(refs) OR "
+                "(attribute_exists(generation) AND chunk_state <> :deleting)",
+                ExpressionAttributeValues={
+                    ":count": count,
+                    ":generation": generation,
+                    ":pending": STATE_PENDING,
+                    ":deleting": STATE_DELETING,
+                },
+                ReturnValues="ALL_NEW",
+            )["Attributes"]
+            # A pending chunk may belong to an upload that is about to fail,
+            # writing it again is harmless and means it exists either way
+            return item["generation"], item["chunk_state"] != STATE_STORED
+        except conditional_check_failed:
+            pass
+
+        item = table.get_item(Key=key, ConsistentRead=True).get("Item")
+        try:
+            if item is None:
+                continue
+            if "generation" not in item:
+                # A row written before generations, its chunk is stored under the plain key
+                table.update_item(
+                    Key=key,
+                    UpdateExpression="SET generation = :legacy, chunk_state = :stored",
+                    ConditionExpression="attribute_not_exists(generation)",
+                    ExpressionAttributeValues={":legacy": LEGACY_GENERATION, ":stored": STATE_STORED},
+                )
+            elif item["chunk_state"] == STATE_DELETING:
+                table.update_item(
+                    Key=key,
+                    UpdateExpression="SET refs = :count, generation = :generation, chunk_state = :pending",
+                    ConditionExpression="chunk_state = :deleting AND generation = :previous",
+                    ExpressionAttributeValues={
+                        ":count": count,
+                        ":generation": generation,
+                        ":pending": STATE_PENDING,
+                        ":deleting": STATE_DELETING,
+                        ":previous": item["generation"],
+                    },
+                )
+                return generation, True
+        except conditional_check_failed:
+            # Changed again since it was read, start over
+            pass
+    raise Exception(f"Could not reference chunk {identifier}, too much contention.")
+
+
+def mark_stored(username, identifier, generation):
+    table = get_ref_table()
+    try:
+        table.update_item(
+            Key={"username": username, "chunk_id": identifier},
+            UpdateExpression="SET chunk_state = :stored",
+            ConditionExpression="generation = :generation AND chunk_state = :pending",
+            ExpressionAttributeValues={":stored": STATE_STORED, ":pending": STATE_PENDING, ":generation": generation},
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        # Already marked by a concurrent writer, or released since
+        pass
+
+
+def release_refs(bucket_name, username, counts):
+    # Drops references per chunk id; a chunk nothing points to any more is
+    # tombstoned first, and only once that conditional write succeeded are
+    # its object and then its row deleted
+    table = get_ref_table()
+    conditional_check_failed = table.meta.client.exceptions.ConditionalCheckFailedException
+    s3_client = aws.client("s3")
+    collected = 0
+    for identifier, count in counts.items():
+        key = {"username": username, "chunk_id": identifier}
+        try:
+            item = table.update_item(
+                Key=key,
+                UpdateExpression="ADD refs :count",
+                ConditionExpression="attribute_exists(refs)",
+                ExpressionAttributeValues={":count": -count},
+                ReturnValues="ALL_NEW",
+            )["Attributes"]
+        except conditional_check_failed:
+            continue
+        if int(item["refs"]) > 0:
+            continue
+        generation = item.get("generation", LEGACY_GENERATION)
+        try:
+            table.update_item(
+                Key=key,
+                UpdateExpression="SET chunk_state = :deleting, generation = :generation",
+                ConditionExpression="refs <= :zero AND (attribute_not_exists(generation) OR generation = :generation)",
+                ExpressionAttributeValues={":deleting": STATE_DELETING, ":generation": generation, ":zero": 0},
+            )
+        except conditional_check_failed:
+            # Re-referenced in the meantime, the chunk stays
+            continue
+        s3_client.delete_object(Bucket=bucket_name, Key=chunk_key(username, identifier, generation))
+        try:
+            table.delete_item(
+                Key=key,
+                ConditionExpression="chunk_state = :deleting AND generation = :generation",
+                ExpressionAttributeValues={":deleting": STATE_DELETING, ":generation": generation},
+            )
+        except conditional_check_failed:
+            # Taken over by an upload, which wrote a new generation under its own key
+            pass
+        collected += 1
+    return collected
+
+
+def claim_release(username, chunk_manifest, object_key):
+    # True for exactly one caller per stored manifest
+    table = get_ref_table()
+    try:
+        if "manifest_id" in chunk_manifest:
+            table.delete_item(
+                Key={"username": username, "chunk_id": FILE_REF_PREFIX + chunk_manifest["manifest_id"]},
+                ConditionExpression="attribute_exists(chunk_id)",
+                ReturnValues="ALL_OLD",
+            )
+        else:
+            # Equal content stored under two names has equal manifests, the
+            # object key tells the two files apart
+            digest = hashlib.sha256(
+                object_key.encode("utf-8") + b"\0" + json.dumps(chunk_manifest, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+            table.put_item(
+                Item={"username": username, "chunk_id": RELEASED_PREFIX + digest},
+                ConditionExpression="attribute_not_exists(chunk_id)",
+            )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    return True
+
+
+def release_chunks(bucket_name, username, chunk_manifest, object_key):
+    # Drops the references of the file whose manifest was stored at
+    # object_key, unless another request already did
+    if not claim_release(username, chunk_manifest, object_key):
+        return 0
+    counts = {}
+    for entry in chunk_manifest["chunks"]:
+        counts[entry[0]] = counts.get(entry[0], 0) + 1
+    return release_refs(bucket_name, username, counts)
+
+
+def store_file(master_key, s3_client, bucket_name, username, payload):
+    # Splits the payload into chunks, stores only the chunks this user does not
+    # already have, and returns the chunk manifest plus how much was new
+    user_key = user_chunk_key(master_key, username)
+    identifiers = []
+    counts = {}
+    first_seen = {}
+    for chunk in iter_chunks(payload):
+        identifier = chunk_id(user_key, chunk)
+        identifiers.append((identifier, len(chunk)))
+        counts[identifier] = counts.get(identifier, 0) + 1
+        first_seen.setdefault(identifier, chunk)
+
+    manifest_id = uuid.uuid4().hex
+    file_ref = {"username": username, "chunk_id": FILE_REF_PREFIX + manifest_id}
+    get_ref_table().put_item(Item=file_ref)
+    generations = {}
+
+    def store(identifier):
+        generation, needs_write = add_refs(username, identifier, counts[identifier])
+        generations[identifier] = generation
+        if not needs_write:
+            return 0
+        body = b"".join(container.encrypt_stream(master_key, [first_seen[identifier]]))
+        s3_client.put_object(Bucket=bucket_name, Key=chunk_key(username, identifier, generation), Body=body)
+        mark_stored(username, identifier, generation)
+        return len(first_seen[identifier])
+
+    try:
+        with ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY) as executor:
+            new_bytes = sum(executor.map(store, list(counts)))
+    except Exception:
+        # The executor has finished every chunk by now; give back all the
+        # references this upload took, not only the failed chunk's. The
+        # manifest was never published, nothing else can release it.
+        get_ref_table().delete_item(Key=file_ref)
+        release_refs(bucket_name, username, {identifier: counts[identifier] for identifier in generations})
+        raise
+
+    chunks = [[identifier, length, generations[identifier]] for identifier, length in identifiers]
+    chunk_manifest = {
+        "version": 3,
+        "manifest_id": manifest_id,
+        "username": username,
+        "size": len(payload),
+        "chunks": chunks,
+    }
+    return chunk_manifest, new_bytes
+
+
+def encode_manifest(master_key, chunk_manifest):
+    return b"".join(container.encrypt_stream(master_key, [json.dumps(chunk_manifest).encode("utf-8")]))
+
+
+def decode_manifest(master_key, pieces):
+    return json.loads(b"".join(container.decrypt_stream(master_key, pieces)))
+
+
+def read_file(master_key, chunk_manifest, bucket_name=None):
+    # Yields the file's payload chunk by chunk, fetching a bounded number of
+    # chunks ahead in parallel
+    bucket_name = bucket_name or os.environ.get("S3_BUCKET_NAME")
+    s3_client = aws.client("s3")
+    username = chunk_manifest["username"]
+
+    def fetch(entry):
+        response = s3_client.get_object(Bucket=bucket_name, Key=entry_key(username, entry))
+        return b"".join(container.decrypt_stream(master_key, [response["Body"].read()]))
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY) as executor:
+        for entry in chunk_manifest["chunks"]:
+            pending.append(executor.submit(fetch, entry))
+            if len(pending) >= CHUNK_CONCURRENCY:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_manifest(master_key, s3_client, bucket_name, key):
+    # The chunk manifest stored at key, or None when the object is missing or
+    # is not a deduplicated file
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except s3_client.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    if head.get("Metadata", {}).get(LAYOUT_KEY) != LAYOUT_DEDUP:
+        return None
+    response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    return decode_manifest(master_key, [response["Body"].read()])
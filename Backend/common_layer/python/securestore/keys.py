@@ -0,0 +1,139 @@
+import os
+import json
+import base64
+import re
+import hashlib
+from securestore import aws, metrics
+from securestore.cache import TTLCache
+
+# Key service used in-process by GetKeyFunction (and anything else that needs
+# a user's key material) instead of a Lambda-to-Lambda call per request
+USER_TABLE_NAME = os.environ.get("USER_TABLE_NAME")
+MASTER_SECRET_NAME = os.environ.get("S3_MASTER_KEY_SECRET_NAME", "s3-master-key")
+GENKEY_FUNCTION_NAME = os.environ.get("LAMBDA_FUNCTION_NAME")
+
+# Users whose DEK is wrapped under a shared CMK with their username as encryption context
+KEY_SCHEME_SHARED = "shared-cmk"
+
+# Provisioning state of a user's key material, set by RegisterFunction and GenKeyFunction
+KEY_STATUS_PENDING = "pending"
+KEY_STATUS_READY = "ready"
+
+MASTER_SECRET_TTL = int(os.environ.get("MASTER_SECRET_TTL", "300"))
+USER_KEY_TTL = int(os.environ.get("USER_KEY_TTL", "300"))
+USER_KEY_CACHE_SIZE = int(os.environ.get("USER_KEY_CACHE_SIZE", "10000"))
+
+master_secret_cache = TTLCache(1, MASTER_SECRET_TTL)
+user_key_cache = TTLCache(USER_KEY_CACHE_SIZE, USER_KEY_TTL)
+
+
+class KeysPending(Exception):
+    pass
+
+
+def get_master_secret():
+    return master_secret_cache.get_or_load(
+        MASTER_SECRET_NAME, lambda: aws.get_secret_string(MASTER_SECRET_NAME)
+    )
+
+
+def get_storage_key():
+    # AES-256 key the file handlers encrypt objects with: the first 32 bytes of
+    # the master secret, fetched on first use and re-read every MASTER_SECRET_TTL
+    return get_master_secret().encode("utf-8")[:32]
+
+
+def refresh_master_secret():
+    # Re-read the secret now, e.g. after a decryption failure that may mean it
+    # was rotated; returns whether the value changed
+    previous = master_secret_cache.get(MASTER_SECRET_NAME)
+    master_secret_cache.invalidate(MASTER_SECRET_NAME)
+    return get_master_secret() != previous
+
+
+def derive_cmk_alias(username):
+    # Alias of the per-user CMK, as GenKeyFunction creates it
+    clean_username = re.sub(r"[^a-zA-Z0-9]", "", username)
+    salt = hashlib.sha256(username.encode()).hexdigest()
+    return hashlib.sha256((clean_username + salt).encode()).hexdigest()
+
+
+def get_key_record(username):
+    # The user's wrapped DEK and CMK alias straight from the user table; users
+    # registered before the table held them are provisioned by GenKeyFunction
+    if not USER_TABLE_NAME:
+        raise Exception("USER_TABLE_NAME environment variable not set.")
+    item = aws.resource("dynamodb").Table(USER_TABLE_NAME).get_item(Key={"username": username}).get("Item")
+    if item and item.get("KeyStatus") == KEY_STATUS_PENDING:
+        raise KeysPending("Encryption keys are still being provisioned for this user.")
+    if item and "Encrypted_DEK" in item and item.get("KeyScheme") == KEY_SCHEME_SHARED:
+        return {
+            "encrypted_data_encryption_key": item["Encrypted_DEK"],
+            "key_alias": item["CMKKeyId"],
+            "key_scheme": KEY_SCHEME_SHARED,
+        }
+    if item and "Encrypted_DEK" in item:
+        return {
+            "encrypted_data_encryption_key": item["Encrypted_DEK"],
+            "key_alias": item.get("CMKAlias") or derive_cmk_alias(username),
+        }
+
+    if not GENKEY_FUNCTION_NAME:
+        raise Exception("No key material stored for user and LAMBDA_FUNCTION_NAME not set.")
+    response = aws.client("lambda").invoke(
+        FunctionName=GENKEY_FUNCTION_NAME,
+        InvocationType="RequestResponse",
+        Payload=json.dumps({"username": username}),
+    )
+    return json.loads(response["Payload"].read().decode("utf-8"))
+
+
+def derive_user_key(username, encrypted_data_encryption_key, key_alias, key_scheme=None):
+    # Unwrapping the DEK proves the user's CMK is usable; the key handed to the
+    # client is derived from the master secret and the username
+    ciphertext_blob = base64.b64decode(encrypted_data_encryption_key)
+    if key_scheme == KEY_SCHEME_SHARED:
+        # Shared CMK: the encryption context ties the wrapped DEK to this user
+        aws.client("kms").decrypt(
+            CiphertextBlob=ciphertext_blob, KeyId=key_alias, EncryptionContext={"username": username}
+        )
+    else:
+        aws.client("kms").decrypt(CiphertextBlob=ciphertext_blob, KeyId=f"alias/{key_alias}")
+    return hashlib.sha256(get_master_secret().encode("utf-8") + username.encode("utf-8")).digest()
+
+
+def load_user_key(username):
+    record = get_key_record(username)
+    if "encrypted_data_encryption_key" not in record or "key_alias" not in record:
+        raise Exception(
+            "Encrypted Data Encryption Key or Key Alias not found in the response. {}".format(str(record))
+        )
+    return {
+        "data_encryption_key": derive_user_key(
+            username, record["encrypted_data_encryption_key"], record["key_alias"], record.get("key_scheme")
+        ),
+        "encrypted_data_encryption_key": record["encrypted_data_encryption_key"],
+    }
+
+
+def get_user_key(username):
+    # Returns the user's key material, cached; misses are timed as the
+    # "user_key.load" stage of the invocation's metrics, hits show in stats()
+    key = user_key_cache.get(username)
+    if key is None:
+        with metrics.stage("user_key.load"):
+            key = load_user_key(username)
+        user_key_cache.put(username, key)
+    return key
+
+
+def invalidate(username=None):
+    # Drop cached key material: one user after re-keying, everything on master
+    # secret rotation
+    user_key_cache.invalidate(username)
+    if username is None:
+        master_secret_cache.invalidate()
+
+
+def stats():
+    return {"master_secret": master_secret_cache.stats(), "user_keys": user_key_cache.stats()}
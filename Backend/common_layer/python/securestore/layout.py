@@ -0,0 +1,17 @@
+# Top-level prefixes holding the service's own objects next to the users'
+# folders: deduplicated chunks and generated archives. Jobs that walk the
+# whole bucket skip them. Kept free of Crypto imports, so functions without
+# the cipher layer can use it.
+CHUNK_PREFIX = "_chunks"
+ARCHIVE_PREFIX = "_archives"
+RESERVED_PREFIXES = (CHUNK_PREFIX, ARCHIVE_PREFIX)
+
+
+def is_reserved(key):
+    return key.split("/", 1)[0] in RESERVED_PREFIXES
+
+
+def is_valid_username(username):
+    # A username names one top-level folder, so it is a single path segment
+    # that cannot be mistaken for one of the service's own prefixes
+    return isinstance(username, str) and bool(username) and "/" not in username and username not in RESERVED_PREFIXES
@@ -0,0 +1,185 @@
+import os
+import traceback
+from datetime import datetime, timezone
+from securestore import aws
+
+# Per-user file manifest: partition key username, sort key file_name
+MANIFEST_TABLE_NAME = os.environ.get("FILE_MANIFEST_TABLE_NAME")
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def key(name):
+    # The condition builder pulls in boto3, import it on first query so that
+    # handlers which only record files keep boto3 off their import path
+    from boto3.dynamodb.conditions import Key
+
+    return Key(name)
+
+
+def get_table():
+    if not MANIFEST_TABLE_NAME:
+        raise Exception("FILE_MANIFEST_TABLE_NAME environment variable not set.")
+    return aws.resource("dynamodb").Table(MANIFEST_TABLE_NAME)
+
+
+def record_file(username, file_name, size, ciphertext_size, content_type, etag=None):
+    # Single atomic update: attributes are overwritten and the version is bumped
+    # in the same write, so concurrent uploads of one file never lose a version
+    response = get_table().update_item(
+        Key={"username": username, "file_name": file_name},
+        UpdateExpression=(
+            "SET file_size = :size, ciphertext_size = :ciphertext_size, content_type = :content_type, "
+            "uploaded_at = :uploaded_at, etag = :etag ADD file_version :one"
+        ),
+        ExpressionAttributeValues={
+            ":size": size,
+            ":ciphertext_size": ciphertext_size,
+            ":content_type": content_type or "application/octet-stream",
+            ":uploaded_at": datetime.now(timezone.utc).isoformat(),
+            ":etag": etag,
+            ":one": 1,
+        },
+        ReturnValues="ALL_NEW",
+    )
+    return response["Attributes"]
+
+
+def remove_file(username, file_name):
+    get_table().delete_item(Key={"username": username, "file_name": file_name})
+
+
+def remove_files(username, file_names):
+    # Bulk form of remove_file, sent as BatchWriteItem requests of 25
+    with get_table().batch_writer() as batch:
+        for file_name in file_names:
+            batch.delete_item(Key={"username": username, "file_name": file_name})
+
+
+# The manifest indexes what S3 holds. Handlers update it after S3 has changed,
+# through the *_safely forms: a failed index write is logged instead of
+# failing a request whose file operation already succeeded, and the reconcile
+# job repairs the entry.
+def record_file_safely(username, file_name, size, ciphertext_size, content_type, etag=None):
+    try:
+        return record_file(username, file_name, size, ciphertext_size, content_type, etag)
+    except Exception:
+        traceback.print_exc()
+        return None
+
+
+def remove_files_safely(username, file_names):
+    try:
+        remove_files(username, file_names)
+    except Exception:
+        traceback.print_exc()
+
+
+def get_file(username, file_name):
+    # Existence check and metadata lookup in one consistent read
+    response = get_table().get_item(
+        Key={"username": username, "file_name": file_name}, ConsistentRead=True
+    )
+    return response.get("Item")
+
+
+def list_files(username, page_size=DEFAULT_PAGE_SIZE, cursor=None, prefix=None):
+    # One page of the user's partition in file_name order; the cursor is the
+    # last file name returned (sort-key pagination)
+    condition = key("username").eq(username)
+    if prefix:
+        condition = condition & key("file_name").begins_with(prefix)
+    params = {"KeyConditionExpression": condition, "Limit": max(1, min(page_size, MAX_PAGE_SIZE))}
+    if cursor:
+        params["ExclusiveStartKey"] = {"username": username, "file_name": cursor}
+    response = get_table().query(**params)
+
+    last_key = response.get("LastEvaluatedKey")
+    return {
+        "files": [to_json(item) for item in response.get("Items", [])],
+        "next_cursor": last_key["file_name"] if last_key else None,
+    }
+
+
+def usage_totals(username):
+    # Sums sizes over the user's partition, only the two size attributes are read
+    totals = {"files": 0, "size": 0, "ciphertext_size": 0}
+    params = {
+        "KeyConditionExpression": key("username").eq(username),
+        "ProjectionExpression": "file_size, ciphertext_size",
+    }
+    while True:
+        response = get_table().query(**params)
+        for item in response.get("Items", []):
+            totals["files"] += 1
+            totals["size"] += int(item.get("file_size") or 0)
+            totals["ciphertext_size"] += int(item.get("ciphertext_size") or 0)
+        if "LastEvaluatedKey" not in response:
+            return totals
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def to_json(item):
+    # DynamoDB numbers come back as Decimal
+    return {
+        "name": item["file_name"],
+        "size": int(item["file_size"]) if item.get("file_size") is not None else None,
+        "ciphertext_size": int(item["ciphertext_size"]) if item.get("ciphertext_size") is not None else None,
+        "content_type": item.get("content_type"),
+        "uploaded_at": item.get("uploaded_at"),
+        "version": int(item.get("file_version") or 0),
+        "etag": item.get("etag"),
+    }
+
+
+def reconcile(username, bucket_name):
+    # Rebuild one user's manifest from S3: add or fix entries for objects that
+    # exist, drop entries whose object is gone. Entries are matched on ETag;
+    # for rebuilt entries the stored object size is the only size known.
+    folder_path = f"{username}/"
+    objects = {}
+    paginator = aws.client("s3").get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_path):
+        for obj in page.get("Contents", []):
+            objects[obj["Key"][len(folder_path):]] = obj
+
+    entries = {}
+    params = {"KeyConditionExpression": key("username").eq(username)}
+    while True:
+        response = get_table().query(**params)
+        for item in response.get("Items", []):
+            entries[item["file_name"]] = item
+        if "LastEvaluatedKey" not in response:
+            break
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    added, updated, removed = 0, 0, 0
+    with get_table().batch_writer() as batch:
+        for file_name, obj in objects.items():
+            etag = obj["ETag"].strip('"')
+            entry = entries.get(file_name)
+            if entry is not None and entry.get("etag") == etag:
+                continue
+            batch.put_item(
+                Item={
+                    "username": username,
+                    "file_name": file_name,
+                    "file_size": obj["Size"],
+                    "ciphertext_size": obj["Size"],
+                    "content_type": (entry or {}).get("content_type", "application/octet-stream"),
+                    "uploaded_at": obj["LastModified"].isoformat(),
+                    "etag": etag,
+                    "file_version": int((entry or {}).get("file_version") or 0) + 1,
+                }
+            )
+            if entry is None:
+                added += 1
+            else:
+                updated += 1
+        for file_name in entries:
+            if file_name not in objects:
+                batch.delete_item(Key={"username": username, "file_name": file_name})
+                removed += 1
+
+    return {"added": added, "updated": updated, "removed": removed}
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import random
+import functools
+import threading
+import contextvars
+
+try:
+    from snapshot_restore_py import register_after_restore
+except ImportError:
+    register_after_restore = None
+
+# Per-invocation latency breakdown emitted as CloudWatch embedded metric format
+# (EMF) log lines. Handlers are wrapped with @instrument, sub-steps with
+# `with stage("name"):` or iterate("name", pieces), and every call made by a
+# client from securestore.aws is timed as "<service>.<Operation>". Cold starts
+# are always recorded; other invocations are sampled with METRICS_SAMPLE_RATE.
+# When an invocation is not sampled every hook returns after one lookup.
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "SecureStore")
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "0"))
+
+_process_started = time.perf_counter()
+_warm_functions = set()
+_current = contextvars.ContextVar("securestore_metrics", default=None)
+
+
+class Recorder:
+    def __init__(self, function_name, cold_start):
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, size=None):
+        with self.lock:
+            entry = self.stages.setdefault(name, {"ms": 0.0, "count": 0, "bytes": 0})
+            entry["ms"] += seconds * 1000
+            entry["count"] += 1
+            if size:
+                entry["bytes"] += size
+
+    def emit(self, total_seconds, status_code=None, init_seconds=None):
+        metrics = [{"Name": "Duration", "Unit": "Milliseconds"}, {"Name": "ColdStart", "Unit": "Count"}]
+        record = {
+            "Function": self.function_name,
+            "Duration": round(total_seconds * 1000, 3),
+            "ColdStart": int(self.cold_start),
+        }
+        if init_seconds is not None:
+            metrics.append({"Name": "Init", "Unit": "Milliseconds"})
+            record["Init"] = round(init_seconds * 1000, 3)
+        if status_code is not None:
+            record["StatusCode"] = status_code
+        with self.lock:
+            stages = dict(self.stages)
+        for name, entry in stages.items():
+            metrics.append({"Name": f"{name}.ms", "Unit": "Milliseconds"})
+            record[f"{name}.ms"] = round(entry["ms"], 3)
+            record[f"{name}.count"] = entry["count"]
+            if entry["bytes"]:
+                metrics.append({"Name": f"{name}.bytes", "Unit": "Bytes"})
+                record[f"{name}.bytes"] = entry["bytes"]
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{"Namespace": METRICS_NAMESPACE, "Dimensions": [["Function"]], "Metrics": metrics}],
+        }
+        print(json.dumps(record))
+
+
+def _after_restore():
+    # The first invocation after a snapshot restore is a cold start of its own,
+    # with init measured from the restore rather than from the original init
+    global _process_started
+    _process_started = time.perf_counter()
+    _warm_functions.clear()
+
+
+if register_after_restore is not None:
+    register_after_restore(_after_restore)
+
+
+def current():
+    return _current.get()
+
+
+def instrument(handler):
+    # Wraps a Lambda handler; the function name comes from the handler's directory
+    function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME") or os.path.basename(
+        os.path.dirname(os.path.abspath(handler.__code__.co_filename))
+    )
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        cold_start = function_name not in _warm_functions
+        if not cold_start and (METRICS_SAMPLE_RATE <= 0 or random.random() >= METRICS_SAMPLE_RATE):
+            return handler(event, context)
+        _warm_functions.add(function_name)
+        name = getattr(context, "function_name", None) or function_name
+        recorder = Recorder(name, cold_start)
+        token = _current.set(recorder)
+        start = time.perf_counter()
+        result = None
+        try:
+            result = handler(event, context)
+            return result
+        finally:
+            _current.reset(token)
+            status_code = result.get("statusCode") if isinstance(result, dict) else None
+            recorder.emit(
+                time.perf_counter() - start, status_code, start - _process_started if cold_start else None
+            )
+
+    return wrapper
+
+
+class _Stage:
+    __slots__ = ("recorder", "name", "bytes", "start")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+        self.bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add(self.name, time.perf_counter() - self.start, self.bytes)
+        return False
+
+
+class _NoStage:
+    __slots__ = ("bytes",)
+
+    def __enter__(self):
+        self.bytes = 0
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def stage(name):
+    # `with stage("parse") as s: ...; s.bytes = n` times a block of the current invocation
+    recorder = _current.get()
+    if recorder is None:
+        return _NoStage()
+    return _Stage(recorder, name)
+
+
+def timed(name):
+    # Decorator form of stage()
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def iterate(name, pieces):
+    # Times the work done producing each piece of a lazy pipeline (encryption,
+    # decryption) separately from whoever consumes it, with the bytes produced
+    recorder = _current.get()
+    if recorder is None:
+        return pieces
+    return _timed_pieces(recorder, name, iter(pieces))
+
+
+def _timed_pieces(recorder, name, pieces):
+    elapsed = 0.0
+    size = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                piece = next(pieces)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                return
+            elapsed += time.perf_counter() - start
+            size += len(piece)
+            yield piece
+    finally:
+        recorder.add(name, elapsed, size)
+
+
+def bind(function):
+    # Worker threads do not inherit the invocation context; wrap the callable
+    # handed to an executor so its stages and AWS calls are still attributed
+    if _current.get() is None:
+        return function
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, each call gets its own copy
+        return context.copy().run(function, *args, **kwargs)
+
+    return run
+
+
+def attach(client):
+    # Time every API call of a boto3 client as "<service>.<Operation>"
+    events = getattr(getattr(client, "meta", None), "events", None)
+    if events is None:
+        return client
+    service = client.meta.service_model.service_name
+    events.register_first("before-call", _before_call)
+    events.register("after-call", functools.partial(_after_call, service))
+    return client
+
+
+def _before_call(params=None, context=None, **kwargs):
+    if _current.get() is None or context is None:
+        return
+    body = params.get("body") if isinstance(params, dict) else None
+    context["securestore_metrics_sent"] = len(body) if isinstance(body, (bytes, bytearray)) else 0
+    context["securestore_metrics_start"] = time.perf_counter()
+
+
+def _after_call(service, http_response=None, parsed=None, model=None, context=None, **kwargs):
+    recorder = _current.get()
+    if recorder is None or context is None or "securestore_metrics_start" not in context:
+        return
+    size = context.get("securestore_metrics_sent", 0)
+    if isinstance(parsed, dict):
+        size += parsed.get("ContentLength") or 0
+    recorder.add(f"{service}.{model.name}", time.perf_counter() - context["securestore_metrics_start"], size)
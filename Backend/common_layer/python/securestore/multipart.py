@@ -0,0 +1,98 @@
+from email.message import Message
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class MultipartError(Exception):
+    pass
+
+
+class PayloadTooLarge(MultipartError):
+    pass
+
+
+def header_params(header_name, value):
+    # Let the email package deal with quoting and parameter syntax
+    message = Message()
+    message[header_name] = value
+    return message
+
+
+def parse_boundary(content_type):
+    boundary = header_params("content-type", content_type).get_param("boundary", header="content-type")
+    if not boundary:
+        raise MultipartError("Missing multipart boundary in Content-Type header.")
+    return boundary.encode("latin-1")
+
+
+class Part:
+    # One form-data part. The payload is a memoryview into the request body,
+    # nothing is copied until a consumer asks for bytes.
+    def __init__(self, headers, data):
+        self.headers = headers
+        self.data = data
+        disposition = header_params("content-disposition", headers.get("content-disposition", ""))
+        self.name = disposition.get_param("name", header="content-disposition")
+        self.filename = disposition.get_param("filename", header="content-disposition")
+        self.content_type = headers.get("content-type", "text/plain")
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def value(self):
+        return self.data.tobytes().decode("utf-8")
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start : start + chunk_size]
+
+
+def parse_headers(raw_headers):
+    headers = {}
+    for line in raw_headers.split(b"\r\n"):
+        if not line:
+            continue
+        name, _, value = line.partition(b":")
+        headers[name.strip().decode("latin-1").lower()] = value.strip().decode("utf-8")
+    return headers
+
+
+def iter_parts(body, boundary, max_part_size=None):
+    # Walks the decoded body once, yielding parts as their end delimiter is
+    # found. Part sizes are checked from the delimiter offsets, so an oversized
+    # file is rejected before any of its bytes are touched.
+    view = memoryview(body)
+    delimiter = b"--" + boundary
+    separator = b"\r\n" + delimiter
+
+    position = body.find(delimiter)
+    if position < 0:
+        raise MultipartError("Multipart boundary not found in body.")
+    position += len(delimiter)
+
+    while True:
+        if body[position : position + 2] == b"--":
+            return
+        if body[position : position + 2] != b"\r\n":
+            raise MultipartError("Malformed multipart delimiter.")
+        headers_start = position + 2
+        headers_end = body.find(b"\r\n\r\n", headers_start)
+        if headers_end < 0:
+            raise MultipartError("Unterminated part headers.")
+        data_start = headers_end + 4
+        data_end = body.find(separator, data_start)
+        if data_end < 0:
+            raise MultipartError("Unterminated multipart part.")
+        if max_part_size is not None and data_end - data_start > max_part_size:
+            raise PayloadTooLarge(f"Part exceeds the maximum size of {max_part_size} bytes.")
+
+        headers = parse_headers(body[headers_start:headers_end])
+        yield Part(headers, view[data_start:data_end])
+        position = data_end + len(separator)
+
+
+def parse_form(body, content_type, max_part_size=None):
+    # Name -> Part mapping for a multipart/form-data body
+    return {part.name: part for part in iter_parts(body, parse_boundary(content_type), max_part_size)}
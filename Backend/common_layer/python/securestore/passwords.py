@@ -0,0 +1,117 @@
+import os
+import time
+import bcrypt
+
+try:
+    import argon2
+except ImportError:
+    argon2 = None
+
+# Target bcrypt cost for new and rehashed passwords; pick it with calibrate()
+# on the memory size the login function is deployed with
+BCRYPT_COST = int(os.environ.get("BCRYPT_COST", "12"))
+# Hasher used for new hashes, stored hashes of any registered scheme keep verifying
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "bcrypt")
+
+
+class BcryptHasher:
+    name = "bcrypt"
+    prefixes = ("$2a$", "$2b$", "$2y$")
+
+    def __init__(self, cost=BCRYPT_COST):
+        self.cost = cost
+
+    def hash(self, password):
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.cost)).decode("utf-8")
+
+    def verify(self, password, stored):
+        return bcrypt.checkpw(password.encode("utf-8"), stored.encode("utf-8"))
+
+    def needs_rehash(self, stored):
+        return int(stored.split("$")[2]) != self.cost
+
+
+class Argon2idHasher:
+    # Available once argon2-cffi is shipped in a layer
+    name = "argon2id"
+    prefixes = ("$argon2id$",)
+
+    def __init__(self):
+        if argon2 is None:
+            raise Exception("argon2-cffi is required for the argon2id password hasher.")
+        self.hasher = argon2.PasswordHasher()
+
+    def hash(self, password):
+        return self.hasher.hash(password)
+
+    def verify(self, password, stored):
+        try:
+            return self.hasher.verify(stored, password)
+        except argon2.exceptions.VerifyMismatchError:
+            return False
+
+    def needs_rehash(self, stored):
+        return self.hasher.check_needs_rehash(stored)
+
+
+HASHER_TYPES = {"bcrypt": BcryptHasher, "argon2id": Argon2idHasher}
+
+_hashers = {}
+_unknown_user_hash = None
+
+
+def get_hasher(name=None):
+    name = name or PASSWORD_HASHER
+    if name not in _hashers:
+        _hashers[name] = HASHER_TYPES[name]()
+    return _hashers[name]
+
+
+def identify(stored):
+    for name, hasher_type in HASHER_TYPES.items():
+        if stored.startswith(hasher_type.prefixes):
+            return get_hasher(name)
+    raise Exception("Unrecognised password hash format.")
+
+
+def hash_password(password):
+    return get_hasher().hash(password)
+
+
+def verify_password(password, stored):
+    return identify(stored).verify(password, stored)
+
+
+def verify_unknown_user(password):
+    # Spends the same verify time as a real account so response timing does
+    # not reveal which usernames exist; the placeholder hash is made once
+    global _unknown_user_hash
+    if _unknown_user_hash is None:
+        _unknown_user_hash = hash_password("unknown-user-placeholder")
+    verify_password(password, _unknown_user_hash)
+    return False
+
+
+def needs_rehash(stored):
+    # Stale when written by another scheme or with other parameters than the current ones
+    hasher = identify(stored)
+    return hasher.name != get_hasher().name or hasher.needs_rehash(stored)
+
+
+def calibrate(target_ms, min_cost=10, max_cost=16, samples=3):
+    # Measures bcrypt verify latency per cost on this machine and returns the
+    # highest cost whose median stays within target_ms, with the timings
+    timings = {}
+    chosen = min_cost
+    for cost in range(min_cost, max_cost + 1):
+        stored = bcrypt.hashpw(b"calibration-password", bcrypt.gensalt(cost))
+        durations = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            bcrypt.checkpw(b"calibration-password", stored)
+            durations.append((time.perf_counter() - start) * 1000)
+        timings[cost] = sorted(durations)[len(durations) // 2]
+        if timings[cost] > target_ms:
+            break
+        chosen = cost
+    return {"cost": chosen, "target_ms": target_ms, "verify_ms": timings}
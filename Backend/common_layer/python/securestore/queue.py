@@ -0,0 +1,59 @@
+import os
+import json
+import threading
+from collections import deque
+from securestore import aws
+
+# Work queue for asynchronous key provisioning. SQS when deployed; tests and
+# local runs swap in InMemoryQueue with set_queue().
+KEY_PROVISIONING_QUEUE_URL = os.environ.get("KEY_PROVISIONING_QUEUE_URL")
+
+
+class SqsQueue:
+    def __init__(self, queue_url):
+        self.queue_url = queue_url
+
+    def send(self, message):
+        aws.client("sqs").send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(message))
+
+
+class InMemoryQueue:
+    # Local stand-in: messages are kept in order and handed out as SQS-style
+    # records so the worker handler can consume them unchanged
+    def __init__(self):
+        self.messages = deque()
+        self.lock = threading.Lock()
+        self.sequence = 0
+
+    def send(self, message):
+        with self.lock:
+            self.sequence += 1
+            self.messages.append({"messageId": str(self.sequence), "body": json.dumps(message)})
+
+    def receive(self, max_messages=10):
+        with self.lock:
+            batch = []
+            while self.messages and len(batch) < max_messages:
+                batch.append(self.messages.popleft())
+            return {"Records": batch}
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        if not KEY_PROVISIONING_QUEUE_URL:
+            raise Exception("KEY_PROVISIONING_QUEUE_URL environment variable not set.")
+        _queue = SqsQueue(KEY_PROVISIONING_QUEUE_URL)
+    return _queue
+
+
+def set_queue(queue):
+    global _queue
+    _queue = queue
+
+
+def send(message):
+    get_queue().send(message)
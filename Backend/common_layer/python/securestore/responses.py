@@ -0,0 +1,10 @@
+import json
+
+
+def json_response(status_code, payload):
+    # API Gateway proxy response with a JSON body
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(payload),
+        "headers": {"Content-Type": "application/json"},
+    }
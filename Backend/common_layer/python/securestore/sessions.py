@@ -0,0 +1,151 @@
+import os
+import time
+import uuid
+import secrets
+import hashlib
+from jwt import encode
+from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeDeserializer
+from securestore import aws
+from securestore.cache import TTLCache
+
+# Short-lived access tokens paired with rotating refresh tokens. Refresh tokens
+# are opaque random strings, only their SHA-256 is stored (refreshTokenTable,
+# PK token_hash) together with the username and the family they belong to.
+# Every refresh consumes the presented token and issues its successor in the
+# same family; presenting a consumed token again revokes the whole family.
+JWT_SECRET_NAME = os.environ.get("JWT_SECRET_NAME")
+REFRESH_TOKEN_TABLE_NAME = os.environ.get("REFRESH_TOKEN_TABLE_NAME")
+REFRESH_FAMILY_INDEX = os.environ.get("REFRESH_FAMILY_INDEX", "family_id-index")
+
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", "900"))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL", str(7 * 24 * 3600)))
+# Absolute lifetime of a login, rotation never extends a session past it
+REFRESH_SESSION_MAX_AGE = int(os.environ.get("REFRESH_SESSION_MAX_AGE", str(30 * 24 * 3600)))
+JWT_SECRET_TTL = int(os.environ.get("JWT_SECRET_TTL", "300"))
+
+jwt_secret_cache = TTLCache(1, JWT_SECRET_TTL)
+
+
+class SessionError(Exception):
+    pass
+
+
+def get_jwt_secret():
+    try:
+        return jwt_secret_cache.get_or_load(JWT_SECRET_NAME, lambda: aws.get_secret_string(JWT_SECRET_NAME))
+    except ClientError:
+        raise Exception("Failed to retrieve JWT secret")
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def table():
+    if not REFRESH_TOKEN_TABLE_NAME:
+        raise Exception("REFRESH_TOKEN_TABLE_NAME environment variable not set.")
+    return aws.resource("dynamodb").Table(REFRESH_TOKEN_TABLE_NAME)
+
+
+def issue_access_token(username, now=None):
+    # Same claims the authorizer has always read, so tokens from before the
+    # rollout (2 hours, no token_use) and after it verify the same way
+    now = int(now or time.time())
+    payload = {"username": username, "iat": now, "exp": now + ACCESS_TOKEN_TTL, "token_use": "access"}
+    return encode(payload, get_jwt_secret(), algorithm="HS256")
+
+
+def issue_refresh_token(username, family_id=None, session_expires_at=None, now=None):
+    now = int(now or time.time())
+    family_id = family_id or uuid.uuid4().hex
+    session_expires_at = int(session_expires_at or now + REFRESH_SESSION_MAX_AGE)
+    token = secrets.token_urlsafe(32)
+    table().put_item(
+        Item={
+            "token_hash": hash_token(token),
+            "username": username,
+            "family_id": family_id,
+            "issued_at": now,
+            "expires_at": min(now + REFRESH_TOKEN_TTL, session_expires_at),
+            "session_expires_at": session_expires_at,
+        },
+        ConditionExpression="attribute_not_exists(token_hash)",
+    )
+    return token
+
+
+def start_session(username):
+    # Called once per successful password login
+    now = int(time.time())
+    return {
+        "token": issue_access_token(username, now),
+        "refreshToken": issue_refresh_token(username, now=now),
+        "expiresIn": ACCESS_TOKEN_TTL,
+    }
+
+
+def consume_refresh_token(token):
+    # Single conditional write on the table key: marks the token used and
+    # returns its record, or reports why it could not be used
+    now = int(time.time())
+    try:
+        response = table().update_item(
+            Key={"token_hash": hash_token(token)},
+            UpdateExpression="SET used_at = :now",
+            ConditionExpression=(
+                "attribute_exists(token_hash) AND attribute_not_exists(used_at) "
+                "AND attribute_not_exists(revoked_at) AND expires_at > :now"
+            ),
+            ExpressionAttributeValues={":now": now},
+            ReturnValues="ALL_NEW",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+        return response["Attributes"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+        item = e.response.get("Item")
+        if not item:
+            raise SessionError("Invalid refresh token")
+        deserializer = TypeDeserializer()
+        item = {name: deserializer.deserialize(value) for name, value in item.items()}
+        if "used_at" in item and "revoked_at" not in item:
+            # A rotated token came back: either it leaked or the client that
+            # holds the live one is an impostor, end the session for both
+            revoke_family(item["family_id"])
+            print("Refresh token reuse detected, revoked session family", item["family_id"])
+            raise SessionError("Refresh token reuse detected")
+        raise SessionError("Refresh token expired or revoked")
+
+
+def refresh_session(token):
+    record = consume_refresh_token(token)
+    now = int(time.time())
+    return {
+        "token": issue_access_token(record["username"], now),
+        "refreshToken": issue_refresh_token(
+            record["username"], record["family_id"], record["session_expires_at"], now
+        ),
+        "expiresIn": ACCESS_TOKEN_TTL,
+    }
+
+
+def revoke_family(family_id):
+    now = int(time.time())
+    query_args = {
+        "IndexName": REFRESH_FAMILY_INDEX,
+        "KeyConditionExpression": "family_id = :family",
+        "ExpressionAttributeValues": {":family": family_id},
+    }
+    while True:
+        response = table().query(**query_args)
+        for item in response.get("Items", []):
+            table().update_item(
+                Key={"token_hash": item["token_hash"]},
+                UpdateExpression="SET revoked_at = :now",
+                ExpressionAttributeValues={":now": now},
+            )
+        if "LastEvaluatedKey" not in response:
+            break
+        query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
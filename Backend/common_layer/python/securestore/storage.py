@@ -0,0 +1,186 @@
+import os
+import zlib
+import base64
+import binascii
+import itertools
+from Crypto.Cipher import AES
+from Crypto.Util.Padding import unpad
+from securestore import container, dedup
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Object metadata key recording how the stored payload relates to what the client sent
+PAYLOAD_ENCODING_KEY = "payload-encoding"
+PAYLOAD_ENCODING_BASE64 = "base64"
+
+# Object metadata key naming the codec the payload was compressed with before encryption
+PAYLOAD_COMPRESSION_KEY = "payload-compression"
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+# Compression runs before encryption, so the stored size leaks how well the
+# content compresses. It is only applied to content types on this allowlist,
+# never to anything an attacker could mix secrets into and observe.
+UPLOAD_COMPRESSION = os.environ.get("UPLOAD_COMPRESSION", CODEC_ZLIB)
+COMPRESSIBLE_CONTENT_TYPES = set(
+    filter(None, os.environ.get("COMPRESSIBLE_CONTENT_TYPES", "text/csv,text/x-log,application/x-ndjson").split(","))
+)
+COMPRESSION_SAMPLE_SIZE = 64 * 1024
+# Skip compression when the sample does not shrink below this ratio
+COMPRESSION_MIN_RATIO = 0.9
+
+# Client uploads are CryptoJS output, whose base64 text always starts with "Salted__"
+CLIENT_TEXT_PREFIX = b"U2FsdGVkX1"
+
+# Object formats that can be found in the bucket
+FORMAT_CONTAINER = "container"
+FORMAT_CLIENT_TEXT = "client-text"
+FORMAT_LEGACY_CBC = "legacy-cbc"
+
+# Multiple of 3 so streamed base64 output needs no padding between pieces
+BASE64_PIECE_SIZE = 3 * 16 * 1024
+
+
+def pack_payload(data):
+    # The client sends base64 text; storing the decoded bytes removes the ~33%
+    # text overhead from S3 storage and transfer. Anything that is not valid
+    # base64 is stored as sent.
+    try:
+        return memoryview(base64.b64decode(data, validate=True)), {PAYLOAD_ENCODING_KEY: PAYLOAD_ENCODING_BASE64}
+    except (binascii.Error, ValueError):
+        return memoryview(data), {}
+
+
+def choose_compression(content_type, payload):
+    # Compress a sample of the first block and only keep compression when it
+    # pays off; already-encrypted or media payloads fail this check cheaply
+    codec = UPLOAD_COMPRESSION
+    if codec == CODEC_ZSTD and zstandard is None:
+        codec = CODEC_ZLIB
+    if codec not in (CODEC_ZLIB, CODEC_ZSTD):
+        return None
+    if (content_type or "").split(";")[0].strip().lower() not in COMPRESSIBLE_CONTENT_TYPES:
+        return None
+    sample = payload[:COMPRESSION_SAMPLE_SIZE]
+    if not len(sample) or len(zlib.compress(sample, 1)) > len(sample) * COMPRESSION_MIN_RATIO:
+        return None
+    return codec
+
+
+def compress_stream(pieces, codec):
+    if codec == CODEC_ZSTD:
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(6)
+    for piece in pieces:
+        output = compressor.compress(piece)
+        if output:
+            yield output
+    yield compressor.flush()
+
+
+def decompress_stream(pieces, codec):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise Exception("zstandard is required to read zstd-compressed objects.")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = zlib.decompressobj()
+    for piece in pieces:
+        output = decompressor.decompress(piece)
+        if output:
+            yield output
+    if codec != CODEC_ZSTD:
+        output = decompressor.flush()
+        if output:
+            yield output
+
+
+def prepare_payload(data, content_type=None):
+    # Upload pipeline ahead of encryption: strip the text layer, then compress
+    # when it is allowed and worthwhile. Returns the payload as a stream of
+    # pieces and the object metadata that describes it.
+    payload, metadata = pack_payload(data)
+    pieces = container.rechunk([payload], container.DEFAULT_CHUNK_SIZE)
+    codec = choose_compression(content_type, payload)
+    if codec:
+        metadata[PAYLOAD_COMPRESSION_KEY] = codec
+        pieces = compress_stream(pieces, codec)
+    return pieces, metadata
+
+
+def is_transformed(metadata):
+    # Compressed and deduplicated payloads cannot be mapped byte for byte onto plaintext ranges
+    metadata = metadata or {}
+    return PAYLOAD_COMPRESSION_KEY in metadata or metadata.get(dedup.LAYOUT_KEY) == dedup.LAYOUT_DEDUP
+
+
+def content_size(head, stored_size, metadata=None):
+    # Exact size of what read_stream yields for an object, when it follows from
+    # the stored size and first bytes alone; None for compressed, deduplicated
+    # and legacy objects, whose size is only known once they are read
+    stored_format = detect_format(head)
+    if stored_format == FORMAT_CLIENT_TEXT:
+        return stored_size
+    if stored_format != FORMAT_CONTAINER or is_transformed(metadata) or len(head) < container.HEADER_SIZE:
+        return None
+    size = container.plaintext_size(stored_size, container.parse_header(head).chunk_size)
+    if (metadata or {}).get(PAYLOAD_ENCODING_KEY) == PAYLOAD_ENCODING_BASE64:
+        return -(-size // 3) * 4
+    return size
+
+
+def detect_format(head):
+    if container.is_container(head):
+        return FORMAT_CONTAINER
+    if not head or bytes(head[: len(CLIENT_TEXT_PREFIX)]) == CLIENT_TEXT_PREFIX:
+        return FORMAT_CLIENT_TEXT
+    return FORMAT_LEGACY_CBC
+
+
+def decrypt_legacy(key, data):
+    # Whole-object reader for base64(iv + AES-CBC) objects written by the first
+    # version of FileUpFunction
+    encrypted_text = base64.b64decode(data)
+    iv = encrypted_text[: AES.block_size]
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    return unpad(cipher.decrypt(encrypted_text[AES.block_size :]), AES.block_size)
+
+
+def base64_stream(pieces):
+    for piece in container.rechunk(pieces, BASE64_PIECE_SIZE):
+        yield base64.b64encode(piece)
+
+
+def read_stream(key, pieces, metadata=None):
+    # Generator over the content the client originally uploaded, whatever the
+    # stored format: the container is decrypted chunk by chunk, older formats
+    # go through their legacy readers
+    pieces = iter(pieces)
+    first = next(pieces, b"")
+    stored_format = detect_format(first)
+    pieces = itertools.chain([first], pieces)
+
+    if stored_format == FORMAT_CONTAINER:
+        metadata = metadata or {}
+        if metadata.get(dedup.LAYOUT_KEY) == dedup.LAYOUT_DEDUP:
+            plaintext = dedup.read_file(key, dedup.decode_manifest(key, pieces))
+        else:
+            plaintext = container.decrypt_stream(key, pieces)
+        if PAYLOAD_COMPRESSION_KEY in metadata:
+            plaintext = decompress_stream(plaintext, metadata[PAYLOAD_COMPRESSION_KEY])
+        if metadata.get(PAYLOAD_ENCODING_KEY) == PAYLOAD_ENCODING_BASE64:
+            plaintext = base64_stream(plaintext)
+        yield from plaintext
+    elif stored_format == FORMAT_CLIENT_TEXT:
+        yield from pieces
+    else:
+        data = b"".join(pieces)
+        try:
+            yield decrypt_legacy(key, data)
+        except (binascii.Error, ValueError):
+            # Not server-encrypted after all, serve it as stored
+            yield data
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import threading
+from decimal import Decimal
+from securestore import aws
+from securestore.cache import TTLCache
+
+# Login load shedding. Every attempt is checked against a per-account and a
+# per-IP key before any password hashing happens:
+#   - an in-process token bucket absorbs bursts without a network call,
+#   - a sliding-window counter in loginThrottleTable (PK throttle_key), bumped
+#     with atomic ADDs, shares the attempt rate across instances,
+#   - failed passwords push the key into an exponential backoff that every
+#     instance derives from the shared failures/last_failure_at attributes.
+# Without LOGIN_THROTTLE_TABLE_NAME only the in-process limits apply.
+LOGIN_THROTTLE_TABLE_NAME = os.environ.get("LOGIN_THROTTLE_TABLE_NAME")
+LOGIN_THROTTLE_WINDOW = int(os.environ.get("LOGIN_THROTTLE_WINDOW", "60"))
+# Shared counters are written every SYNC_BATCH local attempts or SYNC_INTERVAL seconds
+LOGIN_THROTTLE_SYNC_BATCH = int(os.environ.get("LOGIN_THROTTLE_SYNC_BATCH", "5"))
+LOGIN_THROTTLE_SYNC_INTERVAL = float(os.environ.get("LOGIN_THROTTLE_SYNC_INTERVAL", "2"))
+LOGIN_BACKOFF_BASE = float(os.environ.get("LOGIN_BACKOFF_BASE", "1"))
+LOGIN_BACKOFF_MAX = float(os.environ.get("LOGIN_BACKOFF_MAX", "900"))
+LOGIN_THROTTLE_CACHE_SIZE = int(os.environ.get("LOGIN_THROTTLE_CACHE_SIZE", "50000"))
+LOGIN_THROTTLE_STATS_INTERVAL = float(os.environ.get("LOGIN_THROTTLE_STATS_INTERVAL", "60"))
+
+LIMITS = {
+    "account": {
+        "burst": int(os.environ.get("ACCOUNT_LOGIN_BURST", "5")),
+        "rate": float(os.environ.get("ACCOUNT_LOGIN_RATE", "0.2")),
+        "window_limit": int(os.environ.get("ACCOUNT_LOGIN_WINDOW_LIMIT", "10")),
+        "free_failures": int(os.environ.get("ACCOUNT_LOGIN_FREE_FAILURES", "3")),
+    },
+    "ip": {
+        "burst": int(os.environ.get("IP_LOGIN_BURST", "20")),
+        "rate": float(os.environ.get("IP_LOGIN_RATE", "1")),
+        "window_limit": int(os.environ.get("IP_LOGIN_WINDOW_LIMIT", "60")),
+        "free_failures": int(os.environ.get("IP_LOGIN_FREE_FAILURES", "20")),
+    },
+}
+
+
+class Throttled(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__("Too many login attempts, try again later.")
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class KeyState:
+    def __init__(self, limits, now):
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.tokens = float(limits["burst"])
+        self.refilled_at = now
+        self.pending = 0
+        self.synced_at = 0.0
+        self.shared_attempts = 0.0
+        self.failures = 0
+        self.last_failure_at = 0.0
+
+    def refill(self, now):
+        elapsed = now - self.refilled_at
+        self.tokens = min(float(self.limits["burst"]), self.tokens + elapsed * self.limits["rate"])
+        self.refilled_at = now
+
+    def locked_until(self):
+        return self.last_failure_at + backoff_seconds(self.failures, self.limits["free_failures"])
+
+
+def backoff_seconds(failures, free_failures):
+    if failures <= free_failures:
+        return 0.0
+    return min(LOGIN_BACKOFF_MAX, LOGIN_BACKOFF_BASE * 2 ** (failures - free_failures - 1))
+
+
+class LoginThrottle:
+    def __init__(self, table_name=LOGIN_THROTTLE_TABLE_NAME, limits=LIMITS):
+        self.table_name = table_name
+        self.limits = limits
+        # States expire once both the window and the longest backoff are over
+        self.states = TTLCache(LOGIN_THROTTLE_CACHE_SIZE, max(2 * LOGIN_THROTTLE_WINDOW, LOGIN_BACKOFF_MAX))
+        self.counters_lock = threading.Lock()
+        self.counters = {
+            "allowed": 0,
+            "throttled_local": 0,
+            "throttled_shared": 0,
+            "throttled_backoff": 0,
+            "failures": 0,
+            "syncs": 0,
+            "sync_errors": 0,
+            "verify_count": 0,
+            "verify_ms_total": 0.0,
+        }
+        self.stats_logged_at = time.monotonic()
+
+    def count(self, name, amount=1):
+        with self.counters_lock:
+            self.counters[name] += amount
+
+    def state(self, kind, value):
+        now = time.time()
+        return self.states.get_or_load((kind, value), lambda: KeyState(self.limits[kind], now))
+
+    def check(self, keys):
+        # keys: [(kind, value)], e.g. [("account", username), ("ip", source_ip)].
+        # Raises Throttled before any password work when a key is over its limits.
+        try:
+            for kind, value in keys:
+                self.check_key(kind, value)
+        except Throttled as e:
+            self.count("throttled_" + e.reason)
+            raise
+        self.count("allowed")
+
+    def check_key(self, kind, value):
+        state = self.state(kind, value)
+        with state.lock:
+            now = time.time()
+            locked_until = state.locked_until()
+            if locked_until > now:
+                raise Throttled("backoff", locked_until - now)
+            state.refill(now)
+            if state.tokens < 1:
+                raise Throttled("local", (1 - state.tokens) / state.limits["rate"])
+            if state.shared_attempts + state.pending >= state.limits["window_limit"]:
+                raise Throttled("shared", LOGIN_THROTTLE_WINDOW - now % LOGIN_THROTTLE_WINDOW)
+            state.tokens -= 1
+            state.pending += 1
+            if state.pending >= LOGIN_THROTTLE_SYNC_BATCH or now - state.synced_at >= LOGIN_THROTTLE_SYNC_INTERVAL:
+                self.sync(kind, value, state, now)
+                if state.shared_attempts > state.limits["window_limit"]:
+                    raise Throttled("shared", LOGIN_THROTTLE_WINDOW - now % LOGIN_THROTTLE_WINDOW)
+                locked_until = state.locked_until()
+                if locked_until > now:
+                    raise Throttled("backoff", locked_until - now)
+
+    def record_failure(self, keys):
+        self.count("failures")
+        for kind, value in keys:
+            state = self.state(kind, value)
+            with state.lock:
+                now = time.time()
+                state.failures += 1
+                state.last_failure_at = now
+                self.sync(kind, value, state, now, failed=True)
+
+    def record_success(self, keys):
+        # Only the account is forgiven, a source IP keeps its failure history
+        for kind, value in keys:
+            if kind != "account":
+                continue
+            state = self.state(kind, value)
+            with state.lock:
+                if not state.failures:
+                    continue
+                state.failures = 0
+                state.last_failure_at = 0.0
+                if self.table_name:
+                    try:
+                        aws.resource("dynamodb").Table(self.table_name).update_item(
+                            Key={"throttle_key": f"{kind}#{value}"},
+                            UpdateExpression="REMOVE failures, last_failure_at",
+                        )
+                    except Exception as e:
+                        self.count("sync_errors")
+                        print("Login throttle reset failed:", e)
+
+    def record_verify(self, duration_ms):
+        # Average bcrypt time, used to estimate the CPU each throttled attempt saved
+        with self.counters_lock:
+            self.counters["verify_count"] += 1
+            self.counters["verify_ms_total"] += duration_ms
+
+    def sync(self, kind, value, state, now, failed=False):
+        # One atomic update: add this instance's pending attempts to the current
+        # window, drop the window before the previous one and read back the
+        # shared totals. Failing open keeps logins working if the table is down.
+        state.synced_at = now
+        if not self.table_name:
+            state.pending = 0
+            return
+        window = int(now // LOGIN_THROTTLE_WINDOW)
+        update = "ADD #cur :pending SET expires_at = :expires REMOVE #old"
+        values = {
+            ":pending": state.pending,
+            ":expires": int(now + 2 * LOGIN_THROTTLE_WINDOW + LOGIN_BACKOFF_MAX),
+        }
+        if failed:
+            update = "ADD #cur :pending, failures :one SET expires_at = :expires, last_failure_at = :now REMOVE #old"
+            values.update({":one": 1, ":now": Decimal(str(round(now, 3)))})
+        try:
+            response = aws.resource("dynamodb").Table(self.table_name).update_item(
+                Key={"throttle_key": f"{kind}#{value}"},
+                UpdateExpression=update,
+                ExpressionAttributeNames={"#cur": f"w{window}", "#old": f"w{window - 2}"},
+                ExpressionAttributeValues=values,
+                ReturnValues="ALL_NEW",
+            )
+        except Exception as e:
+            self.count("sync_errors")
+            print("Login throttle sync failed:", e)
+            return
+        self.count("syncs")
+        item = response.get("Attributes", {})
+        state.pending = 0
+        # Sliding window estimate: the previous window weighted by how much of it still overlaps
+        overlap = 1 - (now % LOGIN_THROTTLE_WINDOW) / LOGIN_THROTTLE_WINDOW
+        state.shared_attempts = float(item.get(f"w{window}", 0)) + float(item.get(f"w{window - 1}", 0)) * overlap
+        state.failures = int(item.get("failures", 0))
+        state.last_failure_at = float(item.get("last_failure_at", 0))
+
+    def stats(self):
+        with self.counters_lock:
+            stats = dict(self.counters)
+        throttled = stats["throttled_local"] + stats["throttled_shared"] + stats["throttled_backoff"]
+        average_verify_ms = stats["verify_ms_total"] / stats["verify_count"] if stats["verify_count"] else 0.0
+        stats["throttled"] = throttled
+        stats["average_verify_ms"] = round(average_verify_ms, 2)
+        stats["verify_ms_saved"] = round(throttled * average_verify_ms, 2)
+        stats["tracked_keys"] = self.states.stats()["size"]
+        return stats
+
+    def log_stats(self, force=False):
+        # One structured line per interval per container, picked up by a log metric filter
+        now = time.monotonic()
+        if not force and now - self.stats_logged_at < LOGIN_THROTTLE_STATS_INTERVAL:
+            return
+        self.stats_logged_at = now
+        print(json.dumps({"login_throttle": self.stats()}))
+
+
+login_throttle = LoginThrottle()
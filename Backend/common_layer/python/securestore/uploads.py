@@ -0,0 +1,69 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from securestore import metrics
+
+# S3 requires every part but the last to be at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = max(MIN_PART_SIZE, int(os.environ.get("UPLOAD_PART_SIZE", str(8 * 1024 * 1024))))
+PARTS_IN_FLIGHT = int(os.environ.get("UPLOAD_PARTS_IN_FLIGHT", "4"))
+
+
+def iter_parts(pieces, part_size):
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= part_size:
+            yield bytes(buffer)
+            buffer = bytearray()
+    if buffer:
+        yield bytes(buffer)
+
+
+def upload_stream(s3_client, bucket_name, key, pieces, part_size=PART_SIZE, parts_in_flight=PARTS_IN_FLIGHT, **extra_args):
+    # Uploads a byte stream to S3. A stream that fits in one part is sent with a
+    # single put_object; anything larger becomes a multipart upload with up to
+    # `parts_in_flight` parts uploading at once, so memory stays at roughly
+    # (parts_in_flight + 1) * part_size whatever the object size.
+    parts = iter_parts(pieces, part_size)
+    first = next(parts, b"")
+    second = next(parts, None)
+    if second is None:
+        response = s3_client.put_object(Bucket=bucket_name, Key=key, Body=first, **extra_args)
+        return {"ETag": response.get("ETag"), "Size": len(first), "VersionId": response.get("VersionId")}
+
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key, **extra_args)["UploadId"]
+
+    def upload_part(number, data):
+        response = s3_client.upload_part(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=number, Body=data
+        )
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    completed = []
+    in_flight = deque()
+    size = 0
+    try:
+        with ThreadPoolExecutor(max_workers=parts_in_flight) as executor:
+            for number, data in enumerate(chain_parts(first, second, parts), start=1):
+                if len(in_flight) >= parts_in_flight:
+                    completed.append(in_flight.popleft().result())
+                in_flight.append(executor.submit(metrics.bind(upload_part), number, data))
+                size += len(data)
+            while in_flight:
+                completed.append(in_flight.popleft().result())
+
+        response = s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": completed}
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+        raise
+
+    return {"ETag": response.get("ETag"), "Size": size, "VersionId": response.get("VersionId")}
+
+
+def chain_parts(first, second, rest):
+    yield first
+    yield second
+    yield from rest
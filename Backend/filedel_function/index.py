@@ -1,13 +1,167 @@
 import os
-import boto3
 import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from securestore import aws, dedup, keys, layout, manifest, metrics
+from securestore.responses import json_response
 
+# Bulk delete: DeleteObjects takes at most 1000 keys per request, several
+# requests run at once
+DELETE_BATCH_SIZE = 1000
+DELETE_CONCURRENCY = int(os.environ.get("DELETE_CONCURRENCY", "4"))
+# Chunk manifests of deduplicated files read in parallel within one batch
+MANIFEST_READ_CONCURRENCY = int(os.environ.get("MANIFEST_READ_CONCURRENCY", "8"))
+MAX_BULK_FILE_NAMES = int(os.environ.get("MAX_BULK_FILE_NAMES", "10000"))
+# In a versioned bucket a delete only adds a delete marker, bulk deletes then
+# remove every version and marker of the files they match
+BUCKET_VERSIONED = os.environ.get("S3_BUCKET_VERSIONED", "false").lower() == "true"
+# A bulk delete stops queueing batches with this much time left and reports
+# complete: false, the client repeats the request to continue. The time left
+# is the function's own or the HTTP API's 30 s integration limit, whichever
+# ends first.
+TIME_MARGIN_MS = int(os.environ.get("DELETE_TIME_MARGIN_MS", "3000"))
+API_TIME_LIMIT_MS = 29000
+
+
+def list_versions(s3_client, bucket_name, prefix):
+    # Every version and delete marker under the prefix, newest first per key
+    paginator = s3_client.get_paginator("list_object_versions")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        entries = page.get("Versions", []) + page.get("DeleteMarkers", [])
+        for entry in entries:
+            yield entry["Key"], entry["VersionId"], entry.get("IsLatest", False) and "Size" in entry
+
+
+def iter_targets(s3_client, bucket_name, folder_path, file_names=None, prefix=None):
+    # (key, version id or None, is the current object) for everything to delete
+    if file_names is not None:
+        for file_name in file_names:
+            object_key = f"{folder_path}{file_name}"
+            if not BUCKET_VERSIONED:
+                yield object_key, None, True
+                continue
+            # A key prefix also matches longer names, keep exact matches only
+            for key, version_id, current in list_versions(s3_client, bucket_name, object_key):
+                if key == object_key:
+                    yield key, version_id, current
+        return
+    if BUCKET_VERSIONED:
+        yield from list_versions(s3_client, bucket_name, f"{folder_path}{prefix}")
+        return
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=f"{folder_path}{prefix}"):
+        for obj in page.get("Contents", []):
+            yield obj["Key"], None, True
+
+
+def delete_batch(s3_client, bucket_name, username, batch):
+    # One DeleteObjects request; returns the failures as
+    # {"Key", "VersionId", "Code", "Message"} dicts
+    chunk_manifests = {}
+    if dedup.CHUNK_REF_TABLE_NAME:
+        # Deduplicated files hold references on their chunks, read their
+        # manifests before the objects go away
+        current_keys = [key for key, _, current in batch if current]
+        secret_key = keys.get_storage_key()
+
+        def load(key):
+            return dedup.load_manifest(secret_key, s3_client, bucket_name, key)
+
+        with ThreadPoolExecutor(max_workers=MANIFEST_READ_CONCURRENCY) as executor:
+            loaded = executor.map(metrics.bind(load), current_keys)
+            chunk_manifests = {key: found for key, found in zip(current_keys, loaded) if found is not None}
+
+    objects = [{"Key": key, "VersionId": version_id} if version_id else {"Key": key} for key, version_id, _ in batch]
+    try:
+        response = s3_client.delete_objects(Bucket=bucket_name, Delete={"Objects": objects, "Quiet": True})
+        errors = response.get("Errors", [])
+    except Exception as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code", type(e).__name__)
+        errors = [{**entry, "Code": code, "Message": str(e)} for entry in objects]
+
+    failed = {error["Key"] for error in errors}
+    for key, chunk_manifest in chunk_manifests.items():
+        if key in failed:
+            continue
+        try:
+            # Garbage-collect chunks no other file of this user still uses
+            dedup.release_chunks(bucket_name, username, chunk_manifest, key)
+        except Exception:
+            traceback.print_exc()
+    return errors
+
+
+def bulk_delete(context, s3_client, bucket_name, username, file_names=None, prefix=None):
+    # Deletes a list of files or everything under a prefix of the user's
+    # folder, DELETE_BATCH_SIZE keys per request, and reports per file
+    folder_path = f"{username}/"
+    targeted = {}
+    errors = []
+    complete = True
+
+    deadline = None
+    if context is not None:
+        budget_ms = min(context.get_remaining_time_in_millis(), API_TIME_LIMIT_MS) - TIME_MARGIN_MS
+        deadline = time.monotonic() + budget_ms / 1000
+
+    def out_of_time():
+        return deadline is not None and time.monotonic() >= deadline
+
+    with ThreadPoolExecutor(max_workers=DELETE_CONCURRENCY) as executor:
+        futures = []
+        batch = []
+        for key, version_id, current in iter_targets(s3_client, bucket_name, folder_path, file_names, prefix):
+            targeted[key[len(folder_path):]] = True
+            batch.append((key, version_id, current))
+            if len(batch) == DELETE_BATCH_SIZE:
+                futures.append(executor.submit(metrics.bind(delete_batch), s3_client, bucket_name, username, batch))
+                batch = []
+                if out_of_time():
+                    complete = False
+                    break
+        if batch:
+            futures.append(executor.submit(metrics.bind(delete_batch), s3_client, bucket_name, username, batch))
+        for future in futures:
+            errors.extend(future.result())
+
+    failed = set()
+    results = []
+    for error in errors:
+        file_name = error["Key"][len(folder_path):]
+        failed.add(file_name)
+        result = {"file_name": file_name, "code": error.get("Code"), "message": error.get("Message")}
+        if error.get("VersionId"):
+            result["version_id"] = error["VersionId"]
+        results.append(result)
+    deleted = [file_name for file_name in targeted if file_name not in failed]
+
+    manifest.remove_files_safely(username, deleted)
+
+    return json_response(
+        200 if not results else 207,
+        {
+            "message": f"{len(deleted)} file(s) removed, {len(failed)} failed.",
+            "deleted": deleted,
+            "errors": results,
+            "complete": complete,
+        },
+    )
+
+
+@metrics.instrument
 def handler(event, context):
     try:
         # Handles file removal from S3
         body = json.loads(event["body"])
-        username = body["username"]
-        filename = body["filename"]
+
+        # Deletes are limited to the authorized user's own folder
+        authorizer_context = event.get("requestContext", {}).get("authorizer", {}).get("lambda", {})
+        username = authorizer_context.get("userId") or body["username"]
+        if body.get("username", username) != username:
+            return json_response(403, {"message": "You can only delete your own files."})
+        if not layout.is_valid_username(username):
+            return json_response(400, {"message": "Invalid username."})
 
         # Get the S3 bucket name from the environment variable
         bucket_name = os.environ.get("S3_BUCKET_NAME")
@@ -20,17 +174,52 @@ def handler(event, context):
                 },
             }
 
+        if "filenames" in body or "prefix" in body:
+            # Bulk delete: a list of file names or every file under a prefix
+            file_names = body.get("filenames")
+            prefix = body.get("prefix")
+            if (file_names is None) == (prefix is None):
+                return json_response(400, {"message": "Specify either filenames or prefix."})
+            if file_names is not None and (
+                not isinstance(file_names, list) or not all(isinstance(name, str) and name for name in file_names)
+            ):
+                return json_response(400, {"message": "filenames must be a list of file names."})
+            if file_names is not None and len(file_names) > MAX_BULK_FILE_NAMES:
+                return json_response(400, {"message": f"At most {MAX_BULK_FILE_NAMES} file names per request."})
+            if prefix is not None and not isinstance(prefix, str):
+                return json_response(400, {"message": "prefix must be a string."})
+            if prefix == "" and body.get("allFiles") is not True:
+                # An empty prefix matches the whole folder, only on explicit request
+                return json_response(400, {"message": "An empty prefix deletes every file, set allFiles: true to confirm."})
+            return bulk_delete(
+                context, aws.client("s3"), bucket_name, username,
+                list(dict.fromkeys(file_names)) if file_names is not None else None, prefix,
+            )
+
+        filename = body["filename"]
+
         # Replace 'your_folder_path/' with the specific folder path (prefix)
         folder_path = f"{username}/"
 
         # Construct the full S3 object key for the file to be removed
         object_key = f"{folder_path}{filename}"
 
-        s3_client = boto3.client("s3")
+        s3_client = aws.client("s3")
+
+        # Deduplicated files hold references on their chunks
+        chunk_manifest = None
+        if dedup.CHUNK_REF_TABLE_NAME:
+            chunk_manifest = dedup.load_manifest(keys.get_storage_key(), s3_client, bucket_name, object_key)
 
         # Delete the specified object (file) from the S3 bucket
         s3_client.delete_object(Bucket=bucket_name, Key=object_key)
 
+        if chunk_manifest is not None:
+            # Garbage-collect chunks no other file of this user still uses
+            dedup.release_chunks(bucket_name, username, chunk_manifest, object_key)
+
+        manifest.remove_files_safely(username, [filename])
+
         return {
             "statusCode": 200,
             "body": json.dumps({"message": f"File {filename} removed successfully."}),
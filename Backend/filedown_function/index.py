@@ -1,57 +1,166 @@
 import os
 import json
+import re
 import base64
-import boto3
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
-
-def get_secret():
-    # Utility function to retrieve the S3 master key from AWS Secrets Manager
-    secret_name = os.environ.get("S3_MASTER_KEY_SECRET_NAME")
-    if not secret_name:
-        raise Exception("S3_MASTER_KEY_SECRET_NAME environment variable not set.")
-    
-    region_name = "us-east-1"
-
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
-
+from securestore import aws, container, keys, layout, metrics, storage
+
+# Download streaming: S3 read size and the largest body a Lambda response can carry
+READ_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_READ_CHUNK_SIZE", str(256 * 1024)))
+MAX_RESPONSE_BYTES = int(os.environ.get("MAX_RESPONSE_BYTES", str(6 * 1024 * 1024 - 64 * 1024)))
+# Ranged responses are base64-encoded, 4 characters for every 3 bytes
+MAX_RANGE_BYTES = MAX_RESPONSE_BYTES // 4 * 3
+
+def stream_file_content(secret_key, streaming_body, metadata=None, chunk_size=READ_CHUNK_SIZE):
+    # Pull the S3 StreamingBody in fixed-size chunks and yield the uploaded
+    # content as soon as each container chunk is authenticated. The format is
+    # detected from the first bytes, older objects go through legacy readers.
+    return metrics.iterate("decrypt", storage.read_stream(secret_key, streaming_body.iter_chunks(chunk_size), metadata))
+
+
+def response_size(stored_size, metadata):
+    # Uncompressed content is never larger than the stored object, except that
+    # a payload stored base64-decoded grows by a third when it is re-encoded.
+    # Compressed payloads are checked again while they stream.
+    if (metadata or {}).get(storage.PAYLOAD_ENCODING_KEY) == storage.PAYLOAD_ENCODING_BASE64:
+        return -(-stored_size // 3) * 4
+    return stored_size
+
+
+def parse_range(range_header, size):
+    # HTTP-style "bytes=start-end", "bytes=start-" or "bytes=-suffix" against a
+    # plaintext of `size` bytes, returned as an inclusive (start, end) pair
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or match.groups() == ("", ""):
+        raise ValueError(f"Invalid range: {range_header}")
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(f"Range not satisfiable for a file of {size} bytes: {range_header}")
+    # Never return more than fits in one Lambda response, Content-Range tells the client where to resume
+    return start, min(end, start + MAX_RANGE_BYTES - 1)
+
+
+def with_storage_key(download, *args):
+    # The master key is fetched on first use, not at import. A chunk failing
+    # authentication can mean the secret was rotated since it was cached, so
+    # it is re-read once before the error is returned.
     try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
-
-    # Decrypts secret using the associated KMS key.
-    secret = get_secret_value_response["SecretString"]
-    # Ensure the key is of the correct length (e.g., AES-256 key length)
-    s3_master_key = secret.encode("utf-8")[:32]  # Use first 32 bytes for AES-256
-    return s3_master_key
-
-# Get the S3 master key
-SECRET_KEY = get_secret()
-
-def decrypt_file_content(encrypted_text):
-    # Extract the IV from the encrypted text (first AES.block_size bytes)
-    iv = encrypted_text[: AES.block_size]
-
-    # Create the cipher object with AES mode and CBC (Cipher Block Chaining) padding
-    cipher = AES.new(SECRET_KEY, AES.MODE_CBC, iv)
-
-    try:
-        # Decrypt the ciphertext and remove padding
-        decrypted_text = unpad(
-            cipher.decrypt(encrypted_text[AES.block_size :]), AES.block_size
-        )
-        return decrypted_text
-    except Exception as e:
-        print("Decryption error:", e)
-        raise e
+        return download(keys.get_storage_key(), *args)
+    except container.ContainerError:
+        if not keys.refresh_master_secret():
+            raise
+        return download(keys.get_storage_key(), *args)
+
+
+def ranged_download(secret_key, s3_client, bucket_name, s3_key, range_header):
+    # Serves a plaintext byte range with S3 Range GETs: the container header
+    # first, then only the chunks that overlap the range
+    head = s3_client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes=0-{container.HEADER_SIZE - 1}")
+    total_size = int(head["ContentRange"].rsplit("/", 1)[1])
+    head_bytes = head["Body"].read()
+    stored_format = storage.detect_format(head_bytes)
+
+    if stored_format == storage.FORMAT_CONTAINER and not storage.is_transformed(head.get("Metadata")):
+        header = container.parse_header(head_bytes)
+        size = container.plaintext_size(total_size, header.chunk_size)
+        encoded = (head.get("Metadata") or {}).get(storage.PAYLOAD_ENCODING_KEY) == storage.PAYLOAD_ENCODING_BASE64
+        if encoded:
+            # Stored base64-decoded, while the client gets the re-encoded text:
+            # the range applies to that text, so the 3-byte groups behind its
+            # 4-character groups are decrypted and encoded again
+            binary_size = size
+            size = -(-binary_size // 3) * 4
+            start, end = parse_range(range_header, size)
+            plain_start, plain_end = start // 4 * 3, min(end // 4 * 3 + 2, binary_size - 1)
+        else:
+            start, end = parse_range(range_header, size)
+            plain_start, plain_end = start, end
+        _, _, _, stored_start, stored_end = container.chunk_span(header, total_size, plain_start, plain_end)
+        part = s3_client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes={stored_start}-{stored_end}")
+        pieces = metrics.iterate("decrypt", container.decrypt_range(
+            secret_key, header, total_size, plain_start, plain_end, part["Body"].iter_chunks(READ_CHUNK_SIZE)
+        ))
+        if encoded:
+            text_start = start // 4 * 4
+            pieces = [base64.b64encode(b"".join(pieces))[start - text_start : end - text_start + 1]]
+    elif stored_format == storage.FORMAT_CLIENT_TEXT:
+        # Client text stored before the container is served as stored, so the
+        # requested range maps one to one onto the object
+        size = total_size
+        start, end = parse_range(range_header, size)
+        part = s3_client.get_object(Bucket=bucket_name, Key=s3_key, Range=f"bytes={start}-{end}")
+        pieces = part["Body"].iter_chunks(READ_CHUNK_SIZE)
+    else:
+        # Compressed payloads and legacy whole-file CBC objects cannot be
+        # seeked: decrypt (and decompress) everything, then slice
+        response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+        content = b"".join(stream_file_content(secret_key, response["Body"], response.get("Metadata")))
+        size = len(content)
+        start, end = parse_range(range_header, size)
+        pieces = [content[start : end + 1]]
+
+    file_data = bytearray()
+    for chunk in pieces:
+        file_data += chunk
+
+    return {
+        "statusCode": 206,
+        "body": base64.b64encode(file_data).decode("utf-8"),
+        "isBase64Encoded": True,
+        "headers": {
+            "Content-Type": "application/octet-stream",
+            "Content-Range": f"bytes {start}-{end}/{size}",
+        },
+    }
+
+
+def full_download(secret_key, s3_client, bucket_name, s3_key):
+    # Whole-file download, bounded by what fits in one Lambda response
+    response = s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+    if response_size(response["ContentLength"], response.get("Metadata")) > MAX_RESPONSE_BYTES:
+        response["Body"].close()
+        return {
+            "statusCode": 413,
+            "body": json.dumps({"message": "File is too large to download in a single response."}),
+            "headers": {"Content-Type": "application/json"},
+        }
 
+    # Decrypt as the object streams in, only the output buffer grows with the file
+    file_data = bytearray()
+    for chunk in stream_file_content(secret_key, response["Body"], response.get("Metadata")):
+        file_data += chunk
+        if len(file_data) > MAX_RESPONSE_BYTES:
+            # Compressed payloads can expand past the size checked above
+            response["Body"].close()
+            return {
+                "statusCode": 413,
+                "body": json.dumps({"message": "File is too large to download in a single response."}),
+                "headers": {"Content-Type": "application/json"},
+            }
+
+    return {
+        "statusCode": 200,
+        "body": file_data.decode("utf-8"),
+        "headers": {"Content-Type": "application/json"},
+    }
+
+
+@metrics.instrument
 def handler(event, context):
     # Handles file download from S3 with decryption
     body = json.loads(event["body"])
     username = body["username"]
     file_name = body["file_name"]
+    if not layout.is_valid_username(username):
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"message": "Invalid username."}),
+            "headers": {"Content-Type": "application/json"},
+        }
 
     # Retrieve the encrypted file from S3
     s3_bucket_name = os.environ.get("S3_BUCKET_NAME")
@@ -65,18 +174,27 @@ def handler(event, context):
         }
     
     s3_key = f"{username}/{file_name}"
-    s3_client = boto3.client("s3")
+    s3_client = aws.client("s3")
+
+    if body.get("range"):
+        # Preview and resume: only the chunks covering the range are fetched and decrypted
+        try:
+            return with_storage_key(ranged_download, s3_client, s3_bucket_name, s3_key, body["range"])
+        except ValueError as e:
+            return {
+                "statusCode": 416,
+                "body": json.dumps({"message": str(e)}),
+                "headers": {"Content-Type": "application/json"},
+            }
+        except Exception as e:
+            return {
+                "statusCode": 500,
+                "body": json.dumps({"message": f"Error downloading file: {str(e)}"}),
+                "headers": {"Content-Type": "application/json"},
+            }
 
     try:
-        response = s3_client.get_object(Bucket=s3_bucket_name, Key=s3_key)
-        encrypted_data = response["Body"].read()
-        # Return the status in the response
-        response = {
-            "statusCode": 200,
-            "body": encrypted_data,
-            "headers": {"Content-Type": "application/json"},
-        }
-
+        response = with_storage_key(full_download, s3_client, s3_bucket_name, s3_key)
     except Exception as e:
         message = f"Error downloading file: {str(e)}"
         status_code = 500
@@ -85,19 +203,5 @@ def handler(event, context):
             "body": json.dumps({"message": message}),
             "headers": {"Content-Type": "application/json"},
         }
-        return response
-
-    try:
-        # Base64 decode the encrypted data before decryption
-        encrypted_data_decoded = base64.b64decode(encrypted_data)
-
-        # Decrypt the file content
-        decrypted_file_content = decrypt_file_content(encrypted_data_decoded)
-
-        message = "File decrypted and downloaded successfully."
-        status_code = 200
-    except Exception as e:
-        message = f"Error: {str(e)}"
-        status_code = 500
 
     return response
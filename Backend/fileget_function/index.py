@@ -1,13 +1,131 @@
 import os
-import boto3
 import json
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from securestore import aws, keys, layout, manifest, metrics, storage
 
+# Page size bounds for metadata listing (S3 returns at most 1000 keys per call)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Bulk content fetch: parallel GETs and a byte budget kept below the 6 MB Lambda response limit
+BULK_FETCH_CONCURRENCY = int(os.environ.get("BULK_FETCH_CONCURRENCY", "8"))
+BULK_FETCH_BYTE_BUDGET = int(os.environ.get("BULK_FETCH_BYTE_BUDGET", str(4 * 1024 * 1024)))
+
+
+def parse_page_size(page_size):
+    if page_size is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+
+def list_file_metadata(s3_client, bucket_name, folder_path, page_size, cursor=None):
+    # Single list_objects_v2 call: no object bodies are read, so the cost of a
+    # page does not depend on how many files or bytes the user has stored
+    params = {"Bucket": bucket_name, "Prefix": folder_path, "MaxKeys": page_size}
+    if cursor:
+        params["ContinuationToken"] = cursor
+    response = s3_client.list_objects_v2(**params)
+
+    files = []
+    for obj in response.get("Contents", []):
+        files.append(
+            {
+                "key": obj["Key"],
+                "name": obj["Key"][len(folder_path):],
+                "size": obj["Size"],
+                "last_modified": obj["LastModified"].isoformat(),
+                "etag": obj["ETag"].strip('"'),
+            }
+        )
+
+    return {
+        "files": files,
+        "next_cursor": response.get("NextContinuationToken") if response.get("IsTruncated") else None,
+    }
+
+
+def decode_file_content(data, metadata=None):
+    # Whatever the stored format, hand back the content as it was uploaded
+    with metrics.stage("decrypt") as stage:
+        content = b"".join(storage.read_stream(keys.get_storage_key(), [data], metadata))
+        stage.bytes = len(content)
+    return content
+
+
+def fetch_object_body(s3_client, bucket_name, key, byte_budget):
+    obj_data = s3_client.get_object(Bucket=bucket_name, Key=key)
+    if obj_data["ContentLength"] > byte_budget:
+        obj_data["Body"].close()
+        raise Exception("File exceeds the per-request byte budget")
+    # Decrypting on the worker thread keeps the decode parallel as well
+    return decode_file_content(obj_data["Body"].read(), obj_data.get("Metadata"))
+
+
+def fetch_file_contents(s3_client, bucket_name, folder_path, file_names, start, byte_budget, concurrency):
+    # Fetch the requested files on a bounded thread pool. Results are consumed in
+    # request order so the response is stable; once the next file would push the
+    # response over the byte budget we stop and hand back its index as the cursor.
+    files = []
+    used_bytes = 0
+    next_cursor = None
+    pending = deque()
+    next_index = start
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def submit_more():
+        nonlocal next_index
+        while next_index < len(file_names) and len(pending) < concurrency:
+            key = f"{folder_path}{file_names[next_index]}"
+            future = executor.submit(metrics.bind(fetch_object_body), s3_client, bucket_name, key, byte_budget)
+            pending.append((next_index, future))
+            next_index += 1
+
+    try:
+        submit_more()
+        while pending:
+            index, future = pending.popleft()
+            file_name = file_names[index]
+            try:
+                content = future.result()
+            except Exception as e:
+                # A failed key is reported on its own and does not fail the batch
+                files.append({"name": file_name, "error": str(e)})
+                submit_more()
+                continue
+
+            if len(content) > byte_budget:
+                files.append({"name": file_name, "error": "File exceeds the per-request byte budget"})
+                submit_more()
+                continue
+            if used_bytes + len(content) > byte_budget:
+                next_cursor = index
+                break
+            used_bytes += len(content)
+            files.append({"name": file_name, "content": content.decode("utf-8")})
+            submit_more()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return {"files": files, "next_cursor": next_cursor, "bytes": used_bytes}
+
+
+@metrics.instrument
 def handler(event, context):
     try:
         # Handles file download from S3 with decryption
         body = json.loads(event["body"])
         username = body["username"]
+        if not layout.is_valid_username(username):
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"message": "Invalid username."}),
+                "headers": {
+                    "Content-Type": "application/json"  # Set the response content type to JSON
+                },
+            }
 
         # Get the S3 bucket name from the environment variable
         bucket_name = os.environ.get("S3_BUCKET_NAME")
@@ -23,7 +141,66 @@ def handler(event, context):
         # Replace 'your_folder_path/' with the specific folder path (prefix)
         folder_path = f"{username}/"
 
-        s3_client = boto3.client("s3")
+        s3_client = aws.client("s3")
+
+        mode = body.get("mode", "content")
+        if mode == "list":
+            # Metadata-only listing, one page per request
+            page_size = parse_page_size(body.get("page_size"))
+            files_page = list_file_metadata(
+                s3_client, bucket_name, folder_path, page_size, body.get("cursor")
+            )
+            return {
+                "statusCode": 200,
+                "body": json.dumps(files_page),
+                "headers": {
+                    "Content-Type": "application/json"  # Set the response content type to JSON
+                },
+            }
+        if mode in ("manifest", "usage", "exists"):
+            # Single-partition queries against the per-user manifest table
+            if mode == "manifest":
+                result = manifest.list_files(
+                    username,
+                    parse_page_size(body.get("page_size")),
+                    body.get("cursor"),
+                    body.get("prefix"),
+                )
+            elif mode == "usage":
+                result = manifest.usage_totals(username)
+            else:
+                item = manifest.get_file(username, body["file_name"])
+                result = {"exists": item is not None, "file": manifest.to_json(item) if item else None}
+            return {
+                "statusCode": 200,
+                "body": json.dumps(result),
+                "headers": {
+                    "Content-Type": "application/json"  # Set the response content type to JSON
+                },
+            }
+        if mode == "bulk":
+            # Parallel content fetch of the requested file names, resumable with the cursor
+            file_names = body["file_names"]
+            if not isinstance(file_names, list):
+                return {"statusCode": 400, "body": "file_names must be a list"}
+            files_page = fetch_file_contents(
+                s3_client,
+                bucket_name,
+                folder_path,
+                file_names,
+                int(body.get("cursor") or 0),
+                BULK_FETCH_BYTE_BUDGET,
+                BULK_FETCH_CONCURRENCY,
+            )
+            return {
+                "statusCode": 200,
+                "body": json.dumps(files_page),
+                "headers": {
+                    "Content-Type": "application/json"  # Set the response content type to JSON
+                },
+            }
+        if mode != "content":
+            return {"statusCode": 400, "body": f"Unsupported mode: {mode}"}
 
         # Get the list of objects in the specified folder of the S3 bucket
         response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=folder_path)
@@ -35,7 +212,7 @@ def handler(event, context):
         for obj in response.get("Contents", []):
             key = obj["Key"]
             obj_data = s3_client.get_object(Bucket=bucket_name, Key=key)
-            content = obj_data["Body"].read().decode("utf-8")
+            content = decode_file_content(obj_data["Body"].read(), obj_data.get("Metadata")).decode("utf-8")
 
             # Store the file name as the key and the content as the value in the form data dictionary
             files_data[key] = content
@@ -51,6 +228,10 @@ def handler(event, context):
         # Handle missing keys in the body or response['Contents']
         error_message = f"KeyError: {ke}"
         return {"statusCode": 400, "body": error_message}
+    except ValueError as ve:
+        # Handle a page_size that is not a number
+        error_message = f"ValueError: {ve}"
+        return {"statusCode": 400, "body": error_message}
     except Exception as e:
         # Log any other unexpected exception
         error_message = f"An error occurred: {str(e)}"
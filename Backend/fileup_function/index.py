@@ -1,99 +1,109 @@
 import os
 import json
 import base64
-import boto3
-import cgi
-from io import BytesIO
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad
-from Crypto.Random import get_random_bytes
-from botocore.exceptions import ClientError
-
-def get_secret():
-    # Utility function to retrieve the S3 master key from AWS Secrets Manager
-    secret_name = os.environ.get("S3_MASTER_KEY_SECRET_NAME")
-    if not secret_name:
-        raise Exception("S3_MASTER_KEY_SECRET_NAME environment variable not set.")
-    
-    region_name = "us-east-1"
-
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        raise e
-
-    # Decrypts secret using the associated KMS key.
-    secret = get_secret_value_response["SecretString"]
-    # Ensure the key is of the correct length (e.g., AES-256 key length)
-    s3_master_key = secret.encode("utf-8")[:32]  # Use first 32 bytes for AES-256
-    return s3_master_key
-
-# Get the S3 master key
-SECRET_KEY = get_secret()
-
-def encrypt_file_content(plain_text):
-    # Generate a random initialization vector (IV)
-    iv = get_random_bytes(AES.block_size)
+from securestore import aws, container, dedup, keys, layout, manifest, metrics, multipart, storage, uploads
 
-    # Create the cipher object with AES mode and CBC (Cipher Block Chaining) padding
-    cipher = AES.new(SECRET_KEY, AES.MODE_CBC, iv)
+# Largest file part accepted by the upload endpoint
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
 
-    # Pad the plaintext to match the block size of the cipher
-    padded_plain_text = pad(plain_text, AES.block_size)
+def encrypt_file_content(secret_key, chunks):
+    # Seal the plaintext chunks into the chunked AES-GCM container, lazily,
+    # so the S3 upload pulls ciphertext as it goes and memory stays flat
+    return metrics.iterate("encrypt", container.encrypt_stream(secret_key, chunks))
 
-    # Perform the encryption
-    encrypted_text = cipher.encrypt(padded_plain_text)
+def error_response(status_code, message):
+    return {
+        "statusCode": status_code,
+        "body": json.dumps({"message": message}),
+        "headers": {"Content-Type": "application/json"},
+    }
 
-    # Return the IV concatenated with the encrypted text
-    return base64.b64encode(iv + encrypted_text)
 
+@metrics.instrument
 def handler(event, context):
-    # Decode the base64-encoded body
-    body = base64.b64decode(event["body"])
+    # Reject oversized uploads before decoding anything
+    if len(event["body"]) * 3 // 4 > MAX_UPLOAD_BYTES + 64 * 1024:
+        return error_response(413, f"File exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes.")
 
-    # Create a file-like object from the body bytes
-    body_file = BytesIO(body)
+    # Decode the base64-encoded body, the only full copy of the payload
+    with metrics.stage("decode_body") as stage:
+        body = base64.b64decode(event["body"])
+        stage.bytes = len(body)
 
-    # Parse the multipart form data
-    environ = {
-        "REQUEST_METHOD": "POST",
-        "CONTENT_TYPE": event["headers"]["content-type"],
-    }
-    form = cgi.FieldStorage(fp=body_file, environ=environ)
+    # Parse the multipart form data, parts are views into the decoded body
+    try:
+        with metrics.stage("parse_multipart"):
+            form = multipart.parse_form(body, event["headers"]["content-type"], MAX_UPLOAD_BYTES)
+    except multipart.PayloadTooLarge as e:
+        return error_response(413, str(e))
+    except multipart.MultipartError as e:
+        return error_response(400, str(e))
 
     # Retrieve the file field
     file_field = form["file"]
     file_name = form["filename"].value  # Retrieve the file name from the form data
-    content_type = file_field.type
-    file_content = file_field.file.read()
-    file_content_bytes = file_content.encode("utf-8")
-    
+    content_type = file_field.content_type
+
     # Get the username from the request
     username = form["username"].value
+    if not layout.is_valid_username(username):
+        return error_response(400, "Invalid username.")
 
-    # Encrypt the file content
-    encrypted_file_content = encrypt_file_content(file_content_bytes)
+    # Registration provisions keys asynchronously, uploads wait until they are ready
+    authorizer_context = event.get("requestContext", {}).get("authorizer", {}).get("lambda", {})
+    if authorizer_context.get("keyStatus") == "pending":
+        return error_response(409, "Encryption keys are still being provisioned, please retry shortly.")
 
     # Upload the encrypted file to S3
     s3_bucket_name = os.environ.get("S3_BUCKET_NAME")
     if not s3_bucket_name:
-        return {
-            "statusCode": 500,
-            "body": json.dumps({"message": "S3_BUCKET_NAME environment variable not set."}),
-            "headers": {
-                "Content-Type": "application/json"  # Set the response content type to JSON
-            },
-        }
+        return error_response(500, "S3_BUCKET_NAME environment variable not set.")
     
     s3_key = f"{username}/{file_name}"
-    s3_client = boto3.client("s3")
+    s3_client = aws.client("s3")
 
     try:
-        s3_client.put_object(
-            Bucket=s3_bucket_name, Key=s3_key, Body=file_content
+        # The master key is fetched on first use and cached, never at import
+        secret_key = keys.get_storage_key()
+
+        # A deduplicated file being overwritten gives up its chunk references once the new version is stored
+        previous_chunks = None
+        if dedup.CHUNK_REF_TABLE_NAME:
+            previous_chunks = dedup.load_manifest(secret_key, s3_client, s3_bucket_name, s3_key)
+
+        if dedup.DEDUP_ENABLED:
+            # Only chunks this user does not already have are encrypted and
+            # stored, the object itself is a small encrypted chunk manifest
+            payload, metadata = storage.pack_payload(file_field.data)
+            chunk_manifest, new_bytes = dedup.store_file(secret_key, s3_client, s3_bucket_name, username, payload)
+            metadata[dedup.LAYOUT_KEY] = dedup.LAYOUT_DEDUP
+            print(json.dumps({"dedup": {"size": len(payload), "new_bytes": new_bytes}}))
+            try:
+                put_response = uploads.upload_stream(
+                    s3_client, s3_bucket_name, s3_key, [dedup.encode_manifest(secret_key, chunk_manifest)], Metadata=metadata
+                )
+            except Exception:
+                # No manifest landed, so nothing holds the references just taken
+                dedup.release_chunks(s3_bucket_name, username, chunk_manifest, s3_key)
+                raise
+        else:
+            # Store the client's base64 text as binary, compress it when allowed,
+            # then encrypt it as a stream of chunks and upload it, in parts when large
+            payload, metadata = storage.prepare_payload(file_field.data, content_type)
+            encrypted_file_content = encrypt_file_content(secret_key, payload)
+            put_response = uploads.upload_stream(
+                s3_client, s3_bucket_name, s3_key, encrypted_file_content, Metadata=metadata
+            )
+
+        if previous_chunks is not None:
+            dedup.release_chunks(s3_bucket_name, username, previous_chunks, s3_key)
+        manifest.record_file_safely(
+            username,
+            file_name,
+            file_field.size,
+            put_response["Size"],
+            content_type,
+            (put_response.get("ETag") or "").strip('"') or None,
         )
         message = "File uploaded and encrypted successfully."
         status_code = 200
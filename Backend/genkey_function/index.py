@@ -1,37 +1,81 @@
 import os
 import json
 import hashlib
-import re
-import boto3
 import base64
 import secrets
+import functools
+import traceback
+from securestore import aws, keys, metrics
 
 # Get table name and lab role name from environment variables
 TABLE_NAME = os.environ.get("USER_TABLE_NAME")
 LAB_ROLE_NAME = os.environ.get("LAB_ROLE_NAME")
 
-dynamodb = boto3.resource("dynamodb")
-kms = boto3.client("kms")
+# "shared" wraps each user's DEK under a small pool of shared CMKs; "per-user"
+# keeps creating one CMK per user as before
+KEY_PROVISIONING_MODE = os.environ.get("KEY_PROVISIONING_MODE", "per-user")
+SHARED_CMK_IDS = [key_id.strip() for key_id in os.environ.get("SHARED_CMK_IDS", "").split(",") if key_id.strip()]
 
+dynamodb = aws.resource("dynamodb")
+kms = aws.client("kms")
+
+@metrics.instrument
 def handler(event, context):
+    # Queue worker: provisioning requests sent by RegisterFunction
+    if "Records" in event:
+        return process_provisioning_records(event["Records"])
+
     try:
-        username = event["username"]
-        encrypted_dek, cmk_alias = get_or_generate_encrypted_dek(username)
-        
-        return {
-            "encrypted_data_encryption_key": encrypted_dek,
-            "key_alias": cmk_alias,
-        }
+        return generate_key_material(event["username"])
     except Exception as e:
         error_message = f"Error generating CMK alias or checking DEK existence: {str(e)}"
         raise Exception(error_message) from e
 
-def clean_username_and_derive_cmk_alias(username):
-    clean_username = re.sub(r"[^a-zA-Z0-9]", "", username)
-    salt = hashlib.sha256(username.encode()).hexdigest()
-    salted_username = clean_username + salt
-    cmk_alias = hashlib.sha256(salted_username.encode()).hexdigest()
-    return clean_username, cmk_alias
+def generate_key_material(username):
+    if KEY_PROVISIONING_MODE == "shared":
+        return get_or_generate_shared_dek(username)
+
+    encrypted_dek, cmk_alias = get_or_generate_encrypted_dek(username)
+    
+    return {
+        "encrypted_data_encryption_key": encrypted_dek,
+        "key_alias": cmk_alias,
+    }
+
+def provision_user_keys(username):
+    # Generates the user's key material and marks the record ready. Safe to
+    # run twice for the same user: existing key material is reused.
+    key_material = generate_key_material(username)
+    update_expression = "SET Encrypted_DEK = :dek, KeyStatus = :ready"
+    values = {
+        ":dek": key_material["encrypted_data_encryption_key"],
+        ":ready": keys.KEY_STATUS_READY,
+    }
+    if key_material.get("key_scheme"):
+        update_expression += ", KeyScheme = :scheme, CMKKeyId = :cmk"
+        values[":scheme"] = key_material["key_scheme"]
+        values[":cmk"] = key_material["key_alias"]
+    else:
+        update_expression += ", CMKAlias = :alias"
+        values[":alias"] = key_material["key_alias"]
+
+    dynamodb.Table(TABLE_NAME).update_item(
+        Key={"username": username},
+        UpdateExpression=update_expression,
+        ConditionExpression="attribute_exists(username)",
+        ExpressionAttributeValues=values,
+    )
+
+def process_provisioning_records(records):
+    # Failed messages are reported individually so SQS retries only those
+    failures = []
+    for record in records:
+        try:
+            provision_user_keys(json.loads(record["body"])["username"])
+        except Exception:
+            traceback.print_exc()
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
 
 def get_encrypted_dek(username):
     table = dynamodb.Table(TABLE_NAME)
@@ -87,8 +131,9 @@ def update_key_policy(key_id):
     key_policy_json = json.dumps(key_policy)
     kms.put_key_policy(KeyId=key_id, PolicyName="default", Policy=key_policy_json)
 
+@functools.lru_cache(maxsize=None)
 def get_role_arn(role_name):
-    iam = boto3.client("iam")
+    iam = aws.client("iam")
     response = iam.get_role(RoleName=role_name)
     return response["Role"]["Arn"]
 
@@ -102,8 +147,45 @@ def get_or_generate_encrypted_dek(username):
         cmk_alias = item["CMKAlias"]
     else:
         data_encryption_key = generate_data_encryption_key()
-        clean_username, cmk_alias = clean_username_and_derive_cmk_alias(username)
+        cmk_alias = keys.derive_cmk_alias(username)
         cmk_arn = get_kms_key_arn_from_alias(f"alias/{cmk_alias}")
         encrypted_dek = encrypt_data_encryption_key(data_encryption_key, cmk_arn)
 
     return encrypted_dek, cmk_alias
+
+
+def select_shared_cmk(username):
+    # Stable choice from the pool, spreading users evenly across the CMKs
+    if not SHARED_CMK_IDS:
+        raise Exception("SHARED_CMK_IDS environment variable not set.")
+    digest = hashlib.sha256(username.encode()).digest()
+    return SHARED_CMK_IDS[int.from_bytes(digest[:4], "big") % len(SHARED_CMK_IDS)]
+
+
+def generate_shared_dek(username):
+    # One GenerateDataKey call: the DEK comes back wrapped under a shared CMK,
+    # bound to the user through the encryption context
+    cmk_id = select_shared_cmk(username)
+    response = kms.generate_data_key(
+        KeyId=cmk_id, KeySpec="AES_256", EncryptionContext={"username": username}
+    )
+    return base64.b64encode(response["CiphertextBlob"]).decode("utf-8"), response["KeyId"]
+
+
+def get_or_generate_shared_dek(username):
+    table = dynamodb.Table(TABLE_NAME)
+    item = table.get_item(Key={"username": username}).get("Item")
+
+    if item and "Encrypted_DEK" in item and item.get("KeyScheme") == keys.KEY_SCHEME_SHARED:
+        encrypted_dek, cmk_id = item["Encrypted_DEK"], item["CMKKeyId"]
+    elif item and "Encrypted_DEK" in item and "CMKAlias" in item:
+        # Users provisioned with their own CMK keep it
+        return {"encrypted_data_encryption_key": item["Encrypted_DEK"], "key_alias": item["CMKAlias"]}
+    else:
+        encrypted_dek, cmk_id = generate_shared_dek(username)
+
+    return {
+        "encrypted_data_encryption_key": encrypted_dek,
+        "key_alias": cmk_id,
+        "key_scheme": keys.KEY_SCHEME_SHARED,
+    }
@@ -0,0 +1,7 @@
+# Single-process runtime for the Backend handlers: the HTTP API routes of
+# CloudFormation/template.yaml served from one process with in-memory AWS
+# stand-ins. Needs boto3, PyYAML and the handlers' own dependencies (pyjwt,
+# bcrypt, pycryptodome). Run from Backend/:
+#   BCRYPT_COST=4 python -m local_runtime --port 3001
+# Presigned S3 URLs (archive downloads, direct transfers) point at /__s3/ on
+# the same server, which stores and serves the objects like the bucket would.
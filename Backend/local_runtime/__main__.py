@@ -0,0 +1,81 @@
+import sys
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from local_runtime.app import LocalRuntime, TEMPLATE_PATH
+
+
+def make_request_handler(runtime):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def handle_request(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("content-length") or 0)
+            body = self.rfile.read(length) if length else b""
+
+            if self.command == "POST" and url.path.startswith("/__invoke/"):
+                # Direct invocation of any function, e.g. /__invoke/LoginFunction
+                # with {"action": "throttle_stats"}
+                try:
+                    result = runtime.invoke_by_name(url.path[len("/__invoke/"):], json.loads(body or b"{}"))
+                    status, headers, payload = 200, {"content-type": "application/json"}, json.dumps(result, default=str).encode()
+                except Exception as e:
+                    status, headers, payload = 500, {"content-type": "application/json"}, json.dumps({"errorMessage": str(e)}).encode()
+            elif url.path.startswith("/__s3/"):
+                # Presigned S3 URLs handed out by the handlers
+                status, headers, payload = runtime.s3.serve_presigned(
+                    self.command, url.path[len("/__s3/"):], url.query, body, dict(self.headers.items())
+                )
+            else:
+                status, headers, payload = runtime.handle_http(
+                    self.command, url.path, url.query, dict(self.headers.items()), body, self.client_address[0]
+                )
+
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("content-length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = handle_request
+
+        def log_message(self, format, *args):
+            sys.stderr.write("%s %s\n" % (self.log_date_time_string(), format % args))
+
+    return RequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Backend handlers locally with in-memory AWS stand-ins.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--template", default=TEMPLATE_PATH)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a function environment variable, may be repeated")
+    args = parser.parse_args()
+
+    environment = dict(item.split("=", 1) for item in args.env)
+    runtime = LocalRuntime(args.template, environment)
+    runtime.s3.endpoint_url = f"http://{args.host}:{args.port}/__s3"
+    for (method, path), route in sorted(runtime.routes.items(), key=lambda item: item[0][1]):
+        auth = " [authorizer]" if route["authorizer"] else ""
+        print(f"{method:6} {path:12} -> {route['function']}{auth}")
+
+    # One thread per request, all handlers share the process like warm containers would
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(runtime))
+    server.daemon_threads = True
+    print(f"Listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runtime.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
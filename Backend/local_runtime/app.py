@@ -0,0 +1,402 @@
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import secrets
+import threading
+import traceback
+import importlib.util
+from urllib.parse import parse_qsl
+import yaml
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_PATH = os.path.join(BACKEND_DIR, "..", "CloudFormation", "template.yaml")
+LAYER_PATH = os.path.join(BACKEND_DIR, "common_layer", "python")
+
+# HTTP API hands these bodies to Lambda as text, everything else is base64 encoded
+TEXT_CONTENT_TYPES = ("text/", "application/json", "application/xml", "application/javascript",
+                      "application/x-www-form-urlencoded")
+
+# SQS event source behaviour: messages reported as failed are redelivered up to this many times
+MAX_RECEIVE_COUNT = 5
+
+
+class TemplateLoader(yaml.SafeLoader):
+    pass
+
+
+def construct_intrinsic(loader, tag_suffix, node):
+    # Short-form intrinsics (!Ref, !GetAtt, !Join, ...) in the long form the rest of the code reads
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    if tag_suffix == "Ref":
+        return {"Ref": value}
+    if tag_suffix == "GetAtt" and isinstance(value, str):
+        value = value.split(".", 1)
+    return {"Fn::" + tag_suffix: value}
+
+
+TemplateLoader.add_multi_constructor("!", construct_intrinsic)
+
+
+def load_template(path=TEMPLATE_PATH):
+    with open(path) as template_file:
+        return yaml.load(template_file, Loader=TemplateLoader)
+
+
+def function_directory(logical_id, properties):
+    # Local code URIs point at the directory; packaged ones (s3://) follow the
+    # FileUpFunction -> fileup_function naming used across Backend/
+    code_uri = properties.get("CodeUri", "")
+    if not code_uri.startswith("s3://") and code_uri:
+        return os.path.join(BACKEND_DIR, os.path.basename(code_uri.rstrip("/")))
+    name = logical_id[: -len("Function")] if logical_id.endswith("Function") else logical_id
+    return os.path.join(BACKEND_DIR, name.lower() + "_function")
+
+
+def is_text(content_type):
+    return (content_type or "").lower().startswith(TEXT_CONTENT_TYPES)
+
+
+class LocalContext:
+    # The parts of the Lambda context object a handler may read
+    def __init__(self, function_name, timeout):
+        self.function_name = function_name
+        self.function_version = "$LATEST"
+        self.aws_request_id = str(uuid.uuid4())
+        self.memory_limit_in_mb = 128
+        self.invoked_function_arn = f"arn:aws:lambda:local:000000000000:function:{function_name}"
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class LocalRuntime:
+    # Mounts every handler in Backend/ behind the HTTP API routes of the
+    # CloudFormation template, with in-process stand-ins for the AWS services.
+    # Environment variables already set in the process win over the template's,
+    # e.g. BCRYPT_COST=4 for fast local logins.
+    def __init__(self, template_path=TEMPLATE_PATH, environment=None, start_workers=True):
+        self.template = load_template(template_path)
+        self.resources = self.template.get("Resources", {})
+        self.functions = {}
+        self.routes = {}
+        self.authorizer = None
+        self.cors = None
+        self.handlers = {}
+        self.stop_event = threading.Event()
+        self.batches_in_flight = 0
+        self.batches_lock = threading.Lock()
+
+        self.read_functions()
+        self.read_http_api()
+        self.configure_environment(environment or {})
+        self.install_standins()
+        self.load_handlers()
+        if start_workers:
+            self.start_queue_workers()
+
+    # Template
+
+    def resolve(self, value):
+        if isinstance(value, dict) and "Ref" in value:
+            resource = self.resources.get(value["Ref"], {})
+            properties = resource.get("Properties", {})
+            for name_property in ("TableName", "BucketName", "QueueName", "FunctionName"):
+                if name_property in properties:
+                    return properties[name_property]
+            return value["Ref"]
+        if isinstance(value, dict) and "Fn::Join" in value:
+            separator, parts = value["Fn::Join"]
+            return separator.join(str(self.resolve(part)) for part in parts)
+        if isinstance(value, dict) and "Fn::GetAtt" in value:
+            return value["Fn::GetAtt"][0]
+        if isinstance(value, dict) and "Fn::Sub" in value:
+            return value["Fn::Sub"] if isinstance(value["Fn::Sub"], str) else value["Fn::Sub"][0]
+        return value
+
+    def read_functions(self):
+        defaults = self.template.get("Globals", {}).get("Function", {})
+        shared = defaults.get("Environment", {}).get("Variables", {})
+        for logical_id, resource in self.resources.items():
+            if resource.get("Type") != "AWS::Serverless::Function":
+                continue
+            properties = resource.get("Properties", {})
+            variables = {**shared, **properties.get("Environment", {}).get("Variables", {})}
+            self.functions[logical_id] = {
+                "name": properties.get("FunctionName", logical_id),
+                "directory": function_directory(logical_id, properties),
+                "environment": {key: str(self.resolve(value)) for key, value in variables.items()},
+                "events": properties.get("Events", {}),
+                "timeout": int(properties.get("Timeout", defaults.get("Timeout", 3))),
+            }
+
+    def read_http_api(self):
+        for logical_id, function in self.functions.items():
+            for event in function["events"].values():
+                if event.get("Type") != "HttpApi":
+                    continue
+                properties = event.get("Properties", {})
+                route = (properties["Method"].upper(), properties["Path"])
+                auth = properties.get("Auth", {}).get("Authorizer")
+                self.routes[route] = {"function": logical_id, "authorizer": auth}
+
+        for resource in self.resources.values():
+            if resource.get("Type") != "AWS::Serverless::HttpApi":
+                continue
+            properties = resource.get("Properties", {})
+            self.cors = properties.get("CorsConfiguration")
+            for name, authorizer in properties.get("Auth", {}).get("Authorizers", {}).items():
+                self.authorizer = {
+                    "name": name,
+                    "function": self.resolve(authorizer["FunctionArn"]),
+                    "headers": [header.lower() for header in authorizer.get("Identity", {}).get("Headers", [])],
+                    "simple": bool(authorizer.get("EnableSimpleResponses")),
+                }
+
+    # Environment and stand-ins
+
+    def configure_environment(self, environment):
+        # Every function shares this process, so the union of their variables
+        # is exported; the template never gives one name two different values
+        os.environ.setdefault("AWS_REGION", "us-east-1")
+        for function in self.functions.values():
+            for key, value in function["environment"].items():
+                os.environ.setdefault(key, value)
+        os.environ.update(environment)
+        if LAYER_PATH not in sys.path:
+            sys.path.insert(0, LAYER_PATH)
+
+    def install_standins(self):
+        # Imported here: securestore modules read the environment on import
+        from securestore import aws, queue
+        from local_runtime import dynamodb, standins
+
+        self.s3 = standins.S3()
+        self.dynamodb = dynamodb.Resource()
+        self.kms = standins.KMS()
+        self.secretsmanager = standins.SecretsManager()
+        self.queue = queue.InMemoryQueue()
+
+        for logical_id, resource in self.resources.items():
+            properties = resource.get("Properties", {})
+            if resource.get("Type") == "AWS::S3::Bucket":
+                self.s3.create_bucket(Bucket=properties.get("BucketName", logical_id))
+            elif resource.get("Type") == "AWS::DynamoDB::Table":
+                self.create_table(logical_id, properties)
+            elif resource.get("Type") == "AWS::KMS::Key":
+                self.kms.create_key(KeyId=logical_id, Description=properties.get("Description", ""))
+
+        for key, value in os.environ.items():
+            if key.endswith("SECRET_NAME"):
+                self.secretsmanager.put_secret_value(SecretId=value, SecretString=secrets.token_urlsafe(48))
+
+        aws.set_client("s3", self.s3)
+        aws.set_client("kms", self.kms)
+        aws.set_client("secretsmanager", self.secretsmanager)
+        aws.set_client("lambda", standins.Lambda(self.invoke_by_name))
+        aws.set_client("iam", standins.IAM())
+        aws.set_resource("dynamodb", self.dynamodb)
+        queue.set_queue(self.queue)
+
+    def create_table(self, logical_id, properties):
+        def key_schema(schema):
+            keys = {entry["KeyType"]: entry["AttributeName"] for entry in schema}
+            return keys["HASH"], keys.get("RANGE")
+
+        hash_key, range_key = key_schema(properties["KeySchema"])
+        indexes = {
+            index["IndexName"]: key_schema(index["KeySchema"])
+            for index in properties.get("GlobalSecondaryIndexes", []) + properties.get("LocalSecondaryIndexes", [])
+        }
+        self.dynamodb.create_table(properties.get("TableName", logical_id), hash_key, range_key, indexes)
+
+    def load_handlers(self):
+        for logical_id, function in self.functions.items():
+            path = os.path.join(function["directory"], "index.py")
+            if not os.path.exists(path):
+                print(f"Skipping {logical_id}: {path} not found")
+                continue
+            module_name = f"local_runtime.handlers.{os.path.basename(function['directory'])}"
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            self.handlers[logical_id] = module.handler
+
+    # Invocation
+
+    def invoke(self, logical_id, event):
+        function = self.functions[logical_id]
+        return self.handlers[logical_id](event, LocalContext(function["name"], function["timeout"]))
+
+    def invoke_by_name(self, name, event):
+        for logical_id, function in self.functions.items():
+            if name in (logical_id, function["name"]):
+                return self.invoke(logical_id, event)
+        raise Exception(f"Function not found: {name}")
+
+    def start_queue_workers(self):
+        # Stand-in for the SQS event source mapping of the provisioning queue
+        for logical_id, function in self.functions.items():
+            if logical_id not in self.handlers:
+                continue
+            for event in function["events"].values():
+                if event.get("Type") == "SQS":
+                    threading.Thread(target=self.poll_queue, args=(logical_id,), daemon=True).start()
+
+    def poll_queue(self, logical_id):
+        receive_counts = {}
+        while not self.stop_event.is_set():
+            with self.batches_lock:
+                batch = self.queue.receive(10)["Records"]
+                self.batches_in_flight += bool(batch)
+            if not batch:
+                self.stop_event.wait(0.05)
+                continue
+            try:
+                result = self.invoke(logical_id, {"Records": batch}) or {}
+                failed = {failure["itemIdentifier"] for failure in result.get("batchItemFailures", [])}
+            except Exception:
+                traceback.print_exc()
+                failed = {record["messageId"] for record in batch}
+            for record in batch:
+                if record["messageId"] not in failed:
+                    receive_counts.pop(record["messageId"], None)
+                    continue
+                receive_counts[record["messageId"]] = receive_counts.get(record["messageId"], 0) + 1
+                if receive_counts[record["messageId"]] < MAX_RECEIVE_COUNT:
+                    with self.queue.lock:
+                        self.queue.messages.append(record)
+            with self.batches_lock:
+                self.batches_in_flight -= 1
+
+    def drain_queue(self, timeout=10):
+        # Wait until queued work (key provisioning after /register) has been consumed
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.batches_lock:
+                if not self.queue.messages and not self.batches_in_flight:
+                    return
+            time.sleep(0.01)
+
+    def stop(self):
+        self.stop_event.set()
+
+    # HTTP API
+
+    def cors_headers(self, request_headers):
+        if not self.cors:
+            return {}
+        origins = self.cors.get("AllowOrigins", [])
+        origin = request_headers.get("origin")
+        if "*" in origins:
+            allowed = "*"
+        elif origin in origins:
+            allowed = origin
+        else:
+            return {}
+        return {
+            "access-control-allow-origin": allowed,
+            "access-control-allow-methods": ",".join(self.cors.get("AllowMethods", ["*"])),
+            "access-control-allow-headers": ",".join(self.cors.get("AllowHeaders", ["*"])),
+        }
+
+    def build_event(self, method, path, query_string, headers, body, source_ip):
+        content_type = headers.get("content-type", "")
+        encode = bool(body) and not is_text(content_type)
+        event = {
+            "version": "2.0",
+            "routeKey": f"{method} {path}",
+            "rawPath": path,
+            "rawQueryString": query_string,
+            "headers": headers,
+            "requestContext": {
+                "accountId": "000000000000",
+                "apiId": "local",
+                "domainName": headers.get("host", "localhost"),
+                "http": {
+                    "method": method,
+                    "path": path,
+                    "protocol": "HTTP/1.1",
+                    "sourceIp": source_ip,
+                    "userAgent": headers.get("user-agent", ""),
+                },
+                "requestId": str(uuid.uuid4()),
+                "routeKey": f"{method} {path}",
+                "stage": "$default",
+                "timeEpoch": int(time.time() * 1000),
+            },
+            "isBase64Encoded": encode,
+        }
+        if query_string:
+            event["queryStringParameters"] = dict(parse_qsl(query_string, keep_blank_values=True))
+        if body:
+            event["body"] = base64.b64encode(body).decode("ascii") if encode else body.decode("utf-8")
+        return event
+
+    def authorize(self, event):
+        # Mirrors the template's Lambda authorizer: missing identity -> 401,
+        # denied -> 403, otherwise the context is attached to the request
+        identity = [event["headers"].get(header) for header in self.authorizer["headers"]]
+        if not all(identity):
+            return 401, None
+        request = dict(event, type="REQUEST", identitySource=identity,
+                       routeArn=f"arn:aws:execute-api:local:000000000000:local/$default/{event['routeKey'].replace(' ', '')}")
+        result = self.invoke_by_name(self.authorizer["function"], request)
+        if self.authorizer["simple"]:
+            if not result.get("isAuthorized"):
+                return 403, None
+            return 200, result.get("context") or {}
+        statements = result.get("policyDocument", {}).get("Statement", [])
+        if not any(statement.get("Effect") == "Allow" for statement in statements):
+            return 403, None
+        return 200, result.get("context") or {}
+
+    def handle_http(self, method, path, query_string="", headers=None, body=b"", source_ip="127.0.0.1"):
+        # Returns (status, headers, body bytes) for one HTTP request
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        cors = self.cors_headers(headers)
+        if method == "OPTIONS" and self.cors:
+            return 204, cors, b""
+
+        route = self.routes.get((method, path))
+        if route is None or route["function"] not in self.handlers:
+            return 404, dict(cors, **{"content-type": "application/json"}), b'{"message":"Not Found"}'
+
+        event = self.build_event(method, path, query_string, headers, body, source_ip)
+        try:
+            if route["authorizer"]:
+                status, context = self.authorize(event)
+                if status != 200:
+                    message = "Unauthorized" if status == 401 else "Forbidden"
+                    return status, dict(cors, **{"content-type": "application/json"}), json.dumps({"message": message}).encode()
+                event["requestContext"]["authorizer"] = {"lambda": context}
+            result = self.invoke(route["function"], event)
+        except Exception:
+            traceback.print_exc()
+            return 500, dict(cors, **{"content-type": "application/json"}), b'{"message":"Internal Server Error"}'
+        return self.to_http(result, cors)
+
+    @staticmethod
+    def to_http(result, cors):
+        # Payload format 2.0 response rules: a dict with statusCode is used as
+        # is, anything else is returned as a 200 JSON body
+        if isinstance(result, dict) and "statusCode" in result:
+            response_headers = {"content-type": "application/json"}
+            response_headers.update({key.lower(): str(value) for key, value in (result.get("headers") or {}).items()})
+            response_headers.update(cors)
+            body = result.get("body") or ""
+            if result.get("isBase64Encoded"):
+                body = base64.b64decode(body)
+            elif isinstance(body, str):
+                body = body.encode("utf-8")
+            return int(result["statusCode"]), response_headers, body
+        body = result if isinstance(result, str) else json.dumps(result)
+        return 200, dict(cors, **{"content-type": "application/json"}), body.encode("utf-8")
@@ -0,0 +1,537 @@
+import re
+import threading
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+
+# In-process stand-in for the boto3 DynamoDB resource API: tables hold plain
+# dicts and the expression strings the handlers send (conditions, updates,
+# key conditions, filters) are parsed and evaluated here, so conditional writes
+# and atomic counters behave like the real service for the calls this repo makes.
+
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(?P<number>\d+)|(?P<name>#[A-Za-z0-9_]+)|(?P<value>:[A-Za-z0-9_]+)"
+    r"|(?P<ident>[A-Za-z_][A-Za-z0-9_]*)|(?P<op><>|<=|>=|=|<|>|\(|\)|,|\+|-|\.|\[|\]))"
+)
+KEYWORDS = {"AND", "OR", "NOT", "BETWEEN", "IN", "SET", "ADD", "REMOVE", "DELETE"}
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+class ConditionalCheckFailedException(ClientError):
+    pass
+
+
+class ValidationException(ClientError):
+    pass
+
+
+def client_error(error_type, code, message, **extra):
+    response = {"Error": {"Code": code, "Message": message}, **extra}
+    return error_type(response, "DynamoDB")
+
+
+def normalize(value):
+    # Round-trip through the wire format: numbers become Decimal and floats are
+    # rejected exactly as the real resource API rejects them
+    return _deserializer.deserialize(_serializer.serialize(value))
+
+
+def to_wire(item):
+    return {name: _serializer.serialize(value) for name, value in item.items()}
+
+
+class Missing:
+    # Marker for a path that does not resolve inside the item
+    pass
+
+
+MISSING = Missing()
+
+
+def tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if not match or match.end() == position:
+            raise client_error(ValidationException, "ValidationException", f"Invalid expression: {expression}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "ident" and text.upper() in KEYWORDS:
+            kind, text = "keyword", text.upper()
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    def __init__(self, expression, names, values):
+        self.tokens = tokenize(expression)
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, expected=None):
+        token = self.peek()
+        if token[0] is None or (expected is not None and token[1] != expected):
+            raise client_error(ValidationException, "ValidationException", f"Expected {expected}, got {token[1]}")
+        self.position += 1
+        return token
+
+    def at_end(self):
+        return self.position >= len(self.tokens)
+
+    # Operands
+
+    def path(self):
+        kind, text = self.take()
+        if kind == "name":
+            if text not in self.names:
+                raise client_error(ValidationException, "ValidationException", f"Undefined attribute name {text}")
+            text = self.names[text]
+        elif kind != "ident":
+            raise client_error(ValidationException, "ValidationException", f"Expected attribute path, got {text}")
+        parts = [text]
+        while self.peek()[1] in (".", "["):
+            if self.take()[1] == ".":
+                parts.append(self.path()[0])
+            else:
+                parts.append(int(self.take()[1]))
+                self.take("]")
+        return parts
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == "value":
+            self.take()
+            if text not in self.values:
+                raise client_error(ValidationException, "ValidationException", f"Undefined attribute value {text}")
+            value = normalize(self.values[text])
+            return lambda item: value
+        if kind == "ident" and text in ("size", "if_not_exists", "list_append"):
+            return self.function_operand()
+        path = self.path()
+        return lambda item: resolve(item, path)
+
+    def function_operand(self):
+        function = self.take()[1]
+        self.take("(")
+        if function == "size":
+            path = self.path()
+            self.take(")")
+            return lambda item: size_of(resolve(item, path))
+        if function == "if_not_exists":
+            path = self.path()
+            self.take(",")
+            fallback = self.set_value()
+            self.take(")")
+
+            def if_not_exists(item):
+                current = resolve(item, path)
+                return fallback(item) if current is MISSING else current
+
+            return if_not_exists
+        first = self.set_value()
+        self.take(",")
+        second = self.set_value()
+        self.take(")")
+        return lambda item: list(first(item)) + list(second(item))
+
+    def set_value(self):
+        left = self.operand()
+        if self.peek()[1] in ("+", "-"):
+            operator = self.take()[1]
+            right = self.operand()
+            if operator == "+":
+                return lambda item: left(item) + right(item)
+            return lambda item: left(item) - right(item)
+        return left
+
+    # Conditions
+
+    def condition(self):
+        result = self.and_condition()
+        while self.peek()[1] == "OR":
+            self.take()
+            left, right = result, self.and_condition()
+            result = (lambda l, r: lambda item: l(item) or r(item))(left, right)
+        return result
+
+    def and_condition(self):
+        result = self.not_condition()
+        while self.peek()[1] == "AND":
+            self.take()
+            left, right = result, self.not_condition()
+            result = (lambda l, r: lambda item: l(item) and r(item))(left, right)
+        return result
+
+    def not_condition(self):
+        if self.peek()[1] == "NOT":
+            self.take()
+            inner = self.not_condition()
+            return lambda item: not inner(item)
+        return self.primary_condition()
+
+    def primary_condition(self):
+        kind, text = self.peek()
+        if text == "(":
+            self.take()
+            inner = self.condition()
+            self.take(")")
+            return inner
+        if kind == "ident" and text in ("attribute_exists", "attribute_not_exists", "begins_with", "contains"):
+            self.take()
+            self.take("(")
+            if text in ("attribute_exists", "attribute_not_exists"):
+                path = self.path()
+                self.take(")")
+                exists = text == "attribute_exists"
+                return lambda item: (resolve(item, path) is not MISSING) == exists
+            target = self.operand()
+            self.take(",")
+            argument = self.operand()
+            self.take(")")
+            if text == "begins_with":
+                return lambda item: compare_safe(lambda: target(item).startswith(argument(item)))
+            return lambda item: compare_safe(lambda: argument(item) in target(item))
+        left = self.operand()
+        operator = self.take()[1]
+        if operator == "BETWEEN":
+            low = self.operand()
+            self.take("AND")
+            high = self.operand()
+            return lambda item: compare_safe(lambda: low(item) <= left(item) <= high(item))
+        if operator == "IN":
+            self.take("(")
+            options = [self.operand()]
+            while self.peek()[1] == ",":
+                self.take()
+                options.append(self.operand())
+            self.take(")")
+            return lambda item: any(left(item) == option(item) for option in options)
+        right = self.operand()
+        comparisons = {
+            "=": lambda a, b: a == b,
+            "<>": lambda a, b: a != b,
+            "<": lambda a, b: a < b,
+            "<=": lambda a, b: a <= b,
+            ">": lambda a, b: a > b,
+            ">=": lambda a, b: a >= b,
+        }
+        if operator not in comparisons:
+            raise client_error(ValidationException, "ValidationException", f"Unsupported operator {operator}")
+        compare = comparisons[operator]
+        return lambda item: compare_safe(lambda: compare(left(item), right(item)))
+
+    # Update expressions
+
+    def update(self):
+        actions = []
+        while not self.at_end():
+            clause = self.take()[1]
+            while True:
+                path = self.path()
+                if clause == "SET":
+                    self.take("=")
+                    actions.append(("SET", path, self.set_value()))
+                elif clause == "REMOVE":
+                    actions.append(("REMOVE", path, None))
+                elif clause in ("ADD", "DELETE"):
+                    actions.append((clause, path, self.operand()))
+                else:
+                    raise client_error(ValidationException, "ValidationException", f"Unknown clause {clause}")
+                if self.peek()[1] != ",":
+                    break
+                self.take()
+        return actions
+
+
+def compare_safe(check):
+    # Comparisons across missing attributes or mismatched types are false, not errors
+    try:
+        return bool(check())
+    except (TypeError, AttributeError):
+        return False
+
+
+def resolve(item, path):
+    current = item
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(current, list) or part >= len(current):
+                return MISSING
+            current = current[part]
+        else:
+            if not isinstance(current, dict) or part not in current:
+                return MISSING
+            current = current[part]
+    return current
+
+
+def size_of(value):
+    if value is MISSING:
+        return MISSING
+    return Decimal(len(value))
+
+
+def assign(item, path, value):
+    current = item
+    for part in path[:-1]:
+        current = current[part]
+    current[path[-1]] = value
+
+
+def remove(item, path):
+    current = resolve(item, path[:-1]) if len(path) > 1 else item
+    if current is MISSING:
+        return
+    if isinstance(path[-1], int):
+        if path[-1] < len(current):
+            del current[path[-1]]
+    else:
+        current.pop(path[-1], None)
+
+
+def build_expression(condition, names, values, is_key_condition=False):
+    # boto3 condition objects (Key("a").eq(1) & ...) are turned into the string
+    # form first so both styles share the evaluator
+    names = dict(names or {})
+    values = dict(values or {})
+    if isinstance(condition, ConditionBase):
+        built = ConditionExpressionBuilder().build_expression(condition, is_key_condition=is_key_condition)
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+        condition = built.condition_expression
+    return condition, names, values
+
+
+class Table:
+    def __init__(self, name, hash_key, range_key=None, indexes=None):
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # {index_name: (hash_key, range_key)}
+        self.indexes = indexes or {}
+        self.items = {}
+        self.lock = threading.RLock()
+        self.meta = TableMeta()
+
+    def key_names(self):
+        return [self.hash_key] + ([self.range_key] if self.range_key else [])
+
+    def item_key(self, key):
+        names = self.key_names()
+        if set(key) != set(names):
+            raise client_error(
+                ValidationException, "ValidationException", "The provided key element does not match the schema"
+            )
+        return tuple((name, repr(normalize(key[name]))) for name in names)
+
+    def check_condition(self, existing, kwargs):
+        expression = kwargs.get("ConditionExpression")
+        if expression is None:
+            return
+        expression, names, values = build_expression(
+            expression, kwargs.get("ExpressionAttributeNames"), kwargs.get("ExpressionAttributeValues")
+        )
+        check = Parser(expression, names, values).condition()
+        if not check(existing or {}):
+            extra = {}
+            if existing and kwargs.get("ReturnValuesOnConditionCheckFailure") == "ALL_OLD":
+                extra["Item"] = to_wire(existing)
+            raise client_error(
+                ConditionalCheckFailedException,
+                "ConditionalCheckFailedException",
+                "The conditional request failed",
+                **extra,
+            )
+
+    def get_item(self, Key, ConsistentRead=False, **kwargs):
+        with self.lock:
+            item = self.items.get(self.item_key(Key))
+            return {"Item": normalize(item)} if item is not None else {}
+
+    def put_item(self, Item, ReturnValues="NONE", **kwargs):
+        item = normalize(Item)
+        key = self.item_key({name: item.get(name) for name in self.key_names()})
+        with self.lock:
+            existing = self.items.get(key)
+            self.check_condition(existing, kwargs)
+            self.items[key] = item
+            if ReturnValues == "ALL_OLD" and existing is not None:
+                return {"Attributes": normalize(existing)}
+            return {}
+
+    def delete_item(self, Key, ReturnValues="NONE", **kwargs):
+        key = self.item_key(Key)
+        with self.lock:
+            existing = self.items.get(key)
+            self.check_condition(existing, kwargs)
+            self.items.pop(key, None)
+            if ReturnValues == "ALL_OLD" and existing is not None:
+                return {"Attributes": normalize(existing)}
+            return {}
+
+    def update_item(self, Key, UpdateExpression, ReturnValues="NONE", **kwargs):
+        key = self.item_key(Key)
+        expression, names, values = build_expression(
+            UpdateExpression, kwargs.get("ExpressionAttributeNames"), kwargs.get("ExpressionAttributeValues")
+        )
+        actions = Parser(expression, names, values).update()
+        with self.lock:
+            existing = self.items.get(key)
+            self.check_condition(existing, kwargs)
+            old = normalize(existing) if existing is not None else {}
+            item = normalize(existing) if existing is not None else normalize(dict(Key))
+            # Right-hand sides all see the item as it was before the update
+            staged = [(action, path, value(old) if value else None) for action, path, value in actions]
+            for action, path, value in staged:
+                if action == "SET":
+                    assign(item, path, value)
+                elif action == "REMOVE":
+                    remove(item, path)
+                elif action == "ADD":
+                    current = resolve(item, path)
+                    if current is MISSING:
+                        assign(item, path, value)
+                    elif isinstance(current, set):
+                        assign(item, path, current | value)
+                    else:
+                        assign(item, path, current + value)
+                elif action == "DELETE":
+                    current = resolve(item, path)
+                    if current is not MISSING:
+                        remaining = current - value
+                        if remaining:
+                            assign(item, path, remaining)
+                        else:
+                            remove(item, path)
+            self.items[key] = item
+            touched = {path[0] for _, path, _ in actions}
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": normalize(item)}
+            if ReturnValues == "ALL_OLD":
+                return {"Attributes": old} if existing is not None else {}
+            if ReturnValues == "UPDATED_NEW":
+                return {"Attributes": {name: normalize(item[name]) for name in touched if name in item}}
+            if ReturnValues == "UPDATED_OLD":
+                return {"Attributes": {name: old[name] for name in touched if name in old}}
+            return {}
+
+    def sort_key(self, item, index_range):
+        def part(name):
+            value = item.get(name) if name else None
+            return (0, "") if value is None else (1, value)
+
+        return (part(index_range), part(self.hash_key), part(self.range_key))
+
+    def read(self, kwargs, key_condition=None):
+        names = kwargs.get("ExpressionAttributeNames")
+        values = kwargs.get("ExpressionAttributeValues")
+        index_hash, index_range = self.hash_key, self.range_key
+        if kwargs.get("IndexName"):
+            if kwargs["IndexName"] not in self.indexes:
+                raise client_error(ValidationException, "ValidationException", "The table does not have the specified index")
+            index_hash, index_range = self.indexes[kwargs["IndexName"]]
+        matches = lambda item: True
+        if key_condition is not None:
+            expression, key_names, key_values = build_expression(key_condition, names, values, is_key_condition=True)
+            matches = Parser(expression, key_names, key_values).condition()
+        item_filter = lambda item: True
+        if kwargs.get("FilterExpression") is not None:
+            expression, filter_names, filter_values = build_expression(kwargs["FilterExpression"], names, values)
+            item_filter = Parser(expression, filter_names, filter_values).condition()
+
+        with self.lock:
+            candidates = [
+                normalize(item)
+                for item in self.items.values()
+                if index_hash in item and (not kwargs.get("IndexName") or not index_range or index_range in item)
+            ]
+        candidates = sorted((item for item in candidates if matches(item)), key=lambda item: self.sort_key(item, index_range))
+        if not kwargs.get("ScanIndexForward", True):
+            candidates.reverse()
+        start = kwargs.get("ExclusiveStartKey")
+        if start:
+            start_key = self.sort_key(normalize(start), index_range)
+            if kwargs.get("ScanIndexForward", True):
+                candidates = [item for item in candidates if self.sort_key(item, index_range) > start_key]
+            else:
+                candidates = [item for item in candidates if self.sort_key(item, index_range) < start_key]
+        limit = kwargs.get("Limit")
+        page = candidates[:limit] if limit else candidates
+        response = {}
+        if limit and len(candidates) > limit:
+            last = page[-1]
+            key_names = {self.hash_key, self.range_key, index_hash, index_range} - {None}
+            response["LastEvaluatedKey"] = {name: last[name] for name in key_names if name in last}
+        items = [item for item in page if item_filter(item)]
+        response.update({"Items": items, "Count": len(items), "ScannedCount": len(page)})
+        if kwargs.get("Select") == "COUNT":
+            del response["Items"]
+        return response
+
+    def query(self, KeyConditionExpression, **kwargs):
+        return self.read(kwargs, KeyConditionExpression)
+
+    def scan(self, **kwargs):
+        return self.read(kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return BatchWriter(self)
+
+
+class BatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+    def delete_item(self, Key):
+        self.table.delete_item(Key=Key)
+
+
+class Exceptions:
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    ValidationException = ValidationException
+    ResourceNotFoundException = ClientError
+
+
+class MetaClient:
+    exceptions = Exceptions
+
+
+class TableMeta:
+    client = MetaClient
+
+
+class Resource:
+    # Stand-in for aws.resource("dynamodb")
+    def __init__(self):
+        self.tables = {}
+        self.meta = TableMeta()
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        self.tables[name] = Table(name, hash_key, range_key, indexes)
+        return self.tables[name]
+
+    def Table(self, name):
+        if name not in self.tables:
+            raise client_error(ClientError, "ResourceNotFoundException", f"Requested resource not found: {name}")
+        return self.tables[name]
@@ -0,0 +1,566 @@
+import io
+import re
+import hmac
+import json
+import base64
+import time
+import uuid
+import struct
+import hashlib
+import secrets
+import threading
+from urllib.parse import quote, unquote, urlencode, parse_qsl
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from Crypto.Cipher import AES
+
+# In-process stand-ins for the AWS clients the handlers use (S3, KMS, Secrets
+# Manager, Lambda, IAM). They keep everything in memory, implement only the
+# calls and response fields this repository reads, and raise ClientError with
+# the same error codes as the services so the handlers' error paths still run.
+
+ACCOUNT_ID = "000000000000"
+REGION = "local"
+
+
+def client_error(error_type, code, message, operation, status=400):
+    response = {"Error": {"Code": code, "Message": message}, "ResponseMetadata": {"HTTPStatusCode": status}}
+    return error_type(response, operation)
+
+
+def error_class(name):
+    return type(name, (ClientError,), {})
+
+
+class StreamingBody:
+    # Same reading surface as botocore's StreamingBody
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self.stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        while True:
+            chunk = self.stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.stream.close()
+
+
+class S3Exceptions:
+    ClientError = ClientError
+    NoSuchKey = error_class("NoSuchKey")
+    NoSuchBucket = error_class("NoSuchBucket")
+    NoSuchUpload = error_class("NoSuchUpload")
+
+
+class Paginator:
+    # Feeds each page's continuation field back in as the next request's
+    def __init__(self, method, tokens):
+        self.method = method
+        self.tokens = tokens
+
+    def paginate(self, **kwargs):
+        params = dict(kwargs)
+        while True:
+            page = self.method(**params)
+            yield page
+            if not page.get("IsTruncated"):
+                return
+            for request_field, response_field in self.tokens.items():
+                params[request_field] = page[response_field]
+
+
+class S3:
+    exceptions = S3Exceptions
+
+    # Presigned URLs point at the local server, which hands /__s3/ requests to serve_presigned()
+    PRESIGNED_METHODS = {"get_object": "GET", "put_object": "PUT", "upload_part": "PUT"}
+
+    def __init__(self, endpoint_url="http://127.0.0.1:3001/__s3"):
+        # {bucket: {key: object}}
+        self.buckets = {}
+        self.uploads = {}
+        self.lock = threading.RLock()
+        self.endpoint_url = endpoint_url
+        self.signing_key = secrets.token_bytes(32)
+
+    def create_bucket(self, Bucket, **kwargs):
+        with self.lock:
+            self.buckets.setdefault(Bucket, {})
+        return {}
+
+    def bucket(self, name, operation):
+        if name not in self.buckets:
+            raise client_error(S3Exceptions.NoSuchBucket, "NoSuchBucket", "The specified bucket does not exist", operation, 404)
+        return self.buckets[name]
+
+    def store(self, bucket, key, data, metadata=None, content_type=None, etag=None):
+        obj = {
+            "Body": data,
+            "Metadata": dict(metadata or {}),
+            "ContentType": content_type or "binary/octet-stream",
+            "ETag": etag or f'"{hashlib.md5(data).hexdigest()}"',
+            "LastModified": datetime.now(timezone.utc),
+            "VersionId": uuid.uuid4().hex,
+        }
+        with self.lock:
+            self.bucket(bucket, "PutObject")[key] = obj
+        return obj
+
+    def lookup(self, bucket, key, operation, not_found_code="NoSuchKey"):
+        with self.lock:
+            obj = self.bucket(bucket, operation).get(key)
+        if obj is None:
+            raise client_error(S3Exceptions.NoSuchKey, not_found_code, "The specified key does not exist.", operation, 404)
+        return obj
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, ContentType=None, **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        obj = self.store(Bucket, Key, bytes(Body), Metadata, ContentType)
+        return {"ETag": obj["ETag"], "VersionId": obj["VersionId"]}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        obj = self.lookup(Bucket, Key, "GetObject")
+        data = obj["Body"]
+        response = {
+            "Metadata": dict(obj["Metadata"]),
+            "ContentType": obj["ContentType"],
+            "ETag": obj["ETag"],
+            "LastModified": obj["LastModified"],
+            "VersionId": obj["VersionId"],
+        }
+        if Range:
+            match = re.match(r"bytes=(\d*)-(\d*)$", Range)
+            if not match or not any(match.groups()):
+                raise client_error(ClientError, "InvalidRange", "The requested range is not satisfiable", "GetObject", 416)
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last) if last else len(data) - 1, len(data) - 1)
+            else:
+                start, end = max(0, len(data) - int(last)), len(data) - 1
+            if start >= len(data):
+                raise client_error(ClientError, "InvalidRange", "The requested range is not satisfiable", "GetObject", 416)
+            data = data[start:end + 1]
+            response["ContentRange"] = f"bytes {start}-{end}/{len(obj['Body'])}"
+        response["Body"] = StreamingBody(data)
+        response["ContentLength"] = len(data)
+        return response
+
+    def head_object(self, Bucket, Key, **kwargs):
+        obj = self.lookup(Bucket, Key, "HeadObject", not_found_code="404")
+        return {
+            "ContentLength": len(obj["Body"]),
+            "Metadata": dict(obj["Metadata"]),
+            "ContentType": obj["ContentType"],
+            "ETag": obj["ETag"],
+            "LastModified": obj["LastModified"],
+            "VersionId": obj["VersionId"],
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self.lock:
+            self.bucket(Bucket, "DeleteObject").pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        if not 0 < len(Delete["Objects"]) <= 1000:
+            raise client_error(ClientError, "MalformedXML", "A request may delete 1 to 1000 keys", "DeleteObjects", 400)
+        deleted = []
+        with self.lock:
+            objects = self.bucket(Bucket, "DeleteObjects")
+            for entry in Delete["Objects"]:
+                # Only the latest version is kept, older version ids are already gone
+                obj = objects.get(entry["Key"])
+                if obj is not None and entry.get("VersionId") in (None, "null", obj["VersionId"]):
+                    del objects[entry["Key"]]
+                deleted.append({"Key": entry["Key"], **({"VersionId": entry["VersionId"]} if "VersionId" in entry else {})})
+        return {"Deleted": deleted} if not Delete.get("Quiet") else {}
+
+    def list_objects_v2(
+        self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, StartAfter=None, Delimiter=None, **kwargs
+    ):
+        with self.lock:
+            objects = self.bucket(Bucket, "ListObjectsV2")
+            after = ContinuationToken or StartAfter
+            # With a delimiter, keys sharing the part up to the next delimiter
+            # roll up into one CommonPrefixes entry; both kinds count toward MaxKeys
+            entries = []
+            for key in sorted(key for key in objects if key.startswith(Prefix)):
+                if after and (key <= after or (Delimiter and after.endswith(Delimiter) and key.startswith(after))):
+                    continue
+                position = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+                if position >= 0:
+                    common_prefix = key[: position + len(Delimiter)]
+                    if not entries or entries[-1] != (common_prefix, True):
+                        entries.append((common_prefix, True))
+                else:
+                    entries.append((key, False))
+            page = entries[:MaxKeys]
+            contents = [
+                {
+                    "Key": key,
+                    "Size": len(objects[key]["Body"]),
+                    "ETag": objects[key]["ETag"],
+                    "LastModified": objects[key]["LastModified"],
+                }
+                for key, is_prefix in page
+                if not is_prefix
+            ]
+            common_prefixes = [{"Prefix": name} for name, is_prefix in page if is_prefix]
+        response = {"KeyCount": len(page), "IsTruncated": len(entries) > MaxKeys, "Prefix": Prefix}
+        if Delimiter:
+            response["Delimiter"] = Delimiter
+        if contents:
+            response["Contents"] = contents
+        if common_prefixes:
+            response["CommonPrefixes"] = common_prefixes
+        if len(entries) > MaxKeys:
+            response["NextContinuationToken"] = page[-1][0]
+        return response
+
+    def list_object_versions(self, Bucket, Prefix="", MaxKeys=1000, KeyMarker=None, **kwargs):
+        # Versioned listing of an unversioned store: one latest version per key
+        with self.lock:
+            objects = self.bucket(Bucket, "ListObjectVersions")
+            keys = sorted(key for key in objects if key.startswith(Prefix) and (not KeyMarker or key > KeyMarker))
+            page = keys[:MaxKeys]
+            versions = [
+                {
+                    "Key": key,
+                    "VersionId": objects[key]["VersionId"],
+                    "IsLatest": True,
+                    "Size": len(objects[key]["Body"]),
+                    "ETag": objects[key]["ETag"],
+                    "LastModified": objects[key]["LastModified"],
+                }
+                for key in page
+            ]
+        response = {"IsTruncated": len(keys) > MaxKeys, "Prefix": Prefix}
+        if versions:
+            response["Versions"] = versions
+        if len(keys) > MaxKeys:
+            response["NextKeyMarker"] = page[-1]
+            response["NextVersionIdMarker"] = versions[-1]["VersionId"]
+        return response
+
+    # Presigned URLs: HMAC over the method, bucket, key and query, checked by serve_presigned
+
+    def signature(self, method, bucket, key, query):
+        message = "\n".join([method, bucket, key, urlencode(sorted(query.items()))])
+        return hmac.new(self.signing_key, message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        if ClientMethod not in self.PRESIGNED_METHODS:
+            raise NotImplementedError(ClientMethod)
+        params = dict(Params or {})
+        bucket, key = params.pop("Bucket"), params.pop("Key")
+        query = {"X-Amz-Expires": str(int(time.time()) + int(ExpiresIn))}
+        if "ResponseContentDisposition" in params:
+            query["response-content-disposition"] = params.pop("ResponseContentDisposition")
+        if ClientMethod == "upload_part":
+            query["uploadId"] = params.pop("UploadId")
+            query["partNumber"] = str(params.pop("PartNumber"))
+        query["X-Amz-Signature"] = self.signature(self.PRESIGNED_METHODS[ClientMethod], bucket, key, query)
+        return f"{self.endpoint_url}/{bucket}/{quote(key)}?{urlencode(query)}"
+
+    def post_signature(self, policy):
+        return hmac.new(self.signing_key, policy.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        # Browser form upload: the fields carry a signed policy whose conditions
+        # the upload has to meet
+        policy = {
+            "expiration": int(time.time()) + int(ExpiresIn),
+            "conditions": [{"bucket": Bucket}, {"key": Key}] + list(Conditions or []),
+        }
+        encoded_policy = base64.b64encode(json.dumps(policy).encode("utf-8")).decode("ascii")
+        fields = dict(Fields or {}, key=Key, policy=encoded_policy)
+        fields["x-amz-signature"] = self.post_signature(encoded_policy)
+        return {"url": f"{self.endpoint_url}/{Bucket}", "fields": fields}
+
+    def serve_presigned(self, method, path, query_string, body=b"", request_headers=None):
+        # (status, headers, body) for a request made with a presigned URL or POST policy
+        headers = {"access-control-allow-origin": "*", "access-control-expose-headers": "ETag"}
+        if method == "OPTIONS":
+            # CORS preflight of a browser PUT or POST
+            headers.update({"access-control-allow-methods": "GET, PUT, POST", "access-control-allow-headers": "*"})
+            return 200, headers, b""
+        if method == "POST":
+            return self.serve_post(path, request_headers or {}, body, headers)
+        bucket, _, key = path.partition("/")
+        key = unquote(key)
+        query = dict(parse_qsl(query_string, keep_blank_values=True))
+        signature = query.pop("X-Amz-Signature", "")
+        if not hmac.compare_digest(signature, self.signature(method, bucket, key, query)):
+            return 403, headers, b"SignatureDoesNotMatch"
+        if int(query.get("X-Amz-Expires", "0")) < time.time():
+            return 403, headers, b"Request has expired"
+        if method == "GET":
+            try:
+                obj = self.lookup(bucket, key, "GetObject")
+            except ClientError:
+                return 404, headers, b"NoSuchKey"
+            headers["content-type"] = obj["ContentType"]
+            headers["etag"] = obj["ETag"]
+            if "response-content-disposition" in query:
+                headers["content-disposition"] = query["response-content-disposition"]
+            return 200, headers, obj["Body"]
+        if method == "PUT":
+            try:
+                if "uploadId" in query:
+                    response = self.upload_part(
+                        Bucket=bucket, Key=key, UploadId=query["uploadId"], PartNumber=int(query["partNumber"]), Body=body
+                    )
+                else:
+                    response = self.put_object(Bucket=bucket, Key=key, Body=body)
+            except ClientError as e:
+                return e.response["ResponseMetadata"]["HTTPStatusCode"], headers, e.response["Error"]["Code"].encode()
+            headers["etag"] = response["ETag"]
+            return 200, headers, b""
+        return 405, headers, b"MethodNotAllowed"
+
+    def serve_post(self, bucket, request_headers, body, headers):
+        from securestore import multipart
+
+        content_type = {name.lower(): value for name, value in request_headers.items()}.get("content-type", "")
+        try:
+            form = multipart.parse_form(body, content_type)
+            fields = {name: part.value for name, part in form.items() if name != "file"}
+            data = form["file"].data.tobytes()
+            policy = json.loads(base64.b64decode(fields["policy"]))
+        except (multipart.MultipartError, KeyError, ValueError):
+            return 400, headers, b"MalformedPOSTRequest"
+        if not hmac.compare_digest(fields.get("x-amz-signature", ""), self.post_signature(fields["policy"])):
+            return 403, headers, b"SignatureDoesNotMatch"
+        if policy["expiration"] < time.time():
+            return 403, headers, b"Request has expired"
+        for condition in policy["conditions"]:
+            if isinstance(condition, dict):
+                (name, expected), = condition.items()
+                if (bucket if name == "bucket" else fields.get(name)) != expected:
+                    return 403, headers, b"AccessDenied"
+            elif condition[0] == "content-length-range":
+                if len(data) > condition[2]:
+                    return 400, headers, b"EntityTooLarge"
+                if len(data) < condition[1]:
+                    return 400, headers, b"EntityTooSmall"
+        response = self.put_object(Bucket=bucket, Key=fields["key"], Body=data)
+        headers["etag"] = response["ETag"]
+        return 204, headers, b""
+
+    def get_paginator(self, operation_name):
+        if operation_name == "list_objects_v2":
+            return Paginator(self.list_objects_v2, {"ContinuationToken": "NextContinuationToken"})
+        if operation_name == "list_object_versions":
+            return Paginator(
+                self.list_object_versions, {"KeyMarker": "NextKeyMarker", "VersionIdMarker": "NextVersionIdMarker"}
+            )
+        raise NotImplementedError(operation_name)
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, ContentType=None, **kwargs):
+        self.bucket(Bucket, "CreateMultipartUpload")
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "Metadata": Metadata, "ContentType": ContentType, "Parts": {}}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload(self, upload_id, operation):
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise client_error(S3Exceptions.NoSuchUpload, "NoSuchUpload", "The specified upload does not exist.", operation, 404)
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        data = bytes(Body)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        with self.lock:
+            self.upload(UploadId, "UploadPart")["Parts"][PartNumber] = (etag, data)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        upload = self.upload(UploadId, "CompleteMultipartUpload")
+        chunks = []
+        digests = b""
+        for part in MultipartUpload["Parts"]:
+            etag, data = upload["Parts"].get(part["PartNumber"], (None, None))
+            if etag is None or etag != part["ETag"]:
+                raise client_error(ClientError, "InvalidPart", "One or more of the specified parts could not be found.", "CompleteMultipartUpload")
+            chunks.append(data)
+            digests += bytes.fromhex(etag.strip('"'))
+        etag = f'"{hashlib.md5(digests).hexdigest()}-{len(chunks)}"'
+        obj = self.store(Bucket, Key, b"".join(chunks), upload["Metadata"], upload["ContentType"], etag)
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {"Bucket": Bucket, "Key": Key, "ETag": obj["ETag"], "VersionId": obj["VersionId"]}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        with self.lock:
+            self.uploads.pop(UploadId, None)
+        return {}
+
+
+class KMSExceptions:
+    NotFoundException = error_class("NotFoundException")
+    AlreadyExistsException = error_class("AlreadyExistsException")
+    InvalidCiphertextException = error_class("InvalidCiphertextException")
+    IncorrectKeyException = error_class("IncorrectKeyException")
+
+
+class KMS:
+    # Ciphertext blobs are <key id length><key id><nonce><tag><AES-GCM ciphertext>
+    # with the encryption context as associated data, so decrypting with the
+    # wrong key or context fails the way it does against the real service
+    exceptions = KMSExceptions
+
+    def __init__(self):
+        self.keys = {}
+        self.aliases = {}
+        self.lock = threading.Lock()
+
+    def arn(self, key_id):
+        return f"arn:aws:kms:{REGION}:{ACCOUNT_ID}:key/{key_id}"
+
+    def create_key(self, KeyId=None, Description="", **kwargs):
+        key_id = KeyId or str(uuid.uuid4())
+        with self.lock:
+            self.keys[key_id] = {"material": secrets.token_bytes(32), "description": Description}
+        return {"KeyMetadata": {"KeyId": key_id, "Arn": self.arn(key_id), "Description": Description}}
+
+    def resolve(self, key_id, operation):
+        if key_id.startswith("arn:") and ":alias/" in key_id:
+            key_id = "alias/" + key_id.split(":alias/", 1)[1]
+        elif key_id.startswith("arn:"):
+            key_id = key_id.rsplit("/", 1)[-1]
+        with self.lock:
+            key_id = self.aliases.get(key_id, key_id)
+            if key_id not in self.keys:
+                raise client_error(KMSExceptions.NotFoundException, "NotFoundException", f"Key '{key_id}' does not exist", operation)
+        return key_id
+
+    def describe_key(self, KeyId, **kwargs):
+        key_id = self.resolve(KeyId, "DescribeKey")
+        return {"KeyMetadata": {"KeyId": key_id, "Arn": self.arn(key_id), "Enabled": True}}
+
+    def create_alias(self, AliasName, TargetKeyId, **kwargs):
+        key_id = self.resolve(TargetKeyId, "CreateAlias")
+        with self.lock:
+            if AliasName in self.aliases:
+                raise client_error(KMSExceptions.AlreadyExistsException, "AlreadyExistsException", f"{AliasName} already exists", "CreateAlias")
+            self.aliases[AliasName] = key_id
+        return {}
+
+    def list_aliases(self, KeyId=None, **kwargs):
+        with self.lock:
+            aliases = [
+                {"AliasName": alias, "AliasArn": f"arn:aws:kms:{REGION}:{ACCOUNT_ID}:{alias}", "TargetKeyId": target}
+                for alias, target in self.aliases.items()
+                if KeyId is None or target == KeyId
+            ]
+        return {"Aliases": aliases}
+
+    def put_key_policy(self, KeyId, **kwargs):
+        self.resolve(KeyId, "PutKeyPolicy")
+        return {}
+
+    @staticmethod
+    def context_bytes(context):
+        return json.dumps(context or {}, sort_keys=True).encode("utf-8")
+
+    def encrypt(self, KeyId, Plaintext, EncryptionContext=None, **kwargs):
+        key_id = self.resolve(KeyId, "Encrypt")
+        cipher = AES.new(self.keys[key_id]["material"], AES.MODE_GCM)
+        cipher.update(self.context_bytes(EncryptionContext))
+        ciphertext, tag = cipher.encrypt_and_digest(bytes(Plaintext))
+        encoded_id = key_id.encode("utf-8")
+        blob = struct.pack("!H", len(encoded_id)) + encoded_id + cipher.nonce + tag + ciphertext
+        return {"CiphertextBlob": blob, "KeyId": self.arn(key_id)}
+
+    def decrypt(self, CiphertextBlob, KeyId=None, EncryptionContext=None, **kwargs):
+        try:
+            (length,) = struct.unpack_from("!H", CiphertextBlob)
+            key_id = CiphertextBlob[2:2 + length].decode("utf-8")
+            rest = CiphertextBlob[2 + length:]
+            nonce, tag, ciphertext = rest[:16], rest[16:32], rest[32:]
+        except (struct.error, UnicodeDecodeError):
+            raise client_error(KMSExceptions.InvalidCiphertextException, "InvalidCiphertextException", "", "Decrypt")
+        if KeyId is not None and self.resolve(KeyId, "Decrypt") != key_id:
+            raise client_error(KMSExceptions.IncorrectKeyException, "IncorrectKeyException", "", "Decrypt")
+        key_id = self.resolve(key_id, "Decrypt")
+        cipher = AES.new(self.keys[key_id]["material"], AES.MODE_GCM, nonce=nonce)
+        cipher.update(self.context_bytes(EncryptionContext))
+        try:
+            plaintext = cipher.decrypt_and_verify(ciphertext, tag)
+        except ValueError:
+            raise client_error(KMSExceptions.InvalidCiphertextException, "InvalidCiphertextException", "", "Decrypt")
+        return {"Plaintext": plaintext, "KeyId": self.arn(key_id)}
+
+    def generate_data_key(self, KeyId, KeySpec="AES_256", NumberOfBytes=None, EncryptionContext=None, **kwargs):
+        plaintext = secrets.token_bytes(NumberOfBytes or (16 if KeySpec == "AES_128" else 32))
+        response = self.encrypt(KeyId=KeyId, Plaintext=plaintext, EncryptionContext=EncryptionContext)
+        response["Plaintext"] = plaintext
+        return response
+
+
+class SecretsManagerExceptions:
+    ResourceNotFoundException = error_class("ResourceNotFoundException")
+
+
+class SecretsManager:
+    exceptions = SecretsManagerExceptions
+
+    def __init__(self, secrets_by_name=None):
+        self.secrets = dict(secrets_by_name or {})
+        self.lock = threading.Lock()
+
+    def put_secret_value(self, SecretId, SecretString, **kwargs):
+        with self.lock:
+            self.secrets[SecretId] = SecretString
+        return {"Name": SecretId}
+
+    def get_secret_value(self, SecretId, **kwargs):
+        with self.lock:
+            value = self.secrets.get(SecretId)
+        if value is None:
+            raise client_error(
+                SecretsManagerExceptions.ResourceNotFoundException,
+                "ResourceNotFoundException",
+                "Secrets Manager can't find the specified secret.",
+                "GetSecretValue",
+            )
+        return {"Name": SecretId, "SecretString": value}
+
+
+class Lambda:
+    # Invokes the locally mounted handlers; `invoke_function(name, event)` is
+    # supplied by the runtime that owns them
+    def __init__(self, invoke_function):
+        self.invoke_function = invoke_function
+
+    def invoke(self, FunctionName, Payload=b"{}", InvocationType="RequestResponse", **kwargs):
+        event = json.loads(Payload or b"{}")
+        name = FunctionName.rsplit(":", 1)[-1]
+        if InvocationType == "Event":
+            threading.Thread(target=self.invoke_function, args=(name, event), daemon=True).start()
+            return {"StatusCode": 202, "Payload": StreamingBody(b"")}
+        try:
+            result = self.invoke_function(name, event)
+        except Exception as e:
+            error = {"errorMessage": str(e), "errorType": type(e).__name__}
+            return {"StatusCode": 200, "FunctionError": "Unhandled", "Payload": StreamingBody(json.dumps(error).encode("utf-8"))}
+        return {"StatusCode": 200, "Payload": StreamingBody(json.dumps(result, default=str).encode("utf-8"))}
+
+
+class IAM:
+    def get_role(self, RoleName, **kwargs):
+        return {"Role": {"RoleName": RoleName, "Arn": f"arn:aws:iam::{ACCOUNT_ID}:role/{RoleName}"}}
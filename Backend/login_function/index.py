@@ -1,77 +1,106 @@
 import os
 import json
-import bcrypt
-import boto3
-from jwt import encode
-from datetime import datetime, timedelta
-from botocore.exceptions import ClientError
+import time
 import traceback
+from securestore import aws, metrics, passwords, sessions, throttle
 
-dynamodb = boto3.resource("dynamodb")
+dynamodb = aws.resource("dynamodb")
 
-# Get table name and JWT secret name from environment variables
+# Get table name from environment variables, the JWT secret is read by securestore.sessions
 TABLE_NAME = os.environ.get("USER_TABLE_NAME")
-JWT_SECRET_NAME = os.environ.get("JWT_SECRET_NAME")
 
+@metrics.instrument
 def handler(event, context):
+    # Direct invocation only: measure bcrypt on this function's memory size
+    if event.get("action") == "calibrate_password_cost":
+        return passwords.calibrate(float(event.get("target_ms", 250)))
+
+    # Direct invocation only: this container's throttle counters
+    if event.get("action") == "throttle_stats":
+        return throttle.login_throttle.stats()
+
     try:
         # Retrieve user data from the request body
         user_data = json.loads(event["body"])
         username = user_data["username"]
         password = user_data["password"]
+    except KeyError as e:
+        return error_response(400, f"Missing required field: {str(e)}", traceback.format_exc())
+    except Exception as e:
+        return error_response(401, str(e), traceback.format_exc())
 
+    throttle_keys = [("account", username.lower()), ("ip", get_source_ip(event))]
+    try:
+        # Shed over-limit attempts before any DynamoDB read or password hashing
+        with metrics.stage("throttle_check"):
+            throttle.login_throttle.check(throttle_keys)
+    except throttle.Throttled as e:
+        throttle.login_throttle.log_stats()
+        return {
+            "statusCode": 429,
+            "body": json.dumps({"error": str(e)}),
+            "headers": {"Retry-After": str(e.retry_after)},
+        }
+
+    try:
         # Retrieve user data from DynamoDB
         user_item = get_user_item(username)
 
-        # Verify the provided password
-        verify_password(password, user_item["password"])
+        # Verify the provided password, unknown users cost the same and get the same error
+        start = time.perf_counter()
+        with metrics.stage("verify_password"):
+            if user_item is None:
+                valid = passwords.verify_unknown_user(password)
+            else:
+                valid = passwords.verify_password(password, user_item["password"])
+        throttle.login_throttle.record_verify((time.perf_counter() - start) * 1000)
+
+        if not valid:
+            throttle.login_throttle.record_failure(throttle_keys)
+            raise Exception("Invalid username or password")
+        throttle.login_throttle.record_success(throttle_keys)
 
-        # Generate JWT token
-        token = generate_token(username)
+        # Upgrade hashes written with a stale cost or another scheme while the plaintext is at hand
+        if passwords.needs_rehash(user_item["password"]):
+            rehash_password(username, password, user_item["password"])
+
+        # Short-lived access token plus a refresh token, later renewals go
+        # through /refresh instead of another password check
+        session = sessions.start_session(username)
 
         return {
             "statusCode": 200,
-            "body": json.dumps({"message": "Login successful", "token": token}),
+            "body": json.dumps({"message": "Login successful", **session}),
         }
-    except KeyError as e:
-        return error_response(400, f"Missing required field: {str(e)}", traceback.format_exc())
     except Exception as e:
         return error_response(401, str(e), traceback.format_exc())
+    finally:
+        throttle.login_throttle.log_stats()
+
+
+def get_source_ip(event):
+    # HTTP API (payload v2) puts the caller address here
+    return event.get("requestContext", {}).get("http", {}).get("sourceIp", "unknown")
 
 
 def get_user_item(username):
     table = dynamodb.Table(TABLE_NAME)
     response = table.get_item(Key={"username": username})
-    if "Item" not in response:
-        raise Exception("User not found")
-    return response["Item"]
-
-
-def verify_password(password, stored_password):
-    if not bcrypt.checkpw(password.encode("utf-8"), stored_password.encode("utf-8")):
-        raise Exception("Invalid password")
-
-
-def generate_token(username):
-    secret = get_jwt_secret()
-    expiration_time = datetime.utcnow() + timedelta(hours=2)
-    payload = {"username": username, "exp": expiration_time}
-    token = encode(payload, secret, algorithm="HS256")
-    return token
-
-
-def get_jwt_secret():
-    region_name = "us-east-1"
+    return response.get("Item")
 
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
 
+def rehash_password(username, password, stored_password):
+    # Only replaces the hash that was just verified, a concurrent password change wins
     try:
-        response = client.get_secret_value(SecretId=JWT_SECRET_NAME)
-        secret = response["SecretString"]
-        return secret
-    except ClientError as e:
-        raise Exception("Failed to retrieve JWT secret")
+        dynamodb.Table(TABLE_NAME).update_item(
+            Key={"username": username},
+            UpdateExpression="SET password = :new",
+            ConditionExpression="password = :old",
+            ExpressionAttributeValues={":new": passwords.hash_password(password), ":old": stored_password},
+        )
+    except Exception:
+        # The login itself succeeded, the next one retries the upgrade
+        traceback.print_exc()
 
 
 def error_response(status_code, error_message, stack_trace=None):
@@ -0,0 +1,83 @@
+import os
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from securestore import aws, container, keys, layout, manifest, metrics, storage, uploads
+
+# Objects converted at once
+MIGRATION_CONCURRENCY = int(os.environ.get("MIGRATION_CONCURRENCY", "16"))
+
+
+def list_keys(bucket_name, prefix):
+    paginator = aws.client("s3").get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not layout.is_reserved(obj["Key"]):
+                yield obj["Key"]
+
+
+def migrate_object(bucket_name, key, dry_run):
+    # Rewrites one object in the binary container format, in place. Objects
+    # already in the container are left alone, so the job can be re-run.
+    s3_client = aws.client("s3")
+    response = s3_client.get_object(Bucket=bucket_name, Key=key)
+    data = response["Body"].read()
+    stored_format = storage.detect_format(data)
+    if stored_format == storage.FORMAT_CONTAINER:
+        return "skipped"
+    if dry_run:
+        return f"would convert {stored_format}"
+
+    content = b"".join(storage.read_stream(keys.get_storage_key(), [data], response.get("Metadata")))
+    payload, metadata = storage.prepare_payload(content, response.get("ContentType"))
+    put_response = uploads.upload_stream(
+        s3_client,
+        bucket_name,
+        key,
+        container.encrypt_stream(keys.get_storage_key(), payload),
+        Metadata=metadata,
+    )
+
+    if manifest.MANIFEST_TABLE_NAME:
+        username, _, file_name = key.partition("/")
+        manifest.record_file(
+            username,
+            file_name,
+            len(content),
+            put_response["Size"],
+            response.get("ContentType"),
+            (put_response.get("ETag") or "").strip('"') or None,
+        )
+    return f"converted {stored_format} ({len(data)} -> {put_response['Size']} bytes)"
+
+
+@metrics.instrument
+def handler(event, context):
+    # Converts every object under the prefix (a user folder, or the whole bucket)
+    bucket_name = os.environ.get("S3_BUCKET_NAME")
+    if not bucket_name:
+        raise Exception("S3_BUCKET_NAME environment variable not set.")
+
+    event = event or {}
+    prefix = f"{event['username']}/" if event.get("username") else ""
+    dry_run = bool(event.get("dry_run"))
+
+    def run(key):
+        try:
+            return key, migrate_object(bucket_name, key, dry_run)
+        except Exception as e:
+            traceback.print_exc()
+            return key, f"error: {str(e)}"
+
+    with ThreadPoolExecutor(max_workers=MIGRATION_CONCURRENCY) as executor:
+        results = dict(executor.map(run, list_keys(bucket_name, prefix)))
+
+    print(json.dumps({"migrated": results}))
+    return results
+
+
+if __name__ == "__main__":
+    # Local use: python index.py [username] with the same environment variables as the function
+    import sys
+
+    handler({"username": sys.argv[1] if len(sys.argv) > 1 else None}, None)
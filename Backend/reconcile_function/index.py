@@ -0,0 +1,37 @@
+import os
+import json
+import traceback
+from securestore import aws, layout, manifest, metrics
+
+
+def list_usernames(bucket_name):
+    # Every top-level prefix in the bucket is one user's folder
+    paginator = aws.client("s3").get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Delimiter="/"):
+        for prefix in page.get("CommonPrefixes", []):
+            if layout.is_reserved(prefix["Prefix"]):
+                # Chunk store or archives, not a user
+                continue
+            yield prefix["Prefix"].rstrip("/")
+
+
+@metrics.instrument
+def handler(event, context):
+    # Rebuilds the file manifest from S3, for one user or for the whole bucket
+    bucket_name = os.environ.get("S3_BUCKET_NAME")
+    if not bucket_name:
+        raise Exception("S3_BUCKET_NAME environment variable not set.")
+
+    username = (event or {}).get("username")
+    usernames = [username] if username else list_usernames(bucket_name)
+
+    results = {}
+    for name in usernames:
+        try:
+            results[name] = manifest.reconcile(name, bucket_name)
+        except Exception as e:
+            traceback.print_exc()
+            results[name] = {"error": str(e)}
+
+    print(json.dumps({"reconciled": results}))
+    return results
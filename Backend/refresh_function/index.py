@@ -0,0 +1,32 @@
+import json
+import traceback
+from securestore import metrics, sessions
+
+
+@metrics.instrument
+def handler(event, context):
+    try:
+        # Exchange a refresh token for a new access token and its rotated
+        # successor: one keyed DynamoDB write, no password hashing
+        request_data = json.loads(event["body"])
+        refresh_token = request_data["refreshToken"]
+
+        session = sessions.refresh_session(refresh_token)
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps({"message": "Token refreshed", **session}),
+        }
+    except KeyError as e:
+        return error_response(400, f"Missing required field: {str(e)}")
+    except sessions.SessionError as e:
+        return error_response(401, str(e))
+    except Exception as e:
+        return error_response(500, str(e), traceback.format_exc())
+
+
+def error_response(status_code, error_message, stack_trace=None):
+    response_body = {"error": error_message}
+    if stack_trace:
+        response_body["stack_trace"] = stack_trace
+    return {"statusCode": status_code, "body": json.dumps(response_body)}
@@ -1,15 +1,14 @@
 import os
 import json
 import traceback
-import bcrypt
-import boto3
+from securestore import aws, keys, layout, metrics, passwords, queue
 
-dynamodb = boto3.resource("dynamodb")
+dynamodb = aws.resource("dynamodb")
 
-# Get table name and second Lambda function name from environment variables
+# Get table name from environment variables
 TABLE_NAME = os.environ.get("USER_TABLE_NAME")
-LAMBDA_FUNCTION_NAME = os.environ.get("LAMBDA_FUNCTION_NAME")
 
+@metrics.instrument
 def handler(event, context):
     try:
         # Retrieve user data from the request body
@@ -21,41 +20,45 @@ def handler(event, context):
         # Perform data validation
         if not username or not password or not name:
             return {"statusCode": 400, "body": json.dumps({"error": "Missing required fields"})}
-
-        # Check if the user already exists in the DynamoDB table
-        table = dynamodb.Table(TABLE_NAME)
-        response = table.get_item(Key={"username": username})
-        if "Item" in response:
-            return {"statusCode": 409, "body": json.dumps({"error": "User already exists"})}
+        if not layout.is_valid_username(username):
+            # The username becomes the user's folder in the bucket
+            return {"statusCode": 400, "body": json.dumps({"error": "Invalid username"})}
 
         # Hash the password
         hashed_password = hash_password(password)
 
-        # Call the second Lambda to generate the Data Encryption Key (DEK) and CMK
-        response = boto3.client("lambda").invoke(
-            FunctionName=LAMBDA_FUNCTION_NAME,
-            InvocationType="RequestResponse",
-            Payload=json.dumps({"username": username}),
-        )
-        response_payload = json.loads(response["Payload"].read().decode("utf-8"))
-
-        # Check if the "encrypted_data_encryption_key" key exists in the response_payload dictionary
-        if "encrypted_data_encryption_key" not in response_payload:
-            return {
-                "statusCode": 500,
-                "body": json.dumps({"error": "CMK alias not found in the response. {}".format(str(response_payload))}),
-            }
-
-        encrypted_data_encryption_key = response_payload["encrypted_data_encryption_key"]
-
-        # Store user data, encrypted DEK, and CMK ARN in DynamoDB
+        # The conditional put is the only existence check, so two concurrent
+        # signups for the same username cannot both succeed
+        table = dynamodb.Table(TABLE_NAME)
         item = {
             "username": username,
             "name": name,
-            "password": hashed_password.decode("utf-8"),
-            "Encrypted_DEK": encrypted_data_encryption_key,
+            "password": hashed_password,
+            "KeyStatus": keys.KEY_STATUS_PENDING,
         }
-        table.put_item(Item=item)
+        try:
+            table.put_item(Item=item, ConditionExpression="attribute_not_exists(username)")
+        except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return {"statusCode": 409, "body": json.dumps({"error": "User already exists"})}
+
+        # Key material is provisioned by GenKeyFunction from the queue, which
+        # flips KeyStatus to ready once the user's DEK is stored
+        try:
+            queue.send({"username": username})
+        except Exception:
+            # Nothing would ever provision this user, undo the signup so the
+            # client can simply register again
+            traceback.print_exc()
+            try:
+                table.delete_item(
+                    Key={"username": username},
+                    ConditionExpression="KeyStatus = :pending AND password = :password",
+                    ExpressionAttributeValues={":pending": keys.KEY_STATUS_PENDING, ":password": hashed_password},
+                )
+            except dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+                # Provisioned after all
+                pass
+            return {"statusCode": 503, "body": json.dumps({"error": "Registration is temporarily unavailable, please retry."})}
 
         return {
             "statusCode": 200,
@@ -72,5 +75,6 @@ def handler(event, context):
 
 
 def hash_password(password):
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    # Current scheme and cost from the shared password hasher (BCRYPT_COST)
+    hashed_password = passwords.hash_password(password)
     return hashed_password
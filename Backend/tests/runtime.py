@@ -0,0 +1,71 @@
+# Shared setup for the tests: the SAM template run in process by local_runtime,
+# against its in-memory stand-ins, and registered, logged-in users of it. The
+# securestore modules and their caches are shared by the whole process, so all
+# tests use one runtime; each test module works as its own user.
+# Run from the repository root:
+#   python -m pytest Backend/tests
+import os
+import sys
+import io
+import json
+import atexit
+import contextlib
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(BACKEND_DIR, "common_layer", "python"))
+sys.path.insert(0, BACKEND_DIR)
+
+from local_runtime.app import LocalRuntime
+
+BOUNDARY = "----SecureStoreTestBoundary"
+PASSWORD = "test-password-1"
+# A low bcrypt cost keeps registration and login fast
+ENVIRONMENT = {"BCRYPT_COST": "4"}
+
+_runtime = None
+
+
+def get_runtime():
+    global _runtime
+    if _runtime is None:
+        _runtime = LocalRuntime(environment=ENVIRONMENT)
+        atexit.register(_runtime.stop)
+    return _runtime
+
+
+class Session:
+    def __init__(self, username):
+        self.runtime = get_runtime()
+        self.username = username
+        self.token = None
+        self.call("POST", "/register", {"name": "Test", "username": username, "password": PASSWORD})
+        self.runtime.drain_queue()
+        self.token = json.loads(self.call("POST", "/login", {"username": username, "password": PASSWORD}))["token"]
+
+    def request(self, method, path, body=None, raw=None, content_type="application/json"):
+        headers = {"content-type": content_type}
+        if self.token:
+            headers["authorization"] = "Bearer " + self.token
+        payload = raw if raw is not None else json.dumps(body).encode()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.runtime.handle_http(method, path, "", headers, payload)
+
+    def call(self, method, path, body=None, **kwargs):
+        status, _, response = self.request(method, path, body, **kwargs)
+        if status >= 400:
+            raise AssertionError(f"{method} {path} returned {status}: {response[:200]!r}")
+        return response
+
+    def upload(self, file_name, content):
+        fields = (
+            ("file", f'; filename="{file_name}"\r\nContent-Type: text/plain', content),
+            ("filename", "", file_name.encode()),
+            ("username", "", self.username.encode()),
+        )
+        body = b"".join(
+            b"--" + BOUNDARY.encode() + b"\r\n"
+            + f'Content-Disposition: form-data; name="{name}"{extra}\r\n\r\n'.encode()
+            + value + b"\r\n"
+            for name, extra, value in fields
+        ) + b"--" + BOUNDARY.encode() + b"--\r\n"
+        return self.call("POST", "/fileup", raw=body, content_type=f"multipart/form-data; boundary={BOUNDARY}")
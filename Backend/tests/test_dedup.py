@@ -0,0 +1,103 @@
+import os
+import io
+import unittest
+import contextlib
+
+from runtime import Session
+
+
+class DedupTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.session = Session("dedup@example.com")
+        # Imported once the runtime has set up the environment
+        from securestore import dedup
+
+        cls.bucket_name = os.environ["S3_BUCKET_NAME"]
+        cls.previous = dedup.DEDUP_ENABLED
+        dedup.DEDUP_ENABLED = True
+
+    @classmethod
+    def tearDownClass(cls):
+        from securestore import dedup
+
+        dedup.DEDUP_ENABLED = cls.previous
+
+    def rows(self):
+        from securestore import dedup
+
+        response = dedup.get_ref_table().query(
+            KeyConditionExpression="username = :username",
+            ExpressionAttributeValues={":username": self.session.username},
+        )
+        return {item["chunk_id"]: item for item in response["Items"]}
+
+    def chunk_objects(self):
+        response = self.session.runtime.s3.list_objects_v2(
+            Bucket=self.bucket_name, Prefix=f"_chunks/{self.session.username}/"
+        )
+        return [entry["Key"] for entry in response.get("Contents", [])]
+
+    def download(self, file_name):
+        return self.session.call("POST", "/filedown", {"username": self.session.username, "file_name": file_name})
+
+    def delete(self, file_name):
+        return self.session.call("POST", "/filedel", {"username": self.session.username, "filename": file_name})
+
+    def load(self, file_name):
+        from securestore import aws, dedup, keys
+
+        key = f"{self.session.username}/{file_name}"
+        return key, dedup.load_manifest(keys.get_storage_key(), aws.client("s3"), self.bucket_name, key)
+
+    def test_refcounts(self):
+        content = os.urandom(300000).hex().encode()
+        self.session.upload("one.txt", content)
+        self.session.upload("two.txt", content)
+        self.session.upload("three.txt", content + b"tail")
+        chunk_rows = {name: row for name, row in self.rows().items() if not name.startswith("file#")}
+        self.assertGreater(len(chunk_rows), 1)
+        # Equal content is stored once; the differing tail adds at most one chunk
+        self.assertEqual(len(self.chunk_objects()), len(chunk_rows))
+        self.assertEqual(max(int(row["refs"]) for row in chunk_rows.values()), 3)
+
+        self.delete("one.txt")
+        self.delete("three.txt")
+        self.assertEqual(self.download("two.txt"), content)
+        self.delete("two.txt")
+        self.assertEqual(self.rows(), {})
+        self.assertEqual(self.chunk_objects(), [])
+
+    def test_double_release(self):
+        from securestore import dedup
+
+        content = os.urandom(200000).hex().encode()
+        self.session.upload("a.txt", content)
+        self.session.upload("b.txt", content)
+        key, chunk_manifest = self.load("a.txt")
+
+        # Two overlapping deletes of a.txt both loaded its manifest before
+        # either deleted the object; only one gives the references back
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertGreaterEqual(dedup.release_chunks(self.bucket_name, self.session.username, chunk_manifest, key), 0)
+            self.assertEqual(dedup.release_chunks(self.bucket_name, self.session.username, chunk_manifest, key), 0)
+        self.delete("a.txt")
+        self.assertEqual(self.download("b.txt"), content)
+
+        self.delete("b.txt")
+        self.assertEqual(self.rows(), {})
+        self.assertEqual(self.chunk_objects(), [])
+
+    def test_overwrite_releases_previous_version(self):
+        first = os.urandom(100000).hex().encode()
+        second = os.urandom(100000).hex().encode()
+        self.session.upload("c.txt", first)
+        self.session.upload("c.txt", second)
+        self.assertEqual(self.download("c.txt"), second)
+        self.delete("c.txt")
+        self.assertEqual(self.rows(), {})
+        self.assertEqual(self.chunk_objects(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
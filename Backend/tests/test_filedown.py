@@ -0,0 +1,45 @@
+import os
+import base64
+import unittest
+
+from runtime import Session
+
+
+class RangedDownloadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.session = Session("filedown@example.com")
+
+    def download(self, file_name, byte_range=None):
+        body = {"username": self.session.username, "file_name": file_name}
+        if byte_range:
+            body["range"] = byte_range
+        return self.session.request("POST", "/filedown", body)
+
+    def assert_ranges_match(self, file_name, ranges):
+        status, _, full = self.download(file_name)
+        self.assertEqual(status, 200)
+        for first, last in ranges:
+            status, headers, ranged = self.download(file_name, f"bytes={first}-{last}")
+            self.assertEqual(status, 206)
+            headers = {name.lower(): value for name, value in headers.items()}
+            self.assertEqual(headers["content-range"], f"bytes {first}-{last}/{len(full)}")
+            self.assertEqual(ranged, full[first : last + 1])
+
+    def test_base64_upload(self):
+        # Stored base64-decoded, served as the text the client uploaded
+        content = base64.b64encode(os.urandom(200008))
+        self.session.upload("encoded.txt", content)
+        last = len(content) - 1
+        self.assert_ranges_match(
+            "encoded.txt", [(0, 99), (1, 2), (5, 5), (3, 70001), (65535, 131074), (last - 10, last), (0, last)]
+        )
+
+    def test_plain_upload(self):
+        content = b"not base64 text, stored as it is\n" * 5000
+        self.session.upload("plain.txt", content)
+        self.assert_ranges_match("plain.txt", [(0, 99), (70000, 70100), (len(content) - 1, len(content) - 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import io
+import unittest
+import contextlib
+
+from runtime import Session
+
+
+class ReconcileTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.session = Session("reconcile@example.com")
+        cls.bucket_name = os.environ["S3_BUCKET_NAME"]
+
+    def test_whole_bucket(self):
+        from securestore import manifest
+
+        runtime = self.session.runtime
+        self.session.upload("a.txt", b"first")
+        self.session.upload("docs/b.txt", b"second")
+        # Service objects under the reserved prefixes are not users
+        runtime.s3.put_object(Bucket=self.bucket_name, Key="_chunks/someone/0123", Body=b"chunk")
+        runtime.s3.put_object(Bucket=self.bucket_name, Key="_archives/someone/0123.zip", Body=b"zip")
+
+        table = manifest.get_table()
+        table.delete_item(Key={"username": self.session.username, "file_name": "a.txt"})
+        table.put_item(Item={"username": self.session.username, "file_name": "gone.txt", "etag": "x"})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = runtime.invoke_by_name("ReconcileFunction", {})
+        self.assertEqual(results[self.session.username], {"added": 1, "updated": 0, "removed": 1})
+        self.assertFalse({"_chunks", "_archives"} & set(results))
+        listed = manifest.list_files(self.session.username)
+        self.assertEqual([entry["name"] for entry in listed["files"]], ["a.txt", "docs/b.txt"])
+
+    def test_delimiter_pages(self):
+        runtime = self.session.runtime
+        runtime.s3.create_bucket(Bucket="delimiter-test")
+        for key in ("p/1", "p/2", "q/1", "r", "s/t/u"):
+            runtime.s3.put_object(Bucket="delimiter-test", Key=f"delimited/{key}", Body=b"")
+        paginator = runtime.s3.get_paginator("list_objects_v2")
+        prefixes, keys = [], []
+        for page in paginator.paginate(Bucket="delimiter-test", Prefix="delimited/", Delimiter="/", MaxKeys=1):
+            prefixes += [entry["Prefix"] for entry in page.get("CommonPrefixes", [])]
+            keys += [entry["Key"] for entry in page.get("Contents", [])]
+        self.assertEqual(prefixes, ["delimited/p/", "delimited/q/", "delimited/s/"])
+        self.assertEqual(keys, ["delimited/r"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+
+from runtime import Session
+
+
+class ReservedUsernameTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.session = Session("usernames@example.com")
+
+    def test_register_rejects_reserved_and_nested_names(self):
+        for username in ("_chunks", "_archives", "_chunks/victim", "a/b", ""):
+            body = {"name": "Test", "username": username, "password": "test-password-1"}
+            status, _, _ = self.session.request("POST", "/register", body)
+            self.assertEqual(status, 400, username)
+
+    def test_file_functions_refuse_reserved_folders(self):
+        for username in ("_chunks", "_archives", "_chunks/victim"):
+            status, _, _ = self.session.request("POST", "/fileget", {"username": username})
+            self.assertEqual(status, 400, username)
+            status, _, _ = self.session.request("POST", "/filedown", {"username": username, "file_name": "x"})
+            self.assertEqual(status, 400, username)
+
+
+if __name__ == "__main__":
+    unittest.main()
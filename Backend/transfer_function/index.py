@@ -0,0 +1,204 @@
+import os
+import json
+import traceback
+from securestore import aws, dedup, layout, manifest, metrics, storage, uploads
+from securestore.responses import json_response
+
+# Direct transfers: the browser already encrypts files client-side, so the
+# ciphertext can move between the browser and S3 with presigned URLs instead
+# of through API Gateway and Lambda as base64 bodies. This function only
+# authorizes, hands out URLs scoped to the caller's folder and records the
+# file once the upload is complete. Objects are stored as the client sent
+# them, the client-text format FileDownFunction already serves.
+URL_TTL = int(os.environ.get("TRANSFER_URL_TTL", "900"))
+MAX_DIRECT_UPLOAD_BYTES = int(os.environ.get("MAX_DIRECT_UPLOAD_BYTES", str(5 * 1024 * 1024 * 1024)))
+# Uploads above this size go through S3 multipart, one presigned URL per part
+MULTIPART_THRESHOLD = int(os.environ.get("TRANSFER_MULTIPART_THRESHOLD", str(64 * 1024 * 1024)))
+MAX_PARTS = 10000
+# Part URLs handed out per request; the client asks for the rest with "parts"
+PART_URLS_PER_REQUEST = int(os.environ.get("TRANSFER_PART_URLS_PER_REQUEST", "100"))
+
+
+def part_size_for(size):
+    # The configured part size, grown when the file would need more than MAX_PARTS parts
+    return max(uploads.PART_SIZE, -(-size // MAX_PARTS))
+
+
+def presign(s3_client, client_method, params):
+    return s3_client.generate_presigned_url(client_method, Params=params, ExpiresIn=URL_TTL)
+
+
+def part_urls(s3_client, bucket_name, key, upload_id, part_numbers):
+    return [
+        {
+            "partNumber": number,
+            "url": presign(
+                s3_client,
+                "upload_part",
+                {"Bucket": bucket_name, "Key": key, "UploadId": upload_id, "PartNumber": number},
+            ),
+        }
+        for number in part_numbers
+    ]
+
+
+def start_upload(s3_client, bucket_name, username, key, body):
+    size = body["size"]
+    if not isinstance(size, int) or size < 0:
+        return json_response(400, {"message": "size must be a byte count."})
+    if size > MAX_DIRECT_UPLOAD_BYTES:
+        return json_response(413, {"message": f"File exceeds the maximum size of {MAX_DIRECT_UPLOAD_BYTES} bytes."})
+
+    if dedup.CHUNK_REF_TABLE_NAME:
+        # Overwriting a deduplicated file would leak its chunk references,
+        # which only the server-side path knows how to release
+        try:
+            head = s3_client.head_object(Bucket=bucket_name, Key=key)
+            if head.get("Metadata", {}).get(dedup.LAYOUT_KEY) == dedup.LAYOUT_DEDUP:
+                return json_response(409, {"message": "Delete the existing file before replacing it directly."})
+        except s3_client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                raise
+
+    if size <= MULTIPART_THRESHOLD:
+        # A presigned POST rather than PUT: its policy caps the body at the
+        # declared size, S3 rejects anything larger before storing it
+        post = s3_client.generate_presigned_post(
+            bucket_name, key, Conditions=[["content-length-range", 0, size]], ExpiresIn=URL_TTL
+        )
+        return json_response(
+            200, {"method": "POST", "url": post["url"], "fields": post["fields"], "expiresIn": URL_TTL}
+        )
+
+    part_size = part_size_for(size)
+    part_count = -(-size // part_size)
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key)["UploadId"]
+    return json_response(
+        200,
+        {
+            "method": "PUT",
+            "uploadId": upload_id,
+            "partSize": part_size,
+            "partCount": part_count,
+            "parts": part_urls(s3_client, bucket_name, key, upload_id, range(1, min(part_count, PART_URLS_PER_REQUEST) + 1)),
+            "expiresIn": URL_TTL,
+        },
+    )
+
+
+def more_part_urls(s3_client, bucket_name, key, body):
+    part_numbers = body["partNumbers"]
+    if (
+        not isinstance(part_numbers, list)
+        or len(part_numbers) > PART_URLS_PER_REQUEST
+        or not all(isinstance(number, int) and 1 <= number <= MAX_PARTS for number in part_numbers)
+    ):
+        return json_response(400, {"message": f"partNumbers must list up to {PART_URLS_PER_REQUEST} part numbers."})
+    return json_response(
+        200,
+        {"parts": part_urls(s3_client, bucket_name, key, body["uploadId"], part_numbers), "expiresIn": URL_TTL},
+    )
+
+
+def complete_upload(s3_client, bucket_name, username, file_name, key, body):
+    # Completion callback: finish the multipart upload if there is one, then
+    # record what actually landed in S3 in the file manifest
+    if body.get("uploadId"):
+        parts = sorted(
+            ({"PartNumber": int(part["partNumber"]), "ETag": part["etag"]} for part in body["parts"]),
+            key=lambda part: part["PartNumber"],
+        )
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=body["uploadId"], MultipartUpload={"Parts": parts}
+        )
+
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=key)
+    except s3_client.exceptions.ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return json_response(404, {"message": "No uploaded object found for this file."})
+        raise
+    size = head["ContentLength"]
+    if size > MAX_DIRECT_UPLOAD_BYTES:
+        s3_client.delete_object(Bucket=bucket_name, Key=key)
+        return json_response(413, {"message": f"File exceeds the maximum size of {MAX_DIRECT_UPLOAD_BYTES} bytes."})
+
+    manifest.record_file_safely(
+        username,
+        file_name,
+        size,
+        size,
+        body.get("contentType") or head.get("ContentType") or "application/octet-stream",
+        (head.get("ETag") or "").strip('"') or None,
+    )
+    return json_response(200, {"message": "File uploaded successfully.", "file_name": file_name, "size": size})
+
+
+def abort_upload(s3_client, bucket_name, key, body):
+    s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=body["uploadId"])
+    return json_response(200, {"message": "Upload aborted."})
+
+
+def start_download(s3_client, bucket_name, key):
+    # Only objects stored as the client's own ciphertext can be handed out
+    # as they are; server-encrypted ones still go through FileDownFunction
+    try:
+        head = s3_client.get_object(Bucket=bucket_name, Key=key, Range=f"bytes=0-{len(storage.CLIENT_TEXT_PREFIX) - 1}")
+    except s3_client.exceptions.NoSuchKey:
+        return json_response(404, {"message": "File not found."})
+    except s3_client.exceptions.ClientError as e:
+        # An empty object has no byte range to read
+        if e.response.get("Error", {}).get("Code") != "InvalidRange":
+            raise
+        head = None
+    if head is not None:
+        first_bytes = head["Body"].read()
+        if storage.detect_format(first_bytes) != storage.FORMAT_CLIENT_TEXT or storage.is_transformed(head.get("Metadata")):
+            return json_response(409, {"message": "This file is stored server-side encrypted, download it through /filedown."})
+    return json_response(
+        200,
+        {"method": "GET", "url": presign(s3_client, "get_object", {"Bucket": bucket_name, "Key": key}), "expiresIn": URL_TTL},
+    )
+
+
+@metrics.instrument
+def handler(event, context):
+    try:
+        body = json.loads(event["body"])
+        action = body["action"]
+        file_name = body["file_name"]
+
+        # URLs are only ever issued for the authorized user's own folder
+        authorizer_context = event.get("requestContext", {}).get("authorizer", {}).get("lambda", {})
+        username = authorizer_context.get("userId") or body["username"]
+        if body.get("username", username) != username:
+            return json_response(403, {"message": "Transfers are limited to your own files."})
+        if not layout.is_valid_username(username):
+            return json_response(400, {"message": "Invalid username."})
+        if not isinstance(file_name, str) or not file_name or file_name.startswith("/"):
+            return json_response(400, {"message": "Invalid file_name."})
+
+        bucket_name = os.environ.get("S3_BUCKET_NAME")
+        if not bucket_name:
+            return json_response(500, {"message": "S3_BUCKET_NAME environment variable not set."})
+        s3_client = aws.client("s3")
+        key = f"{username}/{file_name}"
+
+        if action == "upload":
+            if authorizer_context.get("keyStatus") == "pending":
+                return json_response(409, {"message": "Encryption keys are still being provisioned, please retry shortly."})
+            return start_upload(s3_client, bucket_name, username, key, body)
+        if action == "parts":
+            return more_part_urls(s3_client, bucket_name, key, body)
+        if action == "complete":
+            return complete_upload(s3_client, bucket_name, username, file_name, key, body)
+        if action == "abort":
+            return abort_upload(s3_client, bucket_name, key, body)
+        if action == "download":
+            return start_download(s3_client, bucket_name, key)
+        return json_response(400, {"message": f"Unknown action: {action}"})
+    except KeyError as e:
+        return json_response(400, {"message": f"Missing required field: {str(e)}"})
+    except Exception as e:
+        traceback.print_exc()
+        return json_response(500, {"message": f"Error: {str(e)}"})
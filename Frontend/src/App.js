@@ -13,6 +13,7 @@ import { Home } from "./page/home";
 import { Forbidden } from "./page/forbidden";
 import axios from "axios";
 import { apiBaseUrl } from './config/commonConfig';
+import { installRefreshInterceptor } from "./utils/authUtils";
 
 if (!apiBaseUrl) {
 	console.error(
@@ -23,14 +24,17 @@ console.log(apiBaseUrl)
 axios.defaults.baseURL = apiBaseUrl;
 
 
-function App() {
+// Read the token per request, /refresh replaces it in session storage
+axios.interceptors.request.use(function (config) {
 	const jwtToken = sessionStorage.getItem("jwtToken");
-	if (jwtToken !== null) {
-		axios.interceptors.request.use(function (config) {
-			config.headers.Authorization = "Bearer " + jwtToken;
-			return config;
-		});
+	if (jwtToken !== null && !config.skipAuthRefresh) {
+		config.headers.Authorization = "Bearer " + jwtToken;
 	}
+	return config;
+});
+installRefreshInterceptor();
+
+function App() {
 
 	return (
 		<div className='App'>
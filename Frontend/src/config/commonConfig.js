@@ -1 +1,4 @@
 export const apiBaseUrl = process.env.REACT_APP_API_BASE_URL
+
+// Move encrypted file data straight to and from S3 with presigned URLs
+export const directTransfer = process.env.REACT_APP_DIRECT_TRANSFER === "true";
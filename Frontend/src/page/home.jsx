@@ -93,6 +93,7 @@ export const Home = () => {
 
 	const handleLogout = () => {
 		sessionStorage.removeItem("jwtToken");
+		sessionStorage.removeItem("refreshToken");
 		setUserName("");
 		setFileList([]);
 		setSuccessMessage("Logged out successfully.");
@@ -77,6 +77,11 @@ export const loginUser = async (email, password) => {
 			// Store the JWT token in the session storage
 			sessionStorage.setItem("jwtToken", token);
 
+			// The access token is short-lived, the refresh token renews it without a new login
+			if (response.data.refreshToken) {
+				sessionStorage.setItem("refreshToken", response.data.refreshToken);
+			}
+
 			// Set the JWT token in Axios headers for future requests
 			axios.defaults.headers.common["Authorization"] = token;
 
@@ -90,3 +95,54 @@ export const loginUser = async (email, password) => {
 		}
 	}
 };
+
+let refreshInFlight = null;
+
+export const refreshSession = async () => {
+	const refreshToken = sessionStorage.getItem("refreshToken");
+	if (!refreshToken) {
+		throw new Error("No refresh token available.");
+	}
+
+	// Concurrent 401s share one refresh, a rotated refresh token can only be used once
+	if (!refreshInFlight) {
+		refreshInFlight = axios
+			.post("/refresh", { refreshToken: refreshToken }, { skipAuthRefresh: true })
+			.then((response) => {
+				sessionStorage.setItem("jwtToken", response.data.token);
+				sessionStorage.setItem("refreshToken", response.data.refreshToken);
+				axios.defaults.headers.common["Authorization"] = response.data.token;
+				return response.data.token;
+			})
+			.catch((error) => {
+				sessionStorage.removeItem("jwtToken");
+				sessionStorage.removeItem("refreshToken");
+				throw error;
+			})
+			.finally(() => {
+				refreshInFlight = null;
+			});
+	}
+	return refreshInFlight;
+};
+
+export const installRefreshInterceptor = () => {
+	// Retry a request once with a fresh access token when the authorizer rejects it
+	axios.interceptors.response.use(undefined, async (error) => {
+		const config = error.config;
+		const status = error.response?.status;
+		if (
+			config &&
+			!config.skipAuthRefresh &&
+			!config.authRetried &&
+			(status === 401 || status === 403) &&
+			sessionStorage.getItem("refreshToken")
+		) {
+			config.authRetried = true;
+			const token = await refreshSession();
+			config.headers.Authorization = "Bearer " + token;
+			return axios(config);
+		}
+		return Promise.reject(error);
+	});
+};
@@ -2,11 +2,16 @@ import { AES, enc, SHA256 } from "crypto-js";
 import axios from "axios";
 
 // Function to fetch the data encryption key from the server
-async function fetchDataEncryptionKey(username) {
+async function fetchDataEncryptionKey(username, retries = 5) {
   try {
     const response = await axios.get(`/getkey?username=${username}`);
     return response.data.DataEncryptionKey;
   } catch (error) {
+    // Keys of a newly registered user are provisioned asynchronously, retry while they are pending
+    if (error?.response?.status === 409 && retries > 0) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      return fetchDataEncryptionKey(username, retries - 1);
+    }
     console.error("Error fetching encryption key:", error);
     throw new Error("Failed to fetch encryption key.");
   }
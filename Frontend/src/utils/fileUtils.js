@@ -1,5 +1,107 @@
 import axios from "axios";
 import { encryptHandler, decryptHandler } from "./cryptoUtils";
+import { directTransfer } from "../config/commonConfig";
+
+// Parts of a multipart direct upload sent at once
+const PARTS_IN_FLIGHT = 4;
+
+// Direct transfer: the encrypted text goes to and from S3 through presigned
+// URLs, only authorization and the completion callback go through the API.
+// S3 is called with fetch so the API's Authorization header is never sent there.
+const putToS3 = async (url, body) => {
+	const response = await fetch(url, { method: "PUT", body });
+	if (!response.ok) {
+		throw new Error(`S3 upload failed with status ${response.status}`);
+	}
+	return response.headers.get("ETag");
+};
+
+const postToS3 = async (url, fields, body) => {
+	// Form upload against a presigned POST policy, the file goes last
+	const form = new FormData();
+	Object.entries(fields).forEach(([name, value]) => form.append(name, value));
+	form.append("file", body);
+	const response = await fetch(url, { method: "POST", body: form });
+	if (!response.ok) {
+		throw new Error(`S3 upload failed with status ${response.status}`);
+	}
+};
+
+const uploadDirect = async (encryptedFileData, fileName, userName) => {
+	const body = new Blob([encryptedFileData]);
+	const request = { username: userName, file_name: fileName };
+	const { data: upload } = await axios.post("/transfer", {
+		...request,
+		action: "upload",
+		size: body.size,
+	});
+
+	if (!upload.uploadId) {
+		await postToS3(upload.url, upload.fields, body);
+		return axios.post("/transfer", { ...request, action: "complete" });
+	}
+
+	try {
+		const parts = [];
+		let urls = upload.parts;
+		let next = 0;
+		while (parts.length < upload.partCount) {
+			if (next === urls.length) {
+				// Ask for the URLs of the following parts
+				const partNumbers = [];
+				for (let number = parts.length + 1; number <= upload.partCount && partNumbers.length < upload.parts.length; number++) {
+					partNumbers.push(number);
+				}
+				const { data } = await axios.post("/transfer", {
+					...request,
+					action: "parts",
+					uploadId: upload.uploadId,
+					partNumbers,
+				});
+				urls = data.parts;
+				next = 0;
+			}
+			const group = urls.slice(next, next + PARTS_IN_FLIGHT);
+			next += group.length;
+			const etags = await Promise.all(
+				group.map((part) =>
+					putToS3(
+						part.url,
+						body.slice((part.partNumber - 1) * upload.partSize, part.partNumber * upload.partSize)
+					)
+				)
+			);
+			group.forEach((part, index) => parts.push({ partNumber: part.partNumber, etag: etags[index] }));
+		}
+		return axios.post("/transfer", {
+			...request,
+			action: "complete",
+			uploadId: upload.uploadId,
+			parts,
+		});
+	} catch (error) {
+		await axios.post("/transfer", { ...request, action: "abort", uploadId: upload.uploadId }).catch(() => {});
+		throw error;
+	}
+};
+
+const downloadDirect = async (userName, fileName) => {
+	const request = { username: userName, file_name: fileName };
+	try {
+		const { data } = await axios.post("/transfer", { ...request, action: "download" });
+		const response = await fetch(data.url);
+		if (!response.ok) {
+			throw new Error(`S3 download failed with status ${response.status}`);
+		}
+		return { data: await response.text() };
+	} catch (error) {
+		// Files stored server-side encrypted are only served by /filedown
+		if (error.response && error.response.status === 409) {
+			return axios.post("/filedown", request, { responseType: "text" });
+		}
+		throw error;
+	}
+};
 
 export const handleFileUpload = async (
 	file,
@@ -34,11 +136,13 @@ export const handleFileUpload = async (
 			formData.append("filename", fileName);
 
 			// Upload the encrypted file data
-			const response = await axios.post("/fileup", formData, {
-				headers: {
-					"Content-Type": "multipart/form-data",
-				},
-			});
+			const response = directTransfer
+				? await uploadDirect(encryptedFileData, fileName, userName)
+				: await axios.post("/fileup", formData, {
+						headers: {
+							"Content-Type": "multipart/form-data",
+						},
+				  });
 
 			if (response.status === 200) {
 				setSuccessMessage(
@@ -75,9 +179,11 @@ export const handleFileDownload = async (
 			file_name: fileName,
 		};
 
-		const response = await axios.post("/filedown", requestData, {
-			responseType: "text",
-		});
+		const response = directTransfer
+			? await downloadDirect(userName, fileName)
+			: await axios.post("/filedown", requestData, {
+					responseType: "text",
+			  });
 
 		// Decrypt the downloaded file data
 		const decryptedFileData = await decryptHandler(response.data, userName);
@@ -108,16 +214,23 @@ export const handleFileDownload = async (
 
 export const fetchFiles = async (userName, setFileList, setErrorMessage) => {
 	try {
-		const requestData = {
-			username: userName,
-		};
-		const response = await axios.post("/fileget", requestData);
+		// Page through the metadata-only listing, no file contents are transferred
+		const fileList = [];
+		let cursor = null;
+		do {
+			const requestData = {
+				username: userName,
+				mode: "list",
+				cursor: cursor,
+			};
+			const response = await axios.post("/fileget", requestData);
 
-		if (response.status === 200) {
-			const fileList = Object.keys(response.data); // Extract the file names from the response object
-			setFileList(fileList);
-			setErrorMessage("");
-		}
+			response.data.files.forEach((file) => fileList.push(file.key)); // Extract the file names from the page
+			cursor = response.data.next_cursor;
+		} while (cursor);
+
+		setFileList(fileList);
+		setErrorMessage("");
 	} catch (error) {
 		console.error("Error fetching files:", error);
 		setFileList([]);